@@ -0,0 +1,301 @@
+import os
+import sys
+import time
+import click
+import shutil
+import resource
+import tempfile
+import numpy as np
+
+from fake_datadog import FakeDatadogServer, FluentSink
+
+try:
+    from core.changefinder.changefinder_1d import ChangeFinder
+    from core.changefinder.changefinder_bank import ChangeFinderBank
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    from core.changefinder.changefinder_1d import ChangeFinder
+    from core.changefinder.changefinder_bank import ChangeFinderBank
+
+from core.changefinder.ar_1d import AR_1D, ModelSelection
+from core.changefinder.backend import get_backend
+from core.changefinder.levinson import LevinsonSolver
+from core.changefinder.window import strided_windows
+from core.base_detector import Detector
+from core.scheduler import Scheduler
+from core.sst.sst import SingularSpectrumTransformation
+from core.sst.utils import lanczos
+
+
+def elapsed(f, *args):
+    start = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - start
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option('--n', '-n', multiple=True, type=int, default=[1, 10, 100, 1000], help='Number of models.')
+@click.option('--points', default=200, help='Number of timestamps.')
+@click.option('--k', default=6, help='Order of the AR model.')
+def bank(n, points, k):
+    """Per-point cost of N scalar ChangeFinders vs. a ChangeFinderBank."""
+    print('%8s %20s %20s' % ('N', 'scalar [us/point]', 'bank [us/point]'))
+
+    for n_models in n:
+        X = np.cumsum(np.random.normal(size=(points, n_models)), axis=0)
+
+        cfs = [ChangeFinder(r=0.02, k=k, T1=10, T2=5) for _ in range(n_models)]
+
+        def run_scalar():
+            for x in X:
+                for cf, xi in zip(cfs, x):
+                    cf.update(xi)
+
+        cf_bank = ChangeFinderBank(n_models, r=0.02, k=k, T1=10, T2=5)
+
+        t_scalar = elapsed(run_scalar)
+        t_bank = elapsed(cf_bank.update_many, X)
+
+        n_total = points * n_models
+        print('%8d %20.3f %20.3f' % (n_models, t_scalar / n_total * 1e6, t_bank / n_total * 1e6))
+
+
+def discounted_autocovariances(x, k, r):
+    """Sequence of the coefficients `c` as a SDAR model updates them."""
+    mu = 0.0
+    c = np.zeros(k + 1)
+    cs = np.zeros((x.size - k, k + 1))
+
+    for t in range(k, x.size):
+        mu = (1 - r) * mu + r * x[t]
+        c = (1 - r) * c + r * (x[t] - mu) * (x[t::-1][:(k + 1)] - mu)
+        cs[t - k] = c
+
+    return cs
+
+
+@cli.command()
+@click.option('--k', '-k', multiple=True, type=int, default=[1, 2, 5, 10, 20, 30, 40, 50], help='Order of the AR model.')
+@click.option('--points', default=300, help='Number of solved equations.')
+@click.option('--r', default=0.005, help='Discounting parameter of the coefficients.')
+@click.option('--backend', default='auto', help='Kernel backend.')
+def levinson(k, points, r, backend):
+    """Cost of a Yule-Walker solve: allocating vs. in-place vs. warm-started."""
+    kernels = get_backend(backend)
+    print('backend: %s' % kernels.name)
+    print('%4s %18s %18s %18s %10s' % ('k', 'alloc [us/solve]', 'inplace [us/solve]', 'warm [us/solve]', 'refined'))
+
+    # AR(2) process
+    x = np.zeros(points + max(k) + 100)
+    e = np.random.normal(size=x.size)
+    for t in range(2, x.size):
+        x[t] = 0.6 * x[t - 1] - 0.3 * x[t - 2] + e[t]
+
+    for order in k:
+        # skip the first points where the coefficients are unstable
+        cs = discounted_autocovariances(x, order, r)[100:]
+
+        # compile (if needed) before measurement
+        kernels.aryule_levinson(cs[0], order)
+        LevinsonSolver(order, backend).solve(cs[0])
+
+        def run_alloc():
+            for c in cs:
+                kernels.aryule_levinson(c, order)
+
+        exact = LevinsonSolver(order, backend)
+        warm = LevinsonSolver(order, backend, warm_start=True)
+
+        def run_solver(solver):
+            for c in cs:
+                solver.solve(c)
+
+        n = cs.shape[0]
+        print('%4d %18.3f %18.3f %18.3f %9.1f%%' % (order,
+                                                    elapsed(run_alloc) / n * 1e6,
+                                                    elapsed(run_solver, exact) / n * 1e6,
+                                                    elapsed(run_solver, warm) / n * 1e6,
+                                                    warm.n_refined / n * 100))
+
+
+@cli.command()
+@click.option('--max_k', '-k', multiple=True, type=int, default=[10, 20, 50], help='Max number of k for AR(k).')
+@click.option('--points', default=1440, help='Number of data points (default: one day of 1-minute data).')
+@click.option('--backend', default='auto', help='Kernel backend of the per-order estimation.')
+def select(max_k, points, backend):
+    """Cost of the AR model selection: one AR_1D per order vs. single pass."""
+    print('%6s %14s %14s %10s' % ('max_k', 'per-order [s]', 'single [s]', 'same k'))
+
+    x = np.cumsum(np.random.normal(size=points))
+
+    def select_per_order(max_k):
+        aic = []
+        for k in range(1, min(x.size, max_k + 1)):
+            ar = AR_1D(k, backend)
+            ar.estimate(x)
+            aic.append(x.size * (np.log(max(2 * np.pi * ar.sigma, 1e-100)) + 1) + 2 * (k + 1))
+        return int(np.argmin(aic)) + 1
+
+    # compile (if needed) before measurement
+    select_per_order(1)
+
+    for k in max_k:
+        selector = ModelSelection(k)
+
+        start = time.perf_counter()
+        expected = select_per_order(k)
+        t_per_order = time.perf_counter() - start
+
+        start = time.perf_counter()
+        selected = selector.select(x)[0]
+        t_single = time.perf_counter() - start
+
+        print('%6d %14.4f %14.4f %10s' % (k, t_per_order, t_single, expected == selected))
+
+
+@cli.command()
+@click.option('--w', '-w', multiple=True, type=int, default=[10, 20, 50, 100, 200], help='Window size of SST.')
+@click.option('--points', default=200, help='Number of scored points.')
+@click.option('--chunk_size', default=1024, help='Number of windows in a batched SVD.')
+def sst(w, points, chunk_size):
+    """Cost of SST: explicit vs. matrix-free Lanczos steps, and per-window vs. batched SVD."""
+    print('%4s %18s %18s %18s %18s %18s' % ('w', 'explicit [us/step]', 'free [us/step]', 'lanczos [us/point]',
+                                            'svd [us/point]', 'batch [us/point]'))
+
+    for size in w:
+        model = SingularSpectrumTransformation(size)
+        xs = np.cumsum(np.random.normal(size=model.span + points - 1))
+
+        # trajectory matrices of each step
+        windows = strided_windows(xs, size)
+        steps = [(windows[t:(t + model.n)].T, windows[(t + model.n_past + 1 + model.g):][:model.m].T)
+                 for t in range(points)]
+
+        s = 2 * model.r if model.r % 2 == 0 else 2 * model.r - 1
+
+        def run_explicit():
+            for H, G in steps:
+                np.dot(np.dot(G.T, G), model.q)
+                lanczos(np.dot(H, H.T), model.q, s)
+
+        def run_free():
+            for H, G in steps:
+                np.dot(G.T, np.dot(G, model.q))
+                lanczos(lambda x: np.dot(H, np.dot(H.T, x)), model.q, s)
+
+        print('%4d %18.3f %18.3f %18.3f %18.3f %18.3f' % (size,
+                                                          elapsed(run_explicit) / points * 1e6,
+                                                          elapsed(run_free) / points * 1e6,
+                                                          elapsed(model.score_series, xs) / points * 1e6,
+                                                          elapsed(model.score_series, xs, False) / points * 1e6,
+                                                          elapsed(model.score_batch, xs, chunk_size) / points * 1e6))
+
+
+LOAD_CONFIG = '''[general]
+interval: %(interval)d
+limit: 300
+queries_per_call: %(queries_per_call)d
+max_models: %(max_models)d
+dd_api_host: %(dd_api_host)s
+dd_max_retries: 0
+fluent_host: 127.0.0.1
+fluent_port: %(fluent_port)d
+engine_metrics: false
+'''
+
+LOAD_SECTION = '''
+[datadog.load%(i)d]
+query: avg:fake.metric.%(i)d{*}by{host}
+engine: %(engine)s
+k: 6
+w: 10
+'''
+
+
+def model_bytes(detector):
+    """Total size of live models of a detector."""
+    return sum(detector.model_nbytes.get(section_name, 0) for (section_name, _), _ in detector.models.items())
+
+
+@cli.command()
+@click.option('--sections', '-s', multiple=True, type=int, default=[1, 10, 50], help='Number of sections.')
+@click.option('--hosts', multiple=True, type=int, default=[1, 10, 100], help='Number of hosts of each section.')
+@click.option('--points', default=60, help='Number of points of each series in a cycle.')
+@click.option('--resolution', default=60, help='Seconds between points.')
+@click.option('--cycles', default=3, help='Number of measured cycles.')
+@click.option('--engine', default='changefinder', help='Detector engine: changefinder | sst')
+@click.option('--queries_per_call', default=10, help='Max number of section queries coalesced into an API call.')
+@click.option('--daemon', is_flag=True, help='Run cycles of the daemon loop (with its scheduler) instead of `Detector.query`.')
+def load(sections, hosts, points, resolution, cycles, engine, queries_per_call, daemon):
+    """End-to-end cost of query cycles against a fake Datadog API and fluentd."""
+    # the fake API does not check keys
+    os.environ.setdefault('DD_API_KEY', 'fake')
+    os.environ.setdefault('DD_APP_KEY', 'fake')
+
+    if daemon:
+        from daemonizer import ChangeFinderDaemon
+
+    print('%8s %6s %14s %16s %10s %14s %10s %12s' % ('sections', 'hosts', 'cycle [s]', 'points/s', 'RSS [MB]',
+                                                      'models [MB]', 'API calls', 'records'))
+
+    tick = points * resolution
+
+    for n_sections in sections:
+        for n_hosts in hosts:
+            # a change point in the middle of every cycle
+            server = FakeDatadogServer(hosts=n_hosts, resolution=resolution, change_every=tick).start()
+            sink = FluentSink(keep=False).start()
+            tmp_dir = tempfile.mkdtemp()
+
+            try:
+                path = os.path.join(tmp_dir, 'load.ini')
+                with open(path, 'w') as f:
+                    f.write(LOAD_CONFIG % {'interval': tick, 'queries_per_call': queries_per_call,
+                                           'max_models': n_sections * n_hosts, 'dd_api_host': server.url,
+                                           'fluent_port': sink.port})
+                    for i in range(n_sections):
+                        f.write(LOAD_SECTION % {'i': i, 'engine': engine})
+
+                # cycles of past ranges on tick boundaries; the first one warms up models
+                t = (int(time.time()) // tick - cycles - 1) * tick
+                start = t - tick + 1
+
+                if daemon:
+                    detector = ChangeFinderDaemon(path, os.path.join(tmp_dir, 'load.pid'))
+                    scheduler = Scheduler(tick, detector.dd_api_limit, t - tick)
+                    run = lambda t, start: detector.cycle(scheduler, t, start)
+                else:
+                    detector = Detector('load.changefinder', path)
+                    run = lambda t, start: detector.query(start, t)
+
+                run(t, start)
+
+                n_points = server.n_points
+                n_calls = server.calls.get('/api/v1/query', 0)
+
+                elapsed_total = 0.0
+                for _ in range(cycles):
+                    start, t = t + 1, t + tick
+                    elapsed_total += elapsed(run, t, start)
+
+                # records are emitted in background
+                detector.close()
+                time.sleep(0.5)
+
+                print('%8d %6d %14.3f %16.1f %10.1f %14.3f %10d %12d' % (
+                    n_sections, n_hosts, elapsed_total / cycles, (server.n_points - n_points) / elapsed_total,
+                    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, model_bytes(detector) / 1024 ** 2,
+                    (server.calls.get('/api/v1/query', 0) - n_calls) / cycles, sink.n_records))
+            finally:
+                server.stop()
+                sink.stop()
+                shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,315 @@
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import click
+import msgpack
+import threading
+import numpy as np
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn, ThreadingTCPServer, BaseRequestHandler
+
+try:
+    from core.datadog_client import split_queries
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    from core.datadog_client import split_queries
+
+# e.g. avg:system.cpu.idle{env:prod}by{host}.rollup(avg, 60)
+QUERY_PATTERN = re.compile(r'^\s*(?:(\w+):)?([\w.]+)\{([^}]*)\}(?:\s*by\s*\{([^}]*)\})?(.*)$')
+ROLLUP_PATTERN = re.compile(r'\.rollup\(\s*\w+\s*,\s*(\d+)\s*\)')
+
+
+class FakeDatadogHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if url.path == '/api/v1/query':
+            self.__reply(*self.server.query(int(params['from']), int(params['to']), params['query']))
+        else:
+            self.__reply(404, {'errors': ['Not found: %s' % url.path]})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+
+        if url.path == '/api/v1/series':
+            self.__reply(*self.server.send(body['series']))
+        else:
+            self.__reply(404, {'errors': ['Not found: %s' % url.path]})
+
+    def log_message(self, format, *args):
+        pass
+
+    def __reply(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeDatadogServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, hosts=10, resolution=60, change_every=0, change_size=10.0, noise=1.0, limit=None, port=0):
+        """Local stand-in of Datadog API (`/api/v1/query` and `/api/v1/series`) serving synthetic series.
+
+        A series of any metric is a sine wave with noise, and its level shifts by `change_size` (i.e. a change point)
+        every `change_every` seconds. Values are deterministic for each (metric, scope, timestamp).
+
+        Args:
+            hosts (int): Number of hosts (`host:h0`, `host:h1`, ...); a `by{host}` query returns a series for each.
+            resolution (int): Seconds between points (overwritten by `.rollup(..., seconds)` of a query).
+            change_every (int): Seconds between injected change points (0: no change point).
+            change_size (float): Level shift at a change point.
+            noise (float): Width of the uniform white noise around the sine wave of amplitude 1.
+            limit (int): Calls per hour; exceeding calls get 429 with `X-RateLimit-*` headers (None: unlimited).
+            port (int): Port to listen (0: any free port).
+
+        """
+        super().__init__(('127.0.0.1', port), FakeDatadogHandler)
+
+        self.hosts = hosts
+        self.resolution = resolution
+        self.change_every = change_every
+        self.change_size = change_size
+        self.noise = noise
+        self.limit = limit
+
+        # status of every query response instead of series, e.g. 503 to simulate an outage (None: normal)
+        self.status = None
+
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.n_points = 0
+        self.posted = []
+        self.window_start = time.time()
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def query(self, start, end, query):
+        """Return (status, body, headers) for a query request.
+
+        """
+        headers = self.__count('/api/v1/query')
+        if headers is not None and int(headers['X-RateLimit-Remaining']) < 0:
+            return 429, {'errors': ['Rate limit of %d calls per hour is exceeded' % self.limit]}, headers
+        if self.status is not None:
+            return self.status, {'errors': ['Simulated error (HTTP %d)' % self.status]}, headers
+
+        series = []
+        for i, q in enumerate(split_queries(query)):
+            m = QUERY_PATTERN.match(q)
+            if m is None:
+                return 400, {'errors': ['Error parsing query: %s' % q]}, headers
+
+            _, metric, scope, by, rest = m.groups()
+
+            rollup = ROLLUP_PATTERN.search(rest)
+            resolution = int(rollup.group(1)) if rollup is not None else self.resolution
+
+            if by is not None and by.strip() == 'host':
+                scopes = ['host:h%d' % h for h in range(self.hosts)]
+                if scope.strip() not in ('*', ''):
+                    scopes = ['%s,%s' % (scope, s) for s in scopes]
+            else:
+                scopes = [scope]
+
+            for s in scopes:
+                times, values = self.generate(metric, s, start, end, resolution)
+                series.append({'metric': metric, 'scope': s, 'query_index': i, 'expression': q,
+                               'pointlist': [[t, v] for t, v in zip((times * 1000.).tolist(), values.tolist())]})
+
+                with self.lock:
+                    self.n_points += times.size
+
+        return 200, {'status': 'ok', 'series': series}, headers
+
+    def send(self, series):
+        """Return (status, body, headers) for a request posting metrics.
+
+        """
+        headers = self.__count('/api/v1/series')
+
+        with self.lock:
+            self.posted += series
+
+        return 202, {'status': 'ok'}, headers
+
+    def generate(self, metric, scope, start, end, resolution):
+        """Generate points of a series in [start, end].
+
+        Returns:
+            (numpy array, numpy array): Timestamps (in sec.) and values.
+
+        """
+        times = np.arange(-(-start // resolution) * resolution, end + 1, resolution, dtype=np.int64)
+
+        seed = zlib.crc32(('%s|%s' % (metric, scope)).encode('utf-8'))
+
+        # deterministic white noise in [-noise / 2, noise / 2) for each timestamp (a 64-bit mix of the timestamp and seed)
+        h = times.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(seed)
+        h ^= h >> np.uint64(33)
+        h *= np.uint64(0xFF51AFD7ED558CCD)
+        h ^= h >> np.uint64(33)
+        h *= np.uint64(0xC4CEB9FE1A85EC53)
+        h ^= h >> np.uint64(33)
+        noise = self.noise * ((h >> np.uint64(11)) / float(1 << 53) - 0.5)
+
+        values = (seed % 100) + np.sin(2 * np.pi * times / (resolution * 60.)) + noise
+        if self.change_every > 0:
+            values += self.change_size * ((times // self.change_every) % 2)
+
+        return times, values
+
+    def __count(self, path):
+        with self.lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+
+            if self.limit is None:
+                return None
+
+            # fixed window of an hour
+            now = time.time()
+            if now - self.window_start >= 3600:
+                self.window_start = now
+                self.calls = {path: 1}
+
+            n = sum(self.calls.values())
+            return {'X-RateLimit-Limit': str(self.limit),
+                    'X-RateLimit-Remaining': str(self.limit - n),
+                    'X-RateLimit-Reset': str(int(self.window_start + 3600 - now))}
+
+
+class FluentSinkHandler(BaseRequestHandler):
+
+    def handle(self):
+        unpacker = msgpack.Unpacker(raw=False)
+
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                break
+
+            unpacker.feed(data)
+            for message in unpacker:
+                self.server.receive(message)
+
+                # acknowledge a chunk (`require_ack_response`)
+                option = message[-1] if len(message) > 2 and isinstance(message[-1], dict) else {}
+                if 'chunk' in option:
+                    self.request.sendall(msgpack.packb({'ack': option['chunk']}))
+
+
+class FluentSink(ThreadingTCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, keep=True):
+        """Local stand-in of fluentd receiving Forward protocol messages (Message, Forward and PackedForward modes).
+
+        Args:
+            port (int): Port to listen (0: any free port).
+            keep (bool): Keep received records in `records`, or only count them.
+
+        """
+        super().__init__(('127.0.0.1', port), FluentSinkHandler)
+
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.n_messages = 0
+        self.n_records = 0
+        self.records = []
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def receive(self, message):
+        tag, entries = message[0], message[1]
+
+        if isinstance(entries, (bytes, bytearray)):
+            # PackedForward mode: [tag, msgpack stream of [time, record], option]
+            unpacker = msgpack.Unpacker(raw=False)
+            unpacker.feed(entries)
+            events = [(tag, e[1]) for e in unpacker]
+        elif isinstance(entries, list):
+            # Forward mode: [tag, [[time, record], ...], option]
+            events = [(tag, e[1]) for e in entries]
+        else:
+            # Message mode: [tag, time, record, option]
+            events = [(tag, message[2])]
+
+        with self.lock:
+            self.n_messages += 1
+            self.n_records += len(events)
+            if self.keep:
+                self.records += events
+
+
+@click.command()
+@click.option('--port', default=8125, help='Port of the fake Datadog API.')
+@click.option('--fluent_port', default=24224, help='Port of the fluentd stand-in (0: disabled).')
+@click.option('--hosts', default=10, help='Number of hosts of a `by{host}` query.')
+@click.option('--resolution', default=60, help='Seconds between points.')
+@click.option('--change_every', default=3600, help='Seconds between injected change points (0: none).')
+@click.option('--noise', default=1.0, help='Width of the white noise around a sine wave of amplitude 1.')
+@click.option('--limit', default=0, help='API calls per hour (0: unlimited).')
+def cli(port, fluent_port, hosts, resolution, change_every, noise, limit):
+    """Serve fake Datadog API (and a fluentd sink) until interrupted.
+
+    Set `dd_api_host: http://127.0.0.1:<port>` (and `fluent_port`) in the general section of a config.
+
+    """
+    server = FakeDatadogServer(hosts=hosts, resolution=resolution, change_every=change_every, noise=noise,
+                               limit=limit or None, port=port).start()
+    print('Fake Datadog API: %s' % server.url)
+
+    sink = None
+    if fluent_port > 0:
+        sink = FluentSink(port=fluent_port, keep=False).start()
+        print('Fluentd sink: 127.0.0.1:%d' % sink.port)
+
+    try:
+        while True:
+            time.sleep(10)
+            print('%s calls, %d points served, %d records received' %
+                  (server.calls, server.n_points, sink.n_records if sink is not None else 0))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    cli()
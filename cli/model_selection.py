@@ -3,7 +3,6 @@ import os
 import sys
 import click
 import configparser
-import numpy as np
 
 from utils import str2timestamp
 
@@ -15,13 +14,17 @@ except ImportError:
     from core.datadog_client import DatadogClient
     from core.changefinder.ar_1d import ModelSelection
 
+from core.k_cache import KCache
+from core.series_cache import SeriesCache
+
 
 @click.command()
 @click.option('--max_k', default=50, help='Max number of k for AR(k).')
 @click.option('--start', prompt='Start', help='Datetime starting relay from.')
 @click.option('--end', prompt='End', help='Datetime starting relay to.')
 @click.option('--timezone', default='UTC', help='Timezone of the datetime.')
-def cli(max_k, start, end, timezone):
+@click.option('--refresh', is_flag=True, help='Select k even if it is cached.')
+def cli(max_k, start, end, timezone, refresh):
     time_start = str2timestamp(start, timezone)
     time_end = str2timestamp(end, timezone)
 
@@ -37,18 +40,40 @@ def cli(max_k, start, end, timezone):
     for section_name in dd_section_names:
         dd_sections[section_name] = parser[section_name].get('query')
 
+    # same cache as the daemon
+    general = parser['general'] if 'general' in parser else {}
+    cache = KCache(general.get('k_cache_path'))
+    cache.ttl = int(general.get('k_cache_ttl', cache.ttl))
+
+    # fetched series are also shared with the daemon and `cli/replay.py`
+    series_cache = None
+    if general.get('series_cache_path') is not None:
+        series_cache = SeriesCache(general.get('series_cache_path'))
+        series_cache.max_bytes = int(general.get('series_cache_max_bytes', series_cache.max_bytes))
+
     dd = DatadogClient(app_key=os.environ['DD_APP_KEY'],
                        api_key=os.environ['DD_API_KEY'])
 
     selector = ModelSelection(max_k)
 
     for section_name, query in dd_sections.items():
-        series = dd.get_series(time_start, time_end, query)
-        x = np.array([(0.0 if s['raw_value'] is None else s['raw_value']) for s in series])
+        entry = cache.get(section_name, query)
 
-        selected_k, min_aic = selector.select(x)
+        if refresh or entry is None or cache.is_expired(entry):
+            if series_cache is None:
+                series = dd.get_series(time_start, time_end, query)
+            else:
+                series = series_cache.get_series(dd, time_start, time_end, query)
+            # `k` of the daemon is selected on each scope, as its models are fed
+            aic, sigma = selector.estimate_many(list(series.scope_values().values()))
+            selected_k, _ = ModelSelection.argmin(aic)
+            entry = cache.put(section_name, query, selected_k, aic, sigma[selected_k - 1] if sigma.size > 0 else 0.0)
+            source = 'selected'
+        else:
+            source = 'cached'
 
-        print('[%s] %s\n  k = %d (AIC = %f)' % (section_name, query, selected_k, min_aic))
+        selected_k, min_aic = ModelSelection.argmin(entry['aic'])
+        print('[%s] %s\n  k = %d (AIC = %f, %s)' % (section_name, query, selected_k, min_aic, source))
 
 
 if __name__ == '__main__':
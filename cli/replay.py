@@ -22,7 +22,10 @@ def replay(start, end, timezone, config):
 
     assert (time_end - time_start <= 60 * 60 * 24), 'Time range must be smaller than 24 hours'
 
-    Detector('replay.changefinder.replay', config).query(time_start, time_end)
+    detector = Detector('replay.changefinder.replay', config)
+    detector.wait_k()
+    detector.query(time_start, time_end, cached=True)
+    detector.close()
 
 
 if __name__ == '__main__':
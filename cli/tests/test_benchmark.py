@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+import os
+import sys
+from click.testing import CliRunner
+
+try:
+    import benchmark
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    import benchmark
+
+
+class BenchmarkCliTestCase(TestCase):
+
+    def setUp(self):
+        self.runner = CliRunner()
+
+    def test_bank(self):
+        res = self.runner.invoke(benchmark.cli, ['bank', '-n', '1', '-n', '3', '--points=20'])
+        self.assertEqual(res.exit_code, 0)
+
+    def test_levinson(self):
+        res = self.runner.invoke(benchmark.cli, ['levinson', '-k', '1', '-k', '3', '--points=20'])
+        self.assertEqual(res.exit_code, 0)
+
+    def test_select(self):
+        res = self.runner.invoke(benchmark.cli, ['select', '-k', '3', '--points=50'])
+        self.assertEqual(res.exit_code, 0)
+
+    def test_sst(self):
+        res = self.runner.invoke(benchmark.cli, ['sst', '-w', '5', '--points=10'])
+        self.assertEqual(res.exit_code, 0)
+
+    def test_load(self):
+        res = self.runner.invoke(benchmark.cli, ['load', '-s', '2', '--hosts', '3', '--points=20', '--cycles=1'])
+        self.assertEqual(res.exit_code, 0, res.output)
+        self.assertIn('records', res.output)
@@ -0,0 +1,81 @@
+from unittest import TestCase
+
+import os
+import sys
+import time
+import requests
+from fluent import sender
+
+try:
+    from fake_datadog import FakeDatadogServer, FluentSink
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    from fake_datadog import FakeDatadogServer, FluentSink
+
+from core.datadog_client import DatadogClient
+
+
+class FakeDatadogServerTestCase(TestCase):
+
+    def setUp(self):
+        self.server = FakeDatadogServer(hosts=3, resolution=60, change_every=600).start()
+        self.dd = DatadogClient(app_key='fake', api_key='fake', api_host=self.server.url, max_retries=0)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_get_series(self):
+        series = self.dd.get_series(1200, 2399, 'avg:fake.metric{*}by{host}')
+
+        self.assertEqual([s.scope for s in series], ['host:h0', 'host:h1', 'host:h2'])
+        self.assertEqual(len(series), 3 * 20)
+        self.assertEqual(self.server.n_points, 3 * 20)
+
+        # level shift at the change point
+        values = list(series)[0].values
+        self.assertGreater(values[10:].mean() - values[:10].mean(), 5.0)
+
+    def test_deterministic(self):
+        a = self.dd.get_series(0, 599, 'fake.metric{*}')
+        b = self.dd.get_series(300, 599, 'fake.metric{*}')
+        self.assertEqual(list(a)[0].values[5:].tolist(), list(b)[0].values.tolist())
+
+    def test_get_series_many(self):
+        results = self.dd.get_series_many(0, 599, ['fake.a{*}by{host}', 'fake.b{*}.rollup(avg, 300)'])
+
+        self.assertEqual(len(results[0]), 3 * 10)
+        self.assertEqual(len(results[1]), 2)
+        self.assertEqual(self.server.calls, {'/api/v1/query': 1})
+
+    def test_rate_limit(self):
+        self.server.limit = 1
+        params = {'from': 0, 'to': 599, 'query': 'fake.metric{*}'}
+
+        res = requests.get(self.server.url + '/api/v1/query', params=params)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-RateLimit-Remaining'], '0')
+
+        res = requests.get(self.server.url + '/api/v1/query', params=params)
+        self.assertEqual(res.status_code, 429)
+
+
+class FluentSinkTestCase(TestCase):
+
+    def setUp(self):
+        self.sink = FluentSink().start()
+        self.logger = sender.FluentSender('test', host='127.0.0.1', port=self.sink.port)
+
+    def tearDown(self):
+        self.logger.close()
+        self.sink.stop()
+
+    def test_receive(self):
+        for i in range(3):
+            self.assertTrue(self.logger.emit('metric', {'value': i}))
+
+        for _ in range(50):
+            if self.sink.n_records == 3:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(self.sink.records, [('test.metric', {'value': i}) for i in range(3)])
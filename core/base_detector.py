@@ -1,116 +1,764 @@
 from abc import ABCMeta, abstractmethod
 
-from fluent import sender
-
 import re
 import os
 import time
+import socket
 import configparser
 import numpy as np
-
-from .datadog_client import DatadogClient
+from functools import partial
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from . import checkpoint
+from .datadog_client import DatadogClient, QueryError
+from .emitter import Emitter
+from .fluent_forward import ForwardSender
+from .k_cache import KCache
+from .model_registry import ModelRegistry
+from .series import Series
+from .series_cache import SeriesCache
 from .changefinder.ar_1d import ModelSelection
-from .changefinder.changefinder_1d import ChangeFinder
+from .engine import ENGINES, create_engine, nbytes
+from .changefinder.backend import set_default_backend
 
 from logging import getLogger
 logger = getLogger('ChangeFinder')
 
+# options of a section which only affect when it is queried
+SCHEDULE_KEYS = ('interval', 'priority')
+
+
+def model_config(config):
+    """Return options of a section which affect its models.
+
+    """
+    return {key: value for key, value in config.items() if key not in SCHEDULE_KEYS}
+
+
+def record_metrics(section_name):
+    """Return the tag (label) and metric names of records of a section, e.g. `cpu` for `datadog.cpu`.
+
+    Returns:
+        (str, str, str): Tag, outlier metric and change point metric.
+
+    """
+    dst_metric = re.match(r'^datadog\.(.*)$', section_name).group(1)
+    return dst_metric, 'changefinder.outlier.' + dst_metric, 'changefinder.change.' + dst_metric
+
 
 class Detector:
 
     __metaclass__ = ABCMeta
 
     @abstractmethod
-    def __init__(self, fluent_tag_prefix, inifile_path):
-        self.fluent_logger = sender.FluentSender(fluent_tag_prefix)
+    def __init__(self, fluent_tag_prefix, inifile_path, checkpoint_path=None):
+        parser = configparser.ConfigParser()
+        parser.read(inifile_path)
+        general = parser['general'] if 'general' in parser else {}
+
+        self.fluent_logger = ForwardSender(fluent_tag_prefix,
+                                           host=general.get('fluent_host', 'localhost'),
+                                           port=int(general.get('fluent_port', 24224)))
+
+        # records are sent in background, and spilled to a local file while fluentd is slow or down
+        self.emitter = Emitter(self.fluent_logger,
+                               queue_size=int(general.get('fluent_queue_size', 100)),
+                               spill_path=general.get('fluent_spill_path'),
+                               retry_interval=float(general.get('fluent_retry_interval', 5)))
         self.inifile_path = inifile_path
+        self.checkpoint_path = checkpoint_path
 
+        # connection pool and retries of DD API calls
         self.dd = DatadogClient(app_key=os.environ['DD_APP_KEY'],
-                                api_key=os.environ['DD_API_KEY'])
+                                api_key=os.environ['DD_API_KEY'],
+                                api_host=general.get('dd_api_host'),
+                                pool_size=int(general.get('dd_pool_size', 16)),
+                                timeout=float(general.get('dd_timeout', 30)),
+                                max_retries=int(general.get('dd_max_retries', 3)),
+                                backoff=float(general.get('dd_backoff', 1)))
 
         # key: config's section_name
-        # value: { query: (query string), cf: (ChangeFinder instance) }
+        # value: { query: (query string), config: (raw key-values), engine: (engine name), params: (engine parameters) }
+        # `k` of ChangeFinder params is None until it is automatically selected for the first time
         self.dd_sections = {}
-        self.load_dd_config()
+
+        # one engine model (e.g. ChangeFinder instance) for each (section_name, scope)
+        self.models = ModelRegistry()
+
+        # memory size of a model of each section
+        self.model_nbytes = {}
+
+        # CPU time and number of points of each engine in the current `query`
+        self.engine_costs = {}
+        self.is_engine_metrics = True
+
+        # sections waiting for automatic (re-)selection of `k`
+        # key: config's section_name, value: future of (future of the selection result)
+        self.pending_k = {}
+
+        # automatically selected `k` of each section; configured by `load_dd_config`
+        self.k_cache = KCache()
+
+        # on-disk cache of fetched series for historical ranges; disabled unless configured
+        self.series_cache = None
+
+        # max number of concurrent DD API calls, and processes for selecting `k`
+        self.select_k_concurrency = 4
+        self.select_k_processes = None
+
+        # worker pools are lazily created (in the process which actually uses them)
+        self.select_k_pools = None
+        self.select_k_pid = None
+
+        # max number of concurrent DD API calls in `query`, and queries coalesced into a call
+        self.fetch_concurrency = 8
+        self.queries_per_call = 1
+        self.n_api_used = 0
+        self.fetch_pool = None
+        self.fetch_pid = None
+
+        # max number of records in a message to fluentd, and records dropped in the current `query`
+        self.fluent_batch_size = 1000
+        self.n_emit_failed = 0
+        self.is_emitter_metrics = False
+
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            self.restore_checkpoint(checkpoint_path)
+        else:
+            self.load_dd_config()
 
     def select_k(self, query):
+        return ModelSelection.argmin(ModelSelection().estimate_many(self.__fetch_k_series(query))[0])[0]
+
+    def wait_k(self, timeout=None):
+        """Block until `k` of all pending sections is selected.
+
+        Args:
+            timeout (float): Max seconds to wait. If None, wait without limit.
+
+        Returns:
+            int: Number of sections which are still pending.
+
+        """
+        deadline = None if timeout is None else time.time() + timeout
+
+        while len(self.pending_k) > 0 and (deadline is None or time.time() < deadline):
+            self.__update_pending_k()
+            if len(self.pending_k) > 0:
+                time.sleep(0.1)
+
+        return len(self.pending_k)
+
+    def __fetch_k_series(self, query):
         end = int(time.time())
         start = end - (60 * 60 * 24)  # one day interval
 
-        series = self.dd.get_series(start, end, query)
+        # `k` is shared by the models of all scopes, and each of them is fed only its own scope
+        return list(self.__get_series(start, end, query, True).scope_values().values())
+
+    def __get_series(self, start, end, query, cached=False):
+        if cached and self.series_cache is not None:
+            return self.series_cache.get_series(self.dd, start, end, query)
+        return self.dd.get_series(start, end, query)
+
+    def __submit_select_k(self, section_name):
+        """Fetch a series in a thread, and then select `k` in another process.
+
+        """
+        fetch_pool, select_pool = self.__get_select_k_pools()
+
+        def fetch_and_submit(query):
+            return select_pool.submit(ModelSelection().estimate_many, self.__fetch_k_series(query))
+
+        self.pending_k[section_name] = fetch_pool.submit(fetch_and_submit, self.dd_sections[section_name]['query'])
+
+    def __get_select_k_pools(self):
+        if self.select_k_pid != os.getpid():
+            # pools (and their threads) are not inherited by a forked process (e.g. daemonized one);
+            # create them again, and resubmit sections which have been pending in the parent process
+            self.select_k_pools = (ThreadPoolExecutor(self.select_k_concurrency),
+                                   ProcessPoolExecutor(self.select_k_processes))
+            self.select_k_pid = os.getpid()
+
+            for section_name in list(self.pending_k.keys()):
+                self.__submit_select_k(section_name)
+
+        return self.select_k_pools
+
+    def __get_fetch_pool(self):
+        if self.fetch_pid != os.getpid():
+            # threads are not inherited by a forked process (e.g. daemonized one)
+            self.fetch_pool = ThreadPoolExecutor(self.fetch_concurrency)
+            self.fetch_pid = os.getpid()
+
+        return self.fetch_pool
+
+    def __update_pending_k(self):
+        """Start scoring sections whose `k` has been selected.
+
+        """
+        if len(self.pending_k) > 0:
+            self.__get_select_k_pools()
+
+        for section_name, future in list(self.pending_k.items()):
+            if not future.done():
+                continue
+
+            params = self.dd_sections[section_name]['params']
+
+            try:
+                selection = future.result()
+                if not selection.done():
+                    continue
+                aic, sigma = selection.result()
+            except Exception as err:
+                logger.error('[%s] Failed to select `k`: %s' % (section_name, err))
+                del self.pending_k[section_name]
+
+                # section is handled as a new one (i.e. retried) when the config is loaded next time;
+                # otherwise, keep using the current `k`
+                if params['k'] is None:
+                    del self.dd_sections[section_name]
+                continue
+
+            del self.pending_k[section_name]
+
+            k, _ = ModelSelection.argmin(aic)
+            self.k_cache.put(section_name, self.dd_sections[section_name]['query'],
+                             k, aic, sigma[k - 1] if sigma.size > 0 else 0.0)
+
+            if params['k'] is not None and params['k'] != k:
+                # models of the previous `k` cannot be reused
+                self.models.drop(section_name)
+
+            params['k'] = k
+            logger.info('[%s] `k` has been automatically set to %d' % (section_name, k))
 
-        x = np.array([(0.0 if s['raw_value'] is None else s['raw_value']) for s in series])
-        return ModelSelection().select(x)[0]
+    def __check_k(self, section_name, sigmas):
+        """Re-select automatically selected `k` in background if it has been expired or drifted.
+
+        Args:
+            section_name (str): Config's section name.
+            sigmas (list): Live variances of prediction errors of the section's models.
+
+        """
+        section = self.dd_sections[section_name]
+        if section['engine'] != 'changefinder' or 'k' in section['config'] or section_name in self.pending_k:
+            return
+
+        # `k` is restored from a checkpoint, but not cached
+        entry = self.k_cache.get(section_name, section['query'])
+        if entry is None:
+            return
+
+        if self.k_cache.is_expired(entry):
+            reason = 'expired'
+        elif len(sigmas) > 0 and self.k_cache.is_drifted(entry, np.mean(sigmas)):
+            reason = 'drifted'
+        else:
+            return
+
+        logger.info('[%s] `k` is re-selected since it has been %s' % (section_name, reason))
+        self.__submit_select_k(section_name)
+
+    def load_dd_config(self, checkpoint_sections=None):
+        """Load DD-related sections from the config file.
+
+        Args:
+            checkpoint_sections (dict): Sections of a checkpoint. Hyperparameters of a new section
+                are taken from here (i.e. `k` is not selected again) if its config is unchanged.
+
+        """
+        checkpoint_sections = checkpoint_sections or {}
 
-    def load_dd_config(self):
         parser = configparser.ConfigParser()
         parser.read(self.inifile_path)
 
+        if 'general' in parser:
+            self.models.max_models = parser['general'].getint('max_models') or self.models.max_models
+            self.models.evict()
+
+            self.select_k_concurrency = parser['general'].getint('select_k_concurrency') or self.select_k_concurrency
+            self.select_k_processes = parser['general'].getint('select_k_processes') or self.select_k_processes
+
+            fetch_concurrency = parser['general'].getint('fetch_concurrency') or self.fetch_concurrency
+            if fetch_concurrency != self.fetch_concurrency:
+                self.fetch_concurrency = fetch_concurrency
+                if self.fetch_pool is not None:
+                    self.fetch_pool.shutdown(wait=False)
+                self.fetch_pid = None
+
+            self.queries_per_call = parser['general'].getint('queries_per_call') or self.queries_per_call
+            self.fluent_batch_size = parser['general'].getint('fluent_batch_size') or self.fluent_batch_size
+
+            # cache of automatically selected `k`
+            k_cache_path = parser['general'].get('k_cache_path')
+            if k_cache_path != self.k_cache.path:
+                self.k_cache = KCache(k_cache_path)
+            self.k_cache.ttl = parser['general'].getint('k_cache_ttl') or self.k_cache.ttl
+            self.k_cache.drift_ratio = parser['general'].getfloat('k_drift_ratio') or self.k_cache.drift_ratio
+
+            # cache of fetched series
+            series_cache_path = parser['general'].get('series_cache_path')
+            if series_cache_path is None:
+                self.series_cache = None
+            elif self.series_cache is None or series_cache_path != self.series_cache.path:
+                self.series_cache = SeriesCache(series_cache_path)
+            if self.series_cache is not None:
+                self.series_cache.max_bytes = parser['general'].getint('series_cache_max_bytes') or \
+                    self.series_cache.max_bytes
+
+            # report cost of each engine to Datadog metrics, in addition to logs
+            self.is_engine_metrics = parser['general'].getboolean('engine_metrics', self.is_engine_metrics)
+            self.is_emitter_metrics = parser['general'].getboolean('emitter_metrics', self.is_emitter_metrics)
+
+            # kernel backend of models created from now on
+            backend = parser['general'].get('backend')
+            if backend is not None:
+                set_default_backend(backend)
+
         dd_section_names = [s for s in parser.sections()
                             if re.match('^datadog\..*$', s) is not None]
 
         # delete previously existed, but now deleted sections
         for section_name in (set(self.dd_sections.keys()) - set(dd_section_names)):
             del self.dd_sections[section_name]
+            self.pending_k.pop(section_name, None)
+            self.model_nbytes.pop(section_name, None)
+            self.models.drop(section_name)
 
-        # create ChangeFinder instances for each query (metric)
+        # set engine parameters for each query (metric)
         for section_name in dd_section_names:
             # since this method can be called multiple times,
-            # only new DD-related sections are handled
+            # only new (or changed) DD-related sections are handled
             if section_name in self.dd_sections.keys():
-                continue
+                if self.dd_sections[section_name]['config'] == dict(parser[section_name]):
+                    continue
+
+                # scheduling options (e.g. `interval`) do not affect models
+                if model_config(self.dd_sections[section_name]['config']) == model_config(parser[section_name]):
+                    self.dd_sections[section_name]['config'] = dict(parser[section_name])
+                    continue
 
-            self.dd_sections[section_name] = {}
+                # hyperparameters have been changed; rebuild the section from scratch
+                logger.info('[%s] has been changed, and its models are rebuilt' % section_name)
+                del self.dd_sections[section_name]
+                self.pending_k.pop(section_name, None)
+                self.model_nbytes.pop(section_name, None)
+                self.models.drop(section_name)
 
             s = parser[section_name]
+            config = dict(s)
+
+            # detector engine: ChangeFinder or SST
+            engine = s.get('engine') or 'changefinder'
+            if engine not in ENGINES:
+                raise ValueError('[%s] `engine` must be one of [%s], but got `%s`' %
+                                 (section_name, ', '.join(sorted(ENGINES.keys())), engine))
+
+            if section_name in checkpoint_sections and \
+                    model_config(checkpoint_sections[section_name]['config']) == model_config(config):
+                self.dd_sections[section_name] = {'query': s.get('query'), 'config': config, 'engine': engine,
+                                                  'params': checkpoint_sections[section_name]['params'],
+                                                  'metrics': record_metrics(section_name)}
+                continue
+
+            self.dd_sections[section_name] = {'config': config, 'engine': engine,
+                                              'metrics': record_metrics(section_name)}
 
             q = s.get('query')
             self.dd_sections[section_name]['query'] = q
 
+            if engine == 'sst':
+                w = s.getint('w') or 30
+                r = s.getint('r') or 3
+                self.dd_sections[section_name]['params'] = {'w': w, 'r': r,
+                                                            'is_lanczos': s.getboolean('lanczos', True)}
+                continue
+
             r = s.getfloat('r') or 0.02
             T1 = s.getint('T1') or 10
             T2 = s.getint('T2') or 5
 
+            # estimation method of the AR models: Yule-Walker equation or Burg's method
+            method = s.get('method') or 'yule'
+            if method not in ('yule', 'burg'):
+                del self.dd_sections[section_name]
+                raise ValueError('[%s] `method` must be one of [yule, burg], but got `%s`' % (section_name, method))
+
             k = s.getint('k')
+
+            self.dd_sections[section_name]['params'] = {'r': r, 'k': k, 'T1': T1, 'T2': T2,
+                                                        'is_yule': method == 'yule'}
+
             if k is None:
-                k = self.select_k(q)
-                logger.info('[%s] `k` has been automatically set to %d' % (section_name, k))
+                entry = self.k_cache.get(section_name, q)
+                if entry is not None and not self.k_cache.is_expired(entry):
+                    self.dd_sections[section_name]['params']['k'] = entry['k']
+                    logger.info('[%s] `k` has been set to %d from the cache' % (section_name, entry['k']))
+                else:
+                    # section is not scored until `k` is selected in background
+                    self.__submit_select_k(section_name)
 
-            self.dd_sections[section_name]['cf'] = ChangeFinder(r=r, k=k, T1=T1, T2=T2)
+        self.__update_pending_k()
 
-    def query(self, start, end):
-        for section_name in self.dd_sections.keys():
-            series = self.dd.get_series(start, end,
-                                        self.dd_sections[section_name]['query'])
+    def save_checkpoint(self, path=None):
+        """Atomically write the state of all live models to a checkpoint file.
 
-            self.__handle_series(section_name, series)
+        Args:
+            path (str): Checkpoint file. If None, `checkpoint_path` is used.
 
-    def __handle_series(self, section_name, series):
-        start = time.clock()
+        """
+        start = time.perf_counter()
+
+        path = path or self.checkpoint_path
+
+        sections = {section_name: {'config': section['config'], 'params': section['params']}
+                    for section_name, section in self.dd_sections.items() if self.is_ready(section_name)}
+
+        models = [(key, self.models.last_times.get(key), cf.get_state()) for key, cf in self.models.items()]
+
+        checkpoint.save(path, sections, models)
+
+        logger.info('Saved %d models to %s (%.3f sec.)' % (len(models), path, time.perf_counter() - start))
 
-        for s in series:
-            s['raw_value'] = 0.0 if s['raw_value'] is None else s['raw_value']
-            score_outlier, score_change = self.dd_sections[section_name]['cf'].update(s['raw_value'])
+    def restore_checkpoint(self, path):
+        """Load the config, and restore models from a checkpoint file.
+        Models of sections whose hyperparameters have been changed are not restored.
+        If the checkpoint cannot be read, it is ignored.
 
-            s['dst_metric'] = re.match('^datadog\.(.*)$', section_name).group(1)
+        Args:
+            path (str): Checkpoint file.
 
-            record = self.__get_record(s, score_outlier, score_change)
+        Returns:
+            int: Number of restored models.
 
-            if not self.fluent_logger.emit(s['dst_metric'], record):
-                err = str(self.fluent_logger.last_error)
-                logger.error('fluent-logger failed to emit records for [%s] (%s)' % (section_name, err))
-                self.fluent_logger.clear_last_error()
+        """
+        start = time.perf_counter()
+
+        try:
+            header, states = checkpoint.load(path)
+        except (OSError, ValueError) as err:
+            logger.warning('Ignored a checkpoint: %s' % err)
+            self.load_dd_config()
+            return 0
+
+        sections = header['sections']
+        self.load_dd_config(sections)
+
+        n = 0
+        for m in header['models']:
+            section_name = m['section']
+            if section_name not in self.dd_sections or \
+                    self.dd_sections[section_name]['params'] != sections[section_name]['params']:
+                continue
+
+            key = (section_name, m['scope'])
+            model = self.models.get(key, partial(self.__create_model, section_name))
+            model.set_state(states[m['offset']:(m['offset'] + m['size'])])
+
+            if m['last_time'] is not None:
+                self.models.last_times[key] = m['last_time']
+
+            n += 1
+
+        logger.info('Restored %d models from %s (%.3f sec.)' % (n, path, time.perf_counter() - start))
+
+        return n
+
+    def n_api_calls(self, section_names=None):
+        """Return the number of DD API calls in a `query`, where queries of sections are coalesced.
+
+        Args:
+            section_names (list): Sections to be queried (default: all sections).
+
+        """
+        section_names = self.dd_sections.keys() if section_names is None else section_names
+        queries = [self.dd_sections[section_name]['query'] for section_name in section_names]
+        return len(DatadogClient.coalesce(queries, self.queries_per_call))
+
+    def query(self, start, end, cached=False, section_names=None):
+        """Fetch series of all sections concurrently (at most `fetch_concurrency` DD API calls at once),
+        and score them section by section in the config order.
+        Queries of sections are coalesced into calls of at most `queries_per_call` queries.
+        A section which fails to be fetched or scored is skipped without affecting the others.
+
+        Args:
+            start (int): Start of the time range (in sec.).
+            end (int): End of the time range (in sec.).
+            cached (bool): Serve the series from the series cache (if configured), e.g. to replay a past range.
+            section_names (list): Sections to be queried (default: all sections).
+
+        Returns:
+            list: Names of failed sections.
+
+        """
+        self.__update_pending_k()
+
+        self.engine_costs = {}
+        self.n_emit_failed = 0
+
+        section_names = self.dd_sections.keys() if section_names is None else section_names
+        section_names = [section_name for section_name in section_names
+                         if section_name in self.dd_sections and self.is_ready(section_name)]
+        queries = [self.dd_sections[section_name]['query'] for section_name in section_names]
+
+        # cached series are looked up query by query, and only gaps are fetched
+        is_cached = cached and self.series_cache is not None
+        queries_per_call = 1 if is_cached else self.queries_per_call
+
+        # key: query, value: (future of series of the coalesced queries, the coalesced queries)
+        pool = self.__get_fetch_pool()
+        fetches = {}
+        for group in DatadogClient.coalesce(queries, queries_per_call):
+            future = pool.submit(self.__get_series_many, start, end, group, is_cached)
+            for q in group:
+                fetches[q] = (future, group)
+
+        failed = []
+        for section_name, q in zip(section_names, queries):
+            try:
+                future, group = fetches[q]
+
+                # an invalid query makes the whole call fail; fetch the coalesced queries one by one
+                # (transient errors, e.g. an outage, fail all of them without extra calls)
+                if len(group) > 1 and isinstance(future.exception(), QueryError):
+                    logger.warning('Failed to fetch %d coalesced queries, and fetch them separately: %s' %
+                                   (len(group), future.exception()))
+                    for q_ in group:
+                        fetches[q_] = (pool.submit(self.dd.get_series_many, start, end, [q_]), [q_])
+                    future, group = fetches[q]
+
+                self.__handle_series(section_name, future.result()[group.index(q)])
+            except Exception as err:
+                logger.error('Failed to handle [%s]: %s' % (section_name, err))
+                failed.append(section_name)
+
+        if len(failed) > 0:
+            logger.warning('%d of %d sections failed in this query' % (len(failed), len(section_names)))
+
+        if self.n_emit_failed > 0:
+            logger.warning('%d records were dropped in this query' % self.n_emit_failed)
+
+        logger.info('%d models are live, and %d models have been evicted' % (self.models.n_live, self.models.n_evicted))
+
+        # DD query API calls (including retries) actually made since the last query; they are charged to the
+        # budget planned by `n_api_calls`, while metrics posted to `/api/v1/series` are not
+        self.n_api_used = 0
+        for endpoint, stats in sorted(self.dd.pop_stats().items()):
+            if endpoint == '/api/v1/query':
+                self.n_api_used += stats['calls'] + stats['retries']
+            logger.info('Datadog API %s: %d calls, %d retries, %d failures, %.3f sec. latency (max: %.3f sec.)' %
+                        (endpoint, stats['calls'], stats['retries'], stats['failures'],
+                         stats['latency'], stats['max_latency']))
+
+        if is_cached:
+            logger.info('Series cache: %(hits)d hits, %(misses)d misses (hit ratio: %(hit_ratio).3f), '
+                        '%(evicted)d evicted, %(nbytes)d bytes' % self.series_cache.stats)
+
+        self.__report_engine_costs()
+        self.__report_emitter()
+
+        return failed
+
+    def close(self, timeout=30.0):
+        """Flush records waiting for emission (for at most `timeout` seconds); the rest are spilled
+        and sent on the next start.
+
+        """
+        self.emitter.close(timeout)
+        self.fluent_logger.close()
+
+    def __get_series_many(self, start, end, queries, cached=False):
+        if cached and self.series_cache is not None:
+            return [self.series_cache.get_series(self.dd, start, end, q) for q in queries]
+        return self.dd.get_series_many(start, end, queries)
+
+    def is_ready(self, section_name):
+        """Check if a section can be scored (i.e. `k` has been selected, if needed).
+
+        """
+        params = self.dd_sections[section_name]['params']
+        return params.get('k', 0) is not None
+
+    def __report_engine_costs(self):
+        """Report CPU time per point and memory per model of each engine to logs (and Datadog metrics).
+
+        """
+        n_models = {}
+        for (section_name, _), _ in self.models.items():
+            n_models[section_name] = n_models.get(section_name, 0) + 1
+
+        costs = {}
+        for section_name, section in self.dd_sections.items():
+            if section_name not in self.model_nbytes:
+                continue
+            engine = section['engine']
+            models, memory = costs.get(engine, (0, 0))
+            costs[engine] = (models + n_models.get(section_name, 0),
+                             memory + n_models.get(section_name, 0) * self.model_nbytes[section_name])
+
+        host = socket.gethostname()
+
+        for engine, (models, memory) in sorted(costs.items()):
+            cpu, points = self.engine_costs.get(engine, (0.0, 0))
+
+            cpu_per_point = cpu / points * 1e6 if points > 0 else 0.0
+            memory_per_model = memory / models if models > 0 else 0.0
+
+            logger.info('[engine: %s] %d models, %.3f us/point (CPU), %.0f bytes/model' %
+                        (engine, models, cpu_per_point, memory_per_model))
+
+            if not self.is_engine_metrics:
+                continue
+
+            try:
+                self.dd.post_metric('changefinder.engine.%s.cpu_per_point' % engine, cpu_per_point, host)
+                self.dd.post_metric('changefinder.engine.%s.memory_per_model' % engine, memory_per_model, host)
+                self.dd.post_metric('changefinder.engine.%s.models' % engine, models, host)
+            except Exception as err:
+                logger.error('Failed to post cost of [engine: %s] (%s)' % (engine, err))
+
+    def __report_emitter(self):
+        """Log (and post) backpressure of the emission to fluentd since the previous query.
+
+        """
+        stats = self.emitter.pop_stats()
+
+        logger.info('Emitter: %(sent)d records sent, %(queued)d of %(queue_size)d batches queued '
+                    '(max: %(max_queued)d), %(spilled)d records spilled, %(replayed)d records replayed, '
+                    '%(spill_bytes)d bytes to be replayed, %(dropped)d records dropped, '
+                    '%(failures)d failed attempts' % stats)
+
+        if not self.is_emitter_metrics:
+            return
+
+        host = socket.gethostname()
+        for key in ('queued', 'spill_bytes', 'dropped', 'failures'):
+            try:
+                self.dd.post_metric('changefinder.emitter.%s' % key, stats[key], host)
+            except Exception as err:
+                logger.error('Failed to post backpressure of the emitter (%s)' % err)
                 break
 
-        logger.info('Finish emitting %d records for [%s] (%.3f sec.)' % (len(series), section_name, time.clock() - start))
-
-    def __get_record(self, s, score_outlier, score_change):
-        return {'metric': s['src_metric'],
-                'raw_value': s['raw_value'],
-                'metric_outlier': 'changefinder.outlier.' + s['dst_metric'],
-                'score_outlier': score_outlier,
-                'metric_change': 'changefinder.change.' + s['dst_metric'],
-                'score_change': score_change,
-                'scope': s['scope'],
-                'host': s['host'],
-                'time': int(s['time'] / 1000)}  # same as Ruby's unix time
+    def __handle_series(self, section_name, series):
+        start = time.perf_counter()
+
+        # skip points which have already been handled (e.g. before restoring a checkpoint)
+        last_times = self.models.last_times
+        scopes = [s if (section_name, s.scope) not in last_times else s.after(last_times[(section_name, s.scope)])
+                  for s in series]
+        series = Series([s for s in scopes if len(s) > 0])
+
+        # series of each scope (e.g. host of a `by{host}` query)
+        indices = OrderedDict()
+        for i, s in enumerate(series):
+            indices.setdefault(s.scope, []).append(i)
+
+        # score all points of a scope at once by its own model
+        scores_outlier = [None] * len(series.scopes)
+        scores_change = [None] * len(series.scopes)
+        sigmas = []
+        cpu = 0.0
+
+        is_changefinder = self.dd_sections[section_name]['engine'] == 'changefinder'
+
+        for scope, idx in indices.items():
+            key = (section_name, scope)
+            model = self.models.get(key, partial(self.__create_model, section_name))
+
+            if len(idx) == 1:
+                x = series.scopes[idx[0]].filled_values()
+            else:
+                # several series (e.g. metrics) of the same scope are fed to a model in chronological order
+                merged = Series([series.scopes[i] for i in idx])
+                order = [(i, j) for _, i, j in merged.merge()]
+                x = merged.values()
+
+            cpu_start = time.process_time()
+            outliers, changes = model.update_many(x)
+            cpu += time.process_time() - cpu_start
+
+            if len(idx) == 1:
+                scores_outlier[idx[0]], scores_change[idx[0]] = outliers, changes
+            else:
+                for i in idx:
+                    scores_outlier[i] = np.empty(len(series.scopes[i]))
+                    scores_change[i] = np.empty(len(series.scopes[i]))
+                for n, (i, j) in enumerate(order):
+                    scores_outlier[idx[i]][j], scores_change[idx[i]][j] = outliers[n], changes[n]
+
+            last_times[key] = max(int(series.scopes[i].times[-1]) for i in idx)
+
+            # variance of the model is reliable after enough inputs
+            if is_changefinder and model.n * model.r >= 3:
+                sigmas.append(model.residual_variance())
+
+        self.__check_k(section_name, sigmas)
+
+        n_points = len(series)
+
+        engine = self.dd_sections[section_name]['engine']
+        engine_cpu, engine_points = self.engine_costs.get(engine, (0.0, 0))
+        self.engine_costs[engine] = (engine_cpu + cpu, engine_points + n_points)
+
+        dst_metric, metric_outlier, metric_change = self.dd_sections[section_name]['metrics']
+
+        columns = [(s.metric, s.scope, s.host, (s.times // 1000).tolist(), s.filled_values().tolist(),
+                    np.asarray(scores_outlier[i]).tolist(), np.asarray(scores_change[i]).tolist())
+                   for i, s in enumerate(series)]
+
+        # records of all scopes in chronological order
+        records = []
+        for _, i, j in series.merge():
+            metric, scope, host, times, values, outliers, changes = columns[i]
+            records.append({'metric': metric,
+                            'raw_value': values[j],
+                            'metric_outlier': metric_outlier,
+                            'score_outlier': outliers[j],
+                            'metric_change': metric_change,
+                            'score_change': changes[j],
+                            'scope': scope,
+                            'host': host,
+                            'time': times[j]})  # same as Ruby's unix time
+
+        self.n_emit_failed += self.__emit(section_name, dst_metric, records)
+
+        logger.info('Finish handling %d records for [%s] (%.3f sec.)' % (n_points, section_name, time.perf_counter() - start))
+
+    def __create_model(self, section_name):
+        section = self.dd_sections[section_name]
+        model = create_engine(section['engine'], section['params'])
+
+        # models of a section have the same size
+        if section_name not in self.model_nbytes:
+            self.model_nbytes[section_name] = nbytes(model)
+
+        return model
+
+    def __emit(self, section_name, dst_metric, records):
+        """Enqueue records for emission to fluentd in batches of at most `fluent_batch_size` records.
+        Batches are only dropped if both the queue and the spill file are unavailable,
+        and exactly which records were dropped is logged.
+
+        Returns:
+            int: Number of dropped records.
+
+        """
+        n_failed = 0
+
+        for i in range(0, len(records), self.fluent_batch_size):
+            batch = records[i:(i + self.fluent_batch_size)]
+            if self.emitter.put(dst_metric, batch):
+                continue
+
+            n_failed += len(batch)
+
+            # records are in chronological order; the batch is the range between its first and last records
+            first, last = batch[0], batch[-1]
+            logger.error('Dropped records #%d-#%d of %d for [%s] from (%s, %d) to (%s, %d) since the emission queue is full' %
+                         (i, i + len(batch) - 1, len(records), section_name,
+                          first['scope'], first['time'], last['scope'], last['time']))
+
+        return n_failed
@@ -1,6 +1,7 @@
 import numpy as np
 
-from .utils import aryule_levinson
+from .utils import autocovariances, aryule_levinson_orders
+from .backend import get_backend
 
 from logging import getLogger
 logger = getLogger('ChangeFinder')
@@ -8,16 +9,18 @@ logger = getLogger('ChangeFinder')
 
 class AR_1D:
 
-    def __init__(self, k):
+    def __init__(self, k, backend=None):
         """AR(k): k-th order AR model.
         cf. https://www.computer.org/cms/dl/trans/tk/2006/04/extras/k0482s.pdf
 
         Args:
             k (int): Order of the AR model.
+            backend (str): Kernel backend; `auto`, `numpy`, `numba` or None (i.e. default backend).
 
         """
 
         self.k = k
+        self.backend = get_backend(backend)
 
         # initialize the parameters
         self.mu = self.sigma = 0.0
@@ -32,23 +35,11 @@ class AR_1D:
             x (numpy array): all t data points (1, ..., t).
 
         """
-        t = x.size
-
-        # estimate mu
-        self.mu = 0
-        for i in range(self.k, t):
-            self.mu += x[i]
-        self.mu /= (t - self.k)
-
-        # create c (coefficients of the Yule-Walker equation)
-        self.c = np.zeros(self.k + 1)
-        for j in range(self.k + 1):
-            for i in range(self.k, t):
-                self.c[j] += ((x[i] - self.mu) * (x[i - j] - self.mu))
-            self.c[j] /= (t - self.k)
+        # estimate mu and create c (coefficients of the Yule-Walker equation)
+        self.mu, self.c = self.backend.autocovariance(x, self.k)
 
         # solve the Yule-Walker equation
-        a = aryule_levinson(self.c, self.k)
+        a = self.backend.aryule_levinson(self.c, self.k)
 
         # estimate sigma
         self.sigma = self.c[0]
@@ -67,26 +58,85 @@ class ModelSelection:
         """
         self.max_k = max_k
 
+    def estimate(self, x):
+        """Estimate the AR(1), ..., AR(max_k) models in a single pass.
+        Each AR(k) model is estimated in the same way as `AR_1D(k).estimate(x)`.
+
+        Args:
+            x (numpy array): all t data points (1, ..., t).
+
+        Returns:
+            (numpy array, numpy array): AIC and `sigma` for k = 1, ..., min(t - 1, max_k).
+
+        """
+        max_k = min(x.size - 1, self.max_k)
+        if max_k < 1:
+            return np.zeros(0), np.zeros(0)
+
+        _, C = autocovariances(x, max_k)
+        sigma = aryule_levinson_orders(C)
+
+        # sigma could be negative/zero
+        v = np.maximum(2 * np.pi * sigma, 1e-100)
+        return x.size * (np.log(v) + 1) + 2 * (np.arange(1, max_k + 1) + 1), sigma
+
+    def estimate_many(self, xs):
+        """Estimate the AR(1), ..., AR(max_k) models of several series (e.g. scopes of a query),
+        each of which is modeled independently with the same k.
+        Series shorter than the longest possible k are ignored.
+
+        Args:
+            xs (list of numpy array): Data points of each series.
+
+        Returns:
+            (numpy array, numpy array): Sum of AIC and mean of `sigma` over the series
+                for k = 1, ..., min(t - 1, max_k), where t is the size of the longest series.
+
+        """
+        max_k = min(max([x.size for x in xs], default=0) - 1, self.max_k)
+        if max_k < 1:
+            return np.zeros(0), np.zeros(0)
+
+        estimates = [self.estimate(x) for x in xs if x.size > max_k]
+        return np.sum([aic for aic, _ in estimates], axis=0), np.mean([sigma for _, sigma in estimates], axis=0)
+
+    def aic(self, x):
+        """Compute AIC of the AR(1), ..., AR(max_k) models in a single pass.
+
+        Args:
+            x (numpy array): all t data points (1, ..., t).
+
+        Returns:
+            numpy array: AIC for k = 1, ..., min(t - 1, max_k).
+
+        """
+        return self.estimate(x)[0]
+
     def select(self, x):
         """For the given data points, select the best model based on AIC.
 
         Args:
             x (numpy array): all t data points (1, ..., t).
 
+        Returns:
+            (int, float): Selected k, and its AIC.
+
         """
-        selected_k = 1
-        min_aic = np.inf
+        return self.argmin(self.aic(x))
 
-        for k in range(1, min(x.size, self.max_k + 1)):
-            ar = AR_1D(k)
-            ar.estimate(x)
+    @staticmethod
+    def argmin(aic):
+        """Select the best model from an AIC curve.
 
-            # sigma could be negative/zero
-            v = max(2 * np.pi * ar.sigma, 1e-100)
-            aic = x.size * (np.log(v) + 1) + 2 * (k + 1)
+        Args:
+            aic (numpy array): AIC for k = 1, 2, ...
+
+        Returns:
+            (int, float): Selected k, and its AIC.
 
-            if aic < min_aic:
-                selected_k = k
-                min_aic = aic
+        """
+        if len(aic) == 0:
+            return 1, np.inf
 
-        return selected_k, min_aic
+        k = int(np.argmin(aic))
+        return k + 1, aic[k]
@@ -0,0 +1,131 @@
+import os
+import numpy as np
+
+from . import utils
+
+from logging import getLogger
+logger = getLogger('ChangeFinder')
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+class NumpyBackend:
+
+    name = 'numpy'
+
+    def __init__(self):
+        """Pure Python/NumPy kernels; always available.
+
+        """
+        self.autocovariance = utils.autocovariance
+        self.aryule_levinson = utils.aryule_levinson
+        self.aryule_levinson_inplace = utils.aryule_levinson_inplace
+        self.aryule_levinson_batch = utils.aryule_levinson_batch
+        self.arburg = utils.arburg
+        self.arburg_batch = utils.arburg_batch
+
+
+class NumbaBackend:
+
+    name = 'numba'
+
+    def __init__(self):
+        """JIT-compiled kernels; the same loops as `NumpyBackend` are compiled by numba.
+
+        """
+        if numba is None:
+            raise ImportError('numba is not installed')
+
+        jit = numba.njit(cache=True)
+
+        self.autocovariance = jit(utils.autocovariance)
+        self.aryule_levinson = jit(utils.aryule_levinson)
+        self.aryule_levinson_inplace = jit(utils.aryule_levinson_inplace)
+        self.arburg = jit(utils.arburg)
+
+        aryule_levinson = self.aryule_levinson
+
+        @jit
+        def aryule_levinson_batch(C, k):
+            a = np.empty((C.shape[0], k))
+            for i in range(C.shape[0]):
+                a[i] = aryule_levinson(C[i], k)
+            return a
+
+        self.aryule_levinson_batch = aryule_levinson_batch
+
+        arburg = self.arburg
+
+        @jit
+        def arburg_batch(X, k):
+            a = np.empty((X.shape[0], k))
+            for i in range(X.shape[0]):
+                a[i] = arburg(X[i], k)
+            return a
+
+        self.arburg_batch = arburg_batch
+
+
+BACKENDS = {'numpy': NumpyBackend, 'numba': NumbaBackend}
+
+# `auto` chooses the JIT-compiled backend if available
+default_backend = os.environ.get('CHANGEFINDER_BACKEND', 'auto')
+
+instances = {}
+
+
+def resolve(name=None):
+    """Return a backend name for the given name.
+
+    Args:
+        name (str): `auto`, `numpy`, `numba` or None (i.e. default backend).
+
+    Returns:
+        str: Name of a concrete backend.
+
+    """
+    name = name or default_backend
+
+    if name == 'auto':
+        return 'numpy' if numba is None else 'numba'
+
+    if name not in BACKENDS:
+        raise ValueError('Unknown kernel backend: %s (choose from auto, %s)' % (name, ', '.join(sorted(BACKENDS))))
+
+    return name
+
+
+def get_backend(name=None):
+    """Return a set of kernels used by `SDAR_1D` and `AR_1D`.
+
+    Args:
+        name (str): `auto`, `numpy`, `numba` or None (i.e. default backend).
+            The default backend is `auto` unless overwritten by `CHANGEFINDER_BACKEND` or `set_default_backend`.
+
+    Returns:
+        NumpyBackend or NumbaBackend.
+
+    """
+    name = resolve(name)
+
+    if name not in instances:
+        instances[name] = BACKENDS[name]()
+        logger.info('Kernel backend `%s` is loaded' % name)
+
+    return instances[name]
+
+
+def set_default_backend(name):
+    """Change the default backend of models created after the call.
+
+    Args:
+        name (str): `auto`, `numpy` or `numba`.
+
+    """
+    global default_backend
+
+    resolve(name)
+    default_backend = name
@@ -1,6 +1,10 @@
 import numpy as np
+from scipy.signal import lfilter
 
-from .utils import aryule_levinson, arburg
+from .utils import logloss, hellinger, scalar_pow
+from .backend import get_backend
+from .levinson import LevinsonSolver
+from .window import Window, strided_windows
 
 from logging import getLogger
 logger = getLogger('ChangeFinder')
@@ -8,7 +12,7 @@ logger = getLogger('ChangeFinder')
 
 class SDAR_1D:
 
-    def __init__(self, r, k, is_yule=True):
+    def __init__(self, r, k, is_yule=True, backend=None, warm_start=False):
         """Train a AR(k) model by using the SDAR algorithm (1d points only).
 
         Args:
@@ -16,12 +20,17 @@ class SDAR_1D:
             k (int): Order of the AR model.
             is_yule (bool): Estimate the AR model by solving the Yule-Walke eq., or not.
                 If not, estimate it usign the Burg's method.
+            backend (str): Kernel backend; `auto`, `numpy`, `numba` or None (i.e. default backend).
+            warm_start (bool): Let `update` refine the previous AR parameters instead of solving
+                the Yule-Walker equation from scratch (approximate; see `LevinsonSolver`).
 
         """
 
         self.r = r
         self.k = k
         self.is_yule = is_yule
+        self.backend = get_backend(backend)
+        self.solver = LevinsonSolver(k, backend, warm_start)
 
         # initialize the parameters
         self.mu = self.sigma = 0.0
@@ -39,22 +48,37 @@ class SDAR_1D:
 
         """
         assert xs.size >= self.k, 'size of xs must be greater or equal to the order of the AR model.'
+        return self.update_reversed(x, xs[::-1][:self.k])
 
+    def update_reversed(self, x, xs_rev):
+        """Update the current AR model with past points in reverse chronological order.
+
+        Args:
+            x (float): A new 1d point (t).
+            xs_rev (numpy array): `k` past points (t-1, ..., t-k); typically `Window.reversed_view()`.
+
+        Returns:
+            float: Latest PDF for the given series.
+
+        """
         # estimate mu
         self.mu = (1 - self.r) * self.mu + self.r * x
 
+        # centered past points; shared by the c update and the prediction
+        xs_centered = xs_rev - self.mu
+
         if self.is_yule:
             # update c (coefficients of the Yule-Walker equation)
             self.c[0] = (1 - self.r) * self.c[0] + self.r * (x - self.mu) * (x - self.mu)  # c_0: x_t = x_{t-j}
-            self.c[1:] = (1 - self.r) * self.c[1:] + self.r * (x - self.mu) * (xs[::-1][:self.k] - self.mu)
+            self.c[1:] = (1 - self.r) * self.c[1:] + self.r * (x - self.mu) * xs_centered
 
             # a_1, ..., a_k
-            a = aryule_levinson(self.c, self.k)
+            a = self.solver.solve(self.c)
         else:
-            a = arburg(np.append(x, xs[::-1][:self.k]), self.k)
+            a = self.backend.arburg(np.append(x, xs_rev), self.k)
 
         # estimate x
-        x_hat = np.dot(a, (xs[::-1][:self.k] - self.mu)) + self.mu
+        x_hat = np.dot(a, xs_centered) + self.mu
 
         # estimate sigma
         self.sigma = (1 - self.r) * self.sigma + self.r * (x - x_hat) ** 2
@@ -67,10 +91,74 @@ class SDAR_1D:
         denominator = (2 * np.pi) ** 0.5 * (self.sigma) ** 0.5
         return numerator / denominator
 
+    def update_many(self, x, xs):
+        """Update the current AR model by n new points at once.
+        The resulting state is the same as calling `update` for each point in order.
+
+        Since mu, c and sigma are exponentially weighted averages whose inputs only depend on
+        the data points, every recursion is solved for all points by a linear filter, and
+        the AR parameters of all points are estimated by `aryule_levinson_batch` or `arburg_batch`.
+
+        Args:
+            x (numpy array): n new 1d points (t, ..., t+n-1).
+            xs (numpy array): `k` past points (..., t-k, ..., t-1).
+
+        Returns:
+            (numpy array, numpy array, numpy array): PDFs, mu and sigma after each point.
+
+        """
+        assert xs.size >= self.k, 'size of xs must be greater or equal to the order of the AR model.'
+
+        n = x.size
+        if n == 0:
+            return np.zeros(0), np.zeros(0), np.zeros(0)
+
+        # exponentially weighted average: y_t = (1 - r) y_{t-1} + r x_t
+        b, a = [self.r], [1.0, -(1 - self.r)]
+
+        # i-th row: past points of x[i] in reverse chronological order (t+i-1, ..., t+i-k)
+        xs_rev = strided_windows(np.append(xs[xs.size - self.k:], x[:-1]), self.k)[:, ::-1]
+
+        # estimate mu
+        mu, _ = lfilter(b, a, x, zi=[(1 - self.r) * self.mu])
+
+        xs_centered = np.subtract(xs_rev, mu[:, None], order='C')
+
+        if self.is_yule:
+            # update c (coefficients of the Yule-Walker equation)
+            w = self.r * (x - mu)
+            v = np.empty((n, self.k + 1))
+            v[:, 0] = w * (x - mu)
+            v[:, 1:] = w[:, None] * xs_centered
+            c, _ = lfilter([1.0], a, v, axis=0, zi=((1 - self.r) * self.c)[None, :])
+            self.c[:] = c[-1]
+
+            # a_1, ..., a_k for each point
+            coefs = self.backend.aryule_levinson_batch(c, self.k)
+        else:
+            coefs = self.backend.arburg_batch(np.column_stack((x, xs_rev)), self.k)
+
+        # estimate x
+        x_hat = np.matmul(coefs[:, None, :], xs_centered[:, :, None])[:, 0, 0] + mu
+
+        # estimate sigma; powers are the same as `update_reversed` to the last bit
+        e2 = scalar_pow(x - x_hat, 2)
+        sigma, _ = lfilter(b, a, e2, zi=[(1 - self.r) * self.sigma])
+
+        self.mu, self.sigma = mu[-1], sigma[-1]
+
+        # compute the values of probability density function
+        with np.errstate(divide='ignore', invalid='ignore'):
+            numerator = np.exp(-0.5 * e2 / sigma)
+            denominator = (2 * np.pi) ** 0.5 * scalar_pow(sigma, 0.5)
+            p = np.where(sigma == 0.0, 0.0, numerator / denominator)
+
+        return p, mu, sigma
+
 
 class ChangeFinder:
 
-    def __init__(self, r, k, T1, T2, is_yule=True, is_logloss=True):
+    def __init__(self, r, k, T1, T2, is_yule=True, is_logloss=True, backend=None, warm_start=False):
         """ChangeFinder.
 
         Args:
@@ -81,6 +169,10 @@ class ChangeFinder:
             is_yule (bool): Estimate the AR model by solving the Yule-Walke eq., or not.
                 If not, estimate it usign the Burg's method.
             is_logloss (bool): Compute anomaly scores based on LogLoss or the Hellinger distance.
+            backend (str): Kernel backend; `auto`, `numpy`, `numba` or None (i.e. default backend).
+            warm_start (bool): Let `update` refine the previous AR parameters instead of solving
+                the Yule-Walker equation from scratch (approximate; see `LevinsonSolver`).
+                `update_many` always solves the equation exactly.
 
         """
 
@@ -91,16 +183,20 @@ class ChangeFinder:
         self.T1 = T1
         self.T2 = T2
 
-        self.xs = np.zeros(k)
-        self.outliers = np.zeros(T1)
-        self.sdar_outlier = SDAR_1D(r, k, is_yule)
+        # fixed-size windows; initially filled by zeros
+        self.xs = Window(k)
+        self.outliers = Window(T1)
+        self.sdar_outlier = SDAR_1D(r, k, is_yule, backend, warm_start)
 
-        self.ys = np.zeros(k)
-        self.changes = np.zeros(T2)
-        self.sdar_change = SDAR_1D(r / 2, k, is_yule)
+        self.ys = Window(k)
+        self.changes = Window(T2)
+        self.sdar_change = SDAR_1D(r / 2, k, is_yule, backend, warm_start)
 
         self.is_logloss = is_logloss
 
+        # number of inputs since the models are created or restored
+        self.n = 0
+
     def update(self, x):
         """Update AR models based on 1d input x.
 
@@ -114,71 +210,156 @@ class ChangeFinder:
 
         # Stage 1: Outlier Detection (SDAR #1)
         if self.is_logloss:
-            p = self.sdar_outlier.update(x, self.xs)
+            p = self.sdar_outlier.update_reversed(x, self.xs.reversed_view())
             outlier = self.__logloss(p)
         else:
             prev_mu, prev_sigma = self.sdar_outlier.mu, self.sdar_outlier.sigma
-            self.sdar_outlier.update(x, self.xs)
+            self.sdar_outlier.update_reversed(x, self.xs.reversed_view())
             outlier = self.__hellinger(prev_mu, prev_sigma,
                                        self.sdar_outlier.mu, self.sdar_outlier.sigma)
             outlier *= 100
 
-        self.outliers = self.__append(self.outliers, outlier, self.T1)
+        self.outliers.append(outlier)
 
-        self.xs = self.__append(self.xs, x, self.k)
+        self.xs.append(x)
 
         # Smoothing when we have enough (>T) first scores
-        y = self.__smooth(self.outliers)
+        y = self.outliers.mean()
 
         # Stage 2: Change Point Detection (SDAR #2)
         if self.is_logloss:
-            p = self.sdar_change.update(y, self.ys)
+            p = self.sdar_change.update_reversed(y, self.ys.reversed_view())
             change = self.__logloss(p)
         else:
             prev_mu, prev_sigma = self.sdar_change.mu, self.sdar_change.sigma
-            self.sdar_change.update(y, self.ys)
+            self.sdar_change.update_reversed(y, self.ys.reversed_view())
             change = self.__hellinger(prev_mu, prev_sigma,
                                       self.sdar_change.mu, self.sdar_change.sigma)
             change *= 100
 
-        self.changes = self.__append(self.changes, change, self.T2)
+        self.changes.append(change)
+
+        self.ys.append(y)
 
-        self.ys = self.__append(self.ys, y, self.k)
+        self.n += 1
 
         # Return outlier and change point scores
-        return outlier, self.__smooth(self.changes)
+        return outlier, self.changes.mean()
 
-    def __append(self, window, x, window_size):
-        """Insert a sample x into a fix-sized window.
+    def update_many(self, xs):
+        """Update AR models based on n 1d inputs at once.
+        Scores and the resulting state are the same as calling `update` for each input in order.
 
         Args:
-            window (numpy array): Fixed sized window.
-            x (float): A sample value.
-            window_size (int): Maximum size of the window.
+            xs (numpy array): 1d input values.
 
         Returns:
-            numpy array: An updated window.
+            (numpy array, numpy array): (Outlier scores, Change point scores).
 
         """
-        window = np.append(window, x)
+        xs = np.asarray(xs, dtype=np.float64)
+        self.n += xs.size
 
-        # delete oldest point
-        if window.size > window_size:
-            window = np.delete(window, 0)
+        # Stage 1: Outlier Detection (SDAR #1)
+        outliers = self.__score_many(self.sdar_outlier, xs, self.xs)
+
+        # Smoothing when we have enough (>T) first scores
+        ys = self.__smooth_many(self.outliers, outliers)
+
+        # Stage 2: Change Point Detection (SDAR #2)
+        changes = self.__score_many(self.sdar_change, ys, self.ys)
+
+        # Return outlier and change point scores
+        return outliers, self.__smooth_many(self.changes, changes)
+
+    def residual_variance(self):
+        """Return the current variance of prediction errors of the outlier detection stage.
+        Since the variance is discounted from zero, it is corrected by the weight of seen inputs.
+
+        Returns:
+            float: Variance comparable with `sigma` of the batch AR model (`AR_1D`).
+
+        """
+        if self.n == 0:
+            return 0.0
+        return self.sdar_outlier.sigma / (1 - (1 - self.r) ** self.n)
+
+    def get_state(self):
+        """Return the current state of the models as a 1d array.
+
+        Returns:
+            numpy array: [mu, sigma, c (k + 1)] of the two SDAR models followed by
+                the windows `xs` (k), `outliers` (T1), `ys` (k) and `changes` (T2), and `n`.
+
+        """
+        return np.concatenate(([self.sdar_outlier.mu, self.sdar_outlier.sigma], self.sdar_outlier.c,
+                               [self.sdar_change.mu, self.sdar_change.sigma], self.sdar_change.c,
+                               self.xs.view(), self.outliers.view(), self.ys.view(), self.changes.view(),
+                               [self.n]))
+
+    def set_state(self, state):
+        """Restore the state of the models returned by `get_state`.
+
+        Args:
+            state (numpy array): State of a ChangeFinder with the same hyperparameters.
+
+        """
+        k, T1, T2 = self.k, self.T1, self.T2
+        assert state.size == 2 * (k + 3) + 2 * k + T1 + T2 + 1, 'size of the state does not match the hyperparameters.'
+
+        state = np.array(state, dtype=np.float64)
+        i = 0
+
+        for sdar in [self.sdar_outlier, self.sdar_change]:
+            sdar.mu, sdar.sigma = state[i], state[i + 1]
+            sdar.c[:] = state[(i + 2):(i + k + 3)]
+            sdar.solver.is_warm = False
+            i += k + 3
+
+        for window in [self.xs, self.outliers, self.ys, self.changes]:
+            window.extend(state[i:(i + window.size)])
+            i += window.size
+
+        # weight of seen inputs for `residual_variance`
+        self.n = int(state[i])
+
+    def __score_many(self, sdar, x, window):
+        """Update a SDAR model by n inputs, and return their scores.
+
+        Args:
+            sdar (SDAR_1D): Target model.
+            x (numpy array): n 1d inputs.
+            window (Window): Past inputs of the model; updated by `x`.
+
+        Returns:
+            numpy array: n scores.
+
+        """
+        prev_mu, prev_sigma = sdar.mu, sdar.sigma
+        p, mu, sigma = sdar.update_many(x, window.view())
+        window.extend(x)
+
+        if self.is_logloss:
+            return logloss(p)
 
-        return window
+        prev_mu = np.append(prev_mu, mu[:-1])
+        prev_sigma = np.append(prev_sigma, sigma[:-1])
+        return hellinger(prev_mu, prev_sigma, mu, sigma) * 100
 
-    def __smooth(self, window):
-        """Return a smoothed value of the current window.
+    def __smooth_many(self, window, scores):
+        """Insert n scores into a window, and return smoothed values after each insertion.
 
         Args:
-            window (numpy array): Fixed sized window.
+            window (Window): Fixed sized window.
+            scores (numpy array): n scores.
 
         Returns:
-            float: A smoothed value of the given window.
+            numpy array: n smoothed values.
 
         """
-        return np.mean(window)
+        ys = np.mean(strided_windows(np.append(window.view(), scores), len(window)), axis=1)[1:]
+        window.extend(scores)
+        return ys
 
     def __logloss(self, p):
         """Return LogLoss for a given PDF p.
@@ -0,0 +1,202 @@
+import numpy as np
+
+from .utils import logloss, hellinger, scalar_pow
+from .backend import get_backend
+from .window import Window
+
+from logging import getLogger
+logger = getLogger('ChangeFinder')
+
+
+class SDARBank:
+
+    def __init__(self, n, r, k, is_yule=True, backend=None):
+        """N independent AR(k) models trained by the SDAR algorithm (1d points only).
+        Each row of the parameters corresponds to a `SDAR_1D` model.
+
+        Args:
+            n (int): Number of models.
+            r (float): Discounting parameter.
+            k (int): Order of the AR models.
+            is_yule (bool): Estimate the AR models by solving the Yule-Walke eq., or not.
+                If not, estimate them usign the Burg's method.
+            backend (str): Kernel backend; `auto`, `numpy`, `numba` or None (i.e. default backend).
+
+        """
+
+        self.n = n
+        self.r = r
+        self.k = k
+        self.is_yule = is_yule
+        self.backend = get_backend(backend)
+
+        # initialize the parameters
+        self.mu = np.zeros(n)
+        self.sigma = np.zeros(n)
+        self.c = np.zeros((n, k + 1))
+
+    def update(self, x, xs_rev):
+        """Update the current AR models by one new point for each model.
+
+        Args:
+            x (numpy array): n new 1d points (t).
+            xs_rev (numpy array): n * k past points (t-1, ..., t-k) of each model.
+
+        Returns:
+            numpy array: Latest PDFs for the n series.
+
+        """
+        # estimate mu
+        self.mu = (1 - self.r) * self.mu + self.r * x
+
+        # contiguous rows are required to compute the same dot products as `SDAR_1D`
+        xs_centered = np.subtract(xs_rev, self.mu[:, None], order='C')
+
+        if self.is_yule:
+            # update c (coefficients of the Yule-Walker equation)
+            w = self.r * (x - self.mu)
+            self.c[:, 0] = (1 - self.r) * self.c[:, 0] + w * (x - self.mu)
+            self.c[:, 1:] = (1 - self.r) * self.c[:, 1:] + w[:, None] * xs_centered
+
+            # a_1, ..., a_k for each model
+            a = self.backend.aryule_levinson_batch(self.c, self.k)
+        else:
+            a = self.backend.arburg_batch(np.column_stack((x, xs_rev)), self.k)
+
+        # estimate x
+        x_hat = np.matmul(a[:, None, :], xs_centered[:, :, None])[:, 0, 0] + self.mu
+
+        # estimate sigma
+        e2 = scalar_pow(x - x_hat, 2)
+        self.sigma = (1 - self.r) * self.sigma + self.r * e2
+
+        # compute and return the values of probability density function
+        with np.errstate(divide='ignore', invalid='ignore'):
+            numerator = np.exp(-0.5 * e2 / self.sigma)
+            denominator = (2 * np.pi) ** 0.5 * scalar_pow(self.sigma, 0.5)
+            return np.where(self.sigma == 0.0, 0.0, numerator / denominator)
+
+
+class ChangeFinderBank:
+
+    def __init__(self, n, r, k, T1, T2, is_yule=True, is_logloss=True, backend=None):
+        """N independent ChangeFinder models which share the hyperparameters.
+        All models are advanced by a single vectorized update for each timestamp,
+        and the scores of each model are the same as a scalar `ChangeFinder`.
+
+        Args:
+            n (int): Number of models (i.e. series).
+            r (float): Discounting parameter.
+            k (int): Order of the AR model (i.e. consider a AR(k) process).
+            T1 (int): Window size for the simple moving average of outlier scores.
+            T2 (int): Window size to compute a change point score.
+            is_yule (bool): Estimate the AR model by solving the Yule-Walke eq., or not.
+                If not, estimate it usign the Burg's method.
+            is_logloss (bool): Compute anomaly scores based on LogLoss or the Hellinger distance.
+            backend (str): Kernel backend; `auto`, `numpy`, `numba` or None (i.e. default backend).
+
+        """
+
+        assert k > 0, 'k must be 1 or more.'
+
+        self.n = n
+        self.r = r
+        self.k = k
+        self.T1 = T1
+        self.T2 = T2
+
+        # fixed-size windows for each model; initially filled by zeros
+        self.xs = Window(k, n)
+        self.outliers = Window(T1, n)
+        self.sdar_outlier = SDARBank(n, r, k, is_yule, backend)
+
+        self.ys = Window(k, n)
+        self.changes = Window(T2, n)
+        self.sdar_change = SDARBank(n, r / 2, k, is_yule, backend)
+
+        self.is_logloss = is_logloss
+
+        # number of inputs (timestamps) since the models are created
+        self.n_inputs = 0
+
+    def update(self, x):
+        """Update AR models based on one 1d input for each model.
+
+        Args:
+            x (numpy array): n 1d input values.
+
+        Returns:
+            (numpy array, numpy array): (n outlier scores, n change point scores).
+
+        """
+        x = np.asarray(x, dtype=np.float64)
+        assert x.shape == (self.n,), 'one input is required for each model.'
+
+        # Stage 1: Outlier Detection (SDAR #1)
+        outlier = self.__score(self.sdar_outlier, x, self.xs)
+        self.outliers.append(outlier)
+        self.xs.append(x)
+
+        # Smoothing when we have enough (>T) first scores
+        y = self.outliers.mean()
+
+        # Stage 2: Change Point Detection (SDAR #2)
+        change = self.__score(self.sdar_change, y, self.ys)
+        self.changes.append(change)
+        self.ys.append(y)
+
+        self.n_inputs += 1
+
+        # Return outlier and change point scores
+        return outlier, self.changes.mean()
+
+    def update_many(self, X):
+        """Update AR models by t inputs for each model.
+
+        Args:
+            X (numpy array): t * n 1d input values; i-th row is passed to `update` at i-th step.
+
+        Returns:
+            (numpy array, numpy array): (t * n outlier scores, t * n change point scores).
+
+        """
+        X = np.asarray(X, dtype=np.float64)
+
+        outliers = np.empty_like(X)
+        changes = np.empty_like(X)
+
+        for i in range(X.shape[0]):
+            outliers[i], changes[i] = self.update(X[i])
+
+        return outliers, changes
+
+    def residual_variance(self):
+        """Return the current variances of prediction errors of the outlier detection stage,
+        corrected by the weight of seen inputs in the same way as `ChangeFinder.residual_variance`.
+
+        Returns:
+            numpy array: n variances.
+
+        """
+        if self.n_inputs == 0:
+            return np.zeros(self.n)
+        return self.sdar_outlier.sigma / (1 - (1 - self.r) ** self.n_inputs)
+
+    def __score(self, sdar, x, window):
+        """Update SDAR models by n inputs, and return their scores.
+
+        Args:
+            sdar (SDARBank): Target models.
+            x (numpy array): n 1d inputs.
+            window (Window): Past inputs of the models.
+
+        Returns:
+            numpy array: n scores.
+
+        """
+        if self.is_logloss:
+            return logloss(sdar.update(x, window.reversed_view()))
+
+        prev_mu, prev_sigma = sdar.mu, sdar.sigma
+        sdar.update(x, window.reversed_view())
+        return hellinger(prev_mu, prev_sigma, sdar.mu, sdar.sigma) * 100
@@ -0,0 +1,117 @@
+import numpy as np
+import numpy.linalg as ln
+from numpy.lib.stride_tricks import as_strided
+
+from .backend import get_backend
+
+
+class LevinsonSolver:
+
+    def __init__(self, k, backend=None, warm_start=False, tol=1e-6, max_iter=None):
+        """Yule-Walker equation solver which owns its work buffers.
+
+        By default, the equation is exactly solved by `aryule_levinson_inplace` for every call.
+        If `warm_start` is True, the previous solution is refined by at most `max_iter` iterations of
+        the conjugate gradient method instead, since the coefficients `c` of a SDAR model only change slightly
+        between consecutive points when `r` is small. The exact recursion is used as a fallback when
+        the refined solution does not converge, or the previous equation was degenerate.
+        Refinement only pays off when the exact recursion is expensive (i.e. large `k` on the `numpy` backend).
+
+        Args:
+            k (int): Assuming the AR(k) model.
+            backend (str): Kernel backend; `auto`, `numpy`, `numba` or None (i.e. default backend).
+            warm_start (bool): Refine the previous solution rather than solving from scratch.
+            tol (float): Acceptable relative residual of a refined solution.
+            max_iter (int): Max number of the conjugate gradient iterations; `k` by default.
+
+        """
+        self.k = k
+        self.backend = get_backend(backend)
+        self.warm_start = warm_start
+        self.tol = tol
+        self.max_iter = k if max_iter is None else max_iter
+
+        # a_1, ..., a_k and work buffer of the recursion
+        self.a = np.zeros(k)
+        self.a_ = np.zeros(k)
+
+        # [c_{k-1}, ..., c_1, c_0, c_1, ..., c_{k-1}]; k * k Toeplitz matrix is its strided view
+        self.buf = np.zeros(2 * k - 1)
+        self.C = as_strided(self.buf[(k - 1):], shape=(k, k),
+                            strides=(-self.buf.strides[0], self.buf.strides[0]), writeable=False)
+
+        # work buffers of the conjugate gradient method
+        self.r = np.zeros(k)
+        self.p = np.zeros(k)
+        self.Cp = np.zeros(k)
+        self.tmp = np.zeros(k)
+
+        # previous solution is reusable only if the equation was not degenerate
+        self.is_warm = False
+
+        self.n_exact = self.n_refined = 0
+
+    def solve(self, c):
+        """Solve the Yule-Walker equation C a = c for the k model parameters.
+
+        Args:
+            c (numpy array): k + 1 coefficients (i.e. autocorrelation).
+
+        Returns:
+            numpy array: k model parameters. Note that the buffer is overwritten by the next call.
+
+        """
+        if self.warm_start and self.is_warm and c[0] > 0 and self.__refine(c):
+            self.n_refined += 1
+            return self.a
+
+        v = self.backend.aryule_levinson_inplace(c, self.k, self.a, self.a_)
+        self.is_warm = v > 0
+        self.n_exact += 1
+
+        return self.a
+
+    def __refine(self, c):
+        """Refine the previous solution by the conjugate gradient method.
+
+        Args:
+            c (numpy array): k + 1 coefficients (i.e. autocorrelation).
+
+        Returns:
+            boolean: The refined solution converges or not.
+
+        """
+        k = self.k
+
+        # fill the Toeplitz matrix C
+        self.buf[(k - 1):] = c[:k]
+        self.buf[:(k - 1)] = c[(k - 1):0:-1]
+
+        b = c[1:(k + 1)]
+        tol = (self.tol * ln.norm(b)) ** 2
+
+        # r = b - C a, p = r
+        np.dot(self.C, self.a, out=self.Cp)
+        np.subtract(b, self.Cp, out=self.r)
+        self.p[:] = self.r
+        rr = np.dot(self.r, self.r)
+
+        for i in range(self.max_iter):
+            if rr <= tol:
+                break
+
+            np.dot(self.C, self.p, out=self.Cp)
+            pCp = np.dot(self.p, self.Cp)
+            if pCp <= 0:
+                return False
+
+            alpha = rr / pCp
+            self.a += np.multiply(self.p, alpha, out=self.tmp)
+            self.r -= np.multiply(self.Cp, alpha, out=self.tmp)
+
+            rr_next = np.dot(self.r, self.r)
+            self.p *= (rr_next / rr)
+            self.p += self.r
+            rr = rr_next
+
+        return bool(rr <= tol)
@@ -3,6 +3,84 @@ import numpy.linalg as ln
 from scipy.linalg import toeplitz
 
 
+def autocovariance(x, k):
+    """Estimate the mean and autocovariances of x for the AR(k) model.
+
+    Args:
+        x (numpy array): all t data points (1, ..., t).
+        k (int): Assuming the AR(k) model
+
+    Returns:
+        (float, numpy array): Mean and k + 1 autocovariances (i.e. coefficients of the Yule-Walker equation).
+
+    """
+    t = x.size
+
+    # estimate mu
+    mu = 0.0
+    for i in range(k, t):
+        mu += x[i]
+    mu /= (t - k)
+
+    # create c (coefficients of the Yule-Walker equation)
+    c = np.zeros(k + 1)
+    for j in range(k + 1):
+        for i in range(k, t):
+            c[j] += ((x[i] - mu) * (x[i - j] - mu))
+        c[j] /= (t - k)
+
+    return mu, c
+
+
+def autocovariances(x, k):
+    """Estimate the means and autocovariances of x for all of the AR(1), ..., AR(k) models at once.
+    i-th row is the same estimate as `autocovariance(x, i + 1)` (up to rounding errors),
+    but all lag products are computed by a single FFT instead of nested loops.
+
+    Args:
+        x (numpy array): all t data points (1, ..., t).
+        k (int): Max order of the AR models (less than t).
+
+    Returns:
+        (numpy array, numpy array): k means, and k * (k + 1) autocovariances.
+            Autocovariances of the AR(i) model are in `[i - 1, :(i + 1)]`, and the rest is zero.
+
+    """
+    t = x.size
+
+    # estimates are shift-invariant; center x for numerical stability
+    offset = np.mean(x)
+    y = x - offset
+
+    # P[j] = sum_{i=j}^{t-1} y_i y_{i-j}
+    n = 1 << int(np.ceil(np.log2(2 * t - 1)))
+    f = np.fft.rfft(y, n)
+    P = np.fft.irfft(f * np.conj(f), n)[:(k + 1)]
+
+    # AR(i) model only uses the products for i <= (index of y_i); subtract the first ones
+    # Q[i - 1, j] = sum_{l=j}^{i-1} y_l y_{l-j}
+    L = np.zeros((k, k + 1))
+    for j in range(k):
+        L[j:, j] = y[j:k] * y[:(k - j)]
+    S = P - np.cumsum(L, axis=0)
+
+    ks = np.arange(1, k + 1)[:, None]
+    js = np.arange(k + 1)
+
+    # A[i - 1] = sum_{l=i}^{t-1} y_l, B[i - 1, j] = sum_{l=i}^{t-1} y_{l-j}
+    cs = np.concatenate(([0.0], np.cumsum(y)))
+    A = cs[t] - cs[ks]
+    B = cs[t - js] - cs[np.maximum(ks - js, 0)]
+
+    m = t - ks
+    mu = A / m
+
+    # sum_{l=i}^{t-1} (y_l - mu) (y_{l-j} - mu) / (t - i)
+    C = (S - mu * (A + B) + m * np.square(mu)) / m
+
+    return mu[:, 0] + offset, np.where(js <= ks, C, 0.0)
+
+
 def aryule(c, k):
     """Solve Yule-Walker equation.
 
@@ -67,53 +145,293 @@ def aryule_levinson(c, k):
     return a_
 
 
+def aryule_levinson_inplace(c, k, a, a_):
+    """Levinson-Durbin recursion on preallocated buffers.
+    The same operations as `aryule_levinson` are performed without allocating any array.
+
+    Args:
+        c (numpy array): Coefficients (i.e. autocorrelation)
+        k (int): Assuming the AR(k) model
+        a (numpy array): Buffer of size k; overwritten by the k model parameters.
+        a_ (numpy array): Work buffer of size k.
+
+    Returns:
+        float: Prediction error variance of the AR(k) model; 0 if the equation is degenerate.
+
+    """
+    for i in range(k):
+        a[i] = 0.0
+
+    if c[0] == 0:
+        return 0.0
+
+    # recursively solve the Yule-Walker equation
+    g = -c[1] / c[0]
+    a[0] = g
+    v = c[0] * (1 - g * g)
+
+    for t in range(1, k):
+        if v == 0:
+            continue
+
+        g = -c[t + 1]
+        for j in range(t):
+            g -= (a[j] * c[t - j])
+        g /= v
+
+        for j in range(t):
+            a_[j] = a[t - 1 - j]
+
+        for j in range(t):
+            a[j] += (g * a_[j])
+        a[t] = g
+
+        v *= (1 - g * g)
+
+    for i in range(k):
+        a[i] = -a[i]
+
+    return v
+
+
+def aryule_levinson_batch(C, k):
+    """Row-wise Levinson-Durbin recursion for many Yule-Walker equations at once.
+
+    Every row is solved with exactly the same floating point operations as `aryule_levinson`.
+
+    Args:
+        C (numpy array): n * (k + 1) coefficients; each row is `c` of `aryule_levinson`.
+        k (int): Assuming the AR(k) model
+
+    Returns:
+        numpy array: n * k model parameters.
+
+    """
+    n = C.shape[0]
+    a = np.zeros((n, k))
+
+    if n == 0:
+        return a
+
+    # rows with c[0] == 0 are left as zeros
+    valid = C[:, 0] != 0
+    c0 = np.where(valid, C[:, 0], 1.0)
+
+    g = np.where(valid, -C[:, 1] / c0, 0.0)
+    a[:, 0] = g
+    v = C[:, 0] * (1 - g * g)
+
+    for t in range(1, k):
+        # rows with v == 0 skip the remaining stages
+        active = valid & (v != 0)
+        if not np.any(active):
+            break
+
+        g = -C[:, t + 1]
+        for j in range(t):
+            g -= (a[:, j] * C[:, t - j])
+        g /= np.where(active, v, 1.0)
+        g = np.where(active, g, 0.0)
+
+        a_ = a[:, (t - 1)::-1].copy()
+        a[:, :t] = np.where(active[:, None], a[:, :t] + g[:, None] * a_, a[:, :t])
+        a[:, t] = g
+
+        v = np.where(active, v * (1 - g * g), v)
+
+    a = -a
+    a[~valid] = 0.0
+
+    return a
+
+
+def aryule_levinson_orders(C):
+    """Prediction error variances of the AR(1), ..., AR(k) models by the Levinson-Durbin order recursion.
+    Each row is an independent Yule-Walker equation, and the recursion on all rows runs at once.
+
+    Args:
+        C (numpy array): k * (k + 1) coefficients; i-th row is `c` of the AR(i + 1) model (e.g. `autocovariances`).
+
+    Returns:
+        numpy array: k variances; i-th one is for the AR(i + 1) model with i-th row of C.
+
+    """
+    k = C.shape[0]
+
+    a = np.zeros((k, k))
+    v = C[:, 0].copy()
+    variances = np.zeros(k)
+
+    for t in range(k):
+        # degenerate rows are left as they are
+        valid = v != 0
+
+        g = C[:, t + 1] + np.sum(a[:, :t] * C[:, t:0:-1], axis=1)
+        g = np.where(valid, -g / np.where(valid, v, 1.0), 0.0)
+
+        a[:, :t] += g[:, None] * a[:, (t - 1)::-1] if t > 0 else 0.0
+        a[:, t] = g
+        v *= (1 - g * g)
+
+        # order of i-th row reaches (i + 1)
+        variances[t] = v[t]
+
+    return variances
+
+
 def arburg(x, k):
     """MATLAB implementation of the Burg's method.
 
     cf. https://searchcode.com/codesearch/view/9503568/
 
+    The error sequences are updated in place by slices of preallocated buffers, and
+    numerator and denominator of the reflection coefficients are dot products of them.
+
     """
     n = x.size
     # v = sumsq(x)
 
     # f and b are the forward and backward error sequences
     current_errseq_size = n - 1
-    f = np.zeros(current_errseq_size)  # x[1:n]
-    b = np.zeros(current_errseq_size)  # x[:(n - 1)]
-    for i in range(current_errseq_size):
-        f[i] = x[i + 1]
-        b[i] = x[i]
+    f = x[1:].astype(np.float64)  # x[1:n]
+    b = x[:(n - 1)].astype(np.float64)  # x[:(n - 1)]
+    f_ = np.empty(n - 1)
 
     a = np.zeros(k)
+    a_ = np.empty(k)
 
     # remaining stages i=2 to p
     for i in range(k):
 
         # get the i-th reflection coefficient
-        numerator = denominator = 0
-        for j in range(current_errseq_size):
-            numerator += (f[j] * b[j])
-            denominator += (f[j] * f[j] + b[j] * b[j])
-        numerator *= 2
+        fc, bc = f[:current_errseq_size], b[:current_errseq_size]
+        numerator = 2 * np.dot(fc, bc)
+        denominator = np.dot(fc, fc) + np.dot(bc, bc)
 
-        g = 0 if denominator == 0 else numerator / denominator
+        g = 0.0 if denominator == 0 else numerator / denominator
 
         # generate next filter order
-        a_ = np.array([a[j] for j in range(i)])
+        a_[:i] = a[:i]
         a[0] = g
-        for j in range(i):
-            a[j + 1] = a_[j] - g * a_[i - 1 - j]
+        a[1:(i + 1)] = a_[:i] - g * a_[:i][::-1]
 
         # keep track of the error
         # v = v * (1 - g * g)
 
         # update the prediction error sequences
-        f_ = np.array([fi for fi in f])
+        f_[:current_errseq_size] = f[:current_errseq_size]
         next_errseq_size = n - i - 2
-        for j in range(next_errseq_size):
-            f[j] = f_[j + 1] - g * b[j + 1]
-            b[j] = b[j] - g * f_[j]
+        if next_errseq_size > 0:
+            f[:next_errseq_size] = f_[1:(next_errseq_size + 1)] - g * b[1:(next_errseq_size + 1)]
+            b[:next_errseq_size] = b[:next_errseq_size] - g * f_[:next_errseq_size]
 
         current_errseq_size = next_errseq_size
 
-    return np.array([-a[k - 1 - i] for i in range(k)])
+    return -a[::-1]
+
+
+def arburg_batch(X, k):
+    """Burg's method for many windows at once.
+    Every row is estimated with exactly the same floating point operations as `arburg`;
+    dot products of each row are computed by `np.matmul` of (1 x m) and (m x 1) stacks, i.e. by the same
+    dot kernel as `np.dot`.
+
+    Args:
+        X (numpy array): n * m windows; each row is `x` of `arburg`.
+        k (int): Assuming the AR(k) model
+
+    Returns:
+        numpy array: n * k model parameters.
+
+    """
+    n, m = X.shape
+
+    # f and b are the forward and backward error sequences of each window
+    current_errseq_size = m - 1
+    f = X[:, 1:].astype(np.float64)
+    b = X[:, :(m - 1)].astype(np.float64)
+    f_ = np.empty((n, m - 1))
+
+    a = np.zeros((n, k))
+    a_ = np.empty((n, k))
+
+    def dot(A, B):
+        return np.matmul(A[:, None, :], B[:, :, None])[:, 0, 0]
+
+    for i in range(k):
+
+        # get the i-th reflection coefficients
+        fc, bc = f[:, :current_errseq_size], b[:, :current_errseq_size]
+        numerator = 2 * dot(fc, bc)
+        denominator = dot(fc, fc) + dot(bc, bc)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            g = np.where(denominator == 0, 0.0, numerator / denominator)
+
+        # generate next filter order
+        a_[:, :i] = a[:, :i]
+        a[:, 0] = g
+        a[:, 1:(i + 1)] = a_[:, :i] - g[:, None] * a_[:, :i][:, ::-1]
+
+        # update the prediction error sequences
+        f_[:, :current_errseq_size] = f[:, :current_errseq_size]
+        next_errseq_size = m - i - 2
+        if next_errseq_size > 0:
+            f[:, :next_errseq_size] = f_[:, 1:(next_errseq_size + 1)] - g[:, None] * b[:, 1:(next_errseq_size + 1)]
+            b[:, :next_errseq_size] = b[:, :next_errseq_size] - g[:, None] * f_[:, :next_errseq_size]
+
+        current_errseq_size = next_errseq_size
+
+    return -a[:, ::-1]
+
+
+def scalar_pow(x, y):
+    """`x ** y` (element-wise) computed by libm `pow` as for a numpy scalar, so that scores of a batch are
+    the same as the ones of `update` point by point; `**` of an array takes other routes (e.g. `sqrt` for 0.5).
+
+    Args:
+        x (numpy array): Bases (non-negative unless y is an integer).
+        y (float): Exponent.
+
+    Returns:
+        numpy array: Powers.
+
+    """
+    x = np.asarray(x, dtype=np.float64)
+    return np.fromiter((v ** y for v in x.ravel().tolist()), dtype=np.float64, count=x.size).reshape(x.shape)
+
+
+def logloss(p):
+    """LogLoss for given PDFs p (element-wise).
+
+    Args:
+        p (numpy array): PDFs.
+
+    Returns:
+        numpy array: LogLoss for p; 0 if p is 0.
+
+    """
+    with np.errstate(divide='ignore'):
+        return np.where(p == 0.0, 0.0, -np.log(p))
+
+
+def hellinger(mu1, sigma1, mu2, sigma2):
+    """The Hellinger distance between two (1x1 multivariate) normal distributions (element-wise).
+
+    Args:
+        mu1 (numpy array): Means of the first distributions.
+        sigma1 (numpy array): Variances of the first distributions.
+        mu2 (numpy array): Means of the second distributions.
+        sigma2 (numpy array): Variances of the second distributions.
+
+    Returns:
+        numpy array: The Hellinger distances; 1 if both variances are 0.
+
+    """
+    s = sigma1 + sigma2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d = 1 - scalar_pow(sigma1, 0.25) * scalar_pow(sigma2, 0.25) * \
+            np.exp(-0.25 * scalar_pow(mu1 - mu2, 2) / s) / scalar_pow(s / 2, 0.5)
+
+    return np.where(s == 0, 1.0, d)
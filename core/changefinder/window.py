@@ -0,0 +1,97 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+def strided_windows(x, size):
+    """Return all sliding windows over a 1d array as a 2d view (no copy).
+
+    Args:
+        x (numpy array): 1d array of n samples.
+        size (int): Window size.
+
+    Returns:
+        numpy array: (n - size + 1) * size view; i-th row is `x[i:(i + size)]`.
+
+    """
+    x = np.ascontiguousarray(x)
+    return as_strided(x, shape=(x.size - size + 1, size),
+                      strides=(x.strides[0], x.strides[0]), writeable=False)
+
+
+class Window:
+
+    def __init__(self, size, n=None, dtype=np.float64):
+        """Fixed-size sliding window backed by a preallocated ring buffer.
+
+        Every sample is written twice (to `i` and `i + size`), so the latest `size`
+        samples are always available as a contiguous slice of the buffer.
+        Appending is O(1) and never allocates a new array.
+
+        Args:
+            size (int): Maximum (and initial) number of samples in the window.
+            n (int): If given, keep `n` windows as rows which slide together.
+            dtype (numpy dtype): Type of the samples.
+
+        """
+        self.size = size
+
+        # window is initially filled by zeros, as `np.zeros(size)` was
+        shape = (2 * size,) if n is None else (n, 2 * size)
+        self.buf = np.zeros(shape, dtype=dtype)
+        self.head = 0
+
+    def append(self, x):
+        """Insert a sample x and drop the oldest one.
+
+        Args:
+            x (float or numpy array): A sample value (one for each row).
+
+        """
+        self.buf[..., self.head] = self.buf[..., self.head + self.size] = x
+
+        self.head += 1
+        if self.head == self.size:
+            self.head = 0
+
+    def extend(self, xs):
+        """Insert samples xs in order, as repeated `append` does.
+
+        Args:
+            xs (numpy array): Sample values.
+
+        """
+        for x in xs[-self.size:]:
+            self.append(x)
+
+    def view(self):
+        """Return the samples in chronological order (old -> new) without copying.
+
+        Returns:
+            numpy array: View of the window (not a copy).
+
+        """
+        return self.buf[..., self.head:(self.head + self.size)]
+
+    def reversed_view(self):
+        """Return the samples in reverse chronological order (new -> old) without copying.
+
+        Returns:
+            numpy array: View of the window (not a copy).
+
+        """
+        return self.view()[..., ::-1]
+
+    def mean(self):
+        """Return a mean value of the current window.
+
+        The sum is computed over the contiguous chronological view so that
+        the result is bit-identical to `np.mean` on the same samples.
+
+        Returns:
+            float or numpy array: Mean of the window (of each row).
+
+        """
+        return np.mean(self.view(), axis=-1)
+
+    def __len__(self):
+        return self.size
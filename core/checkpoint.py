@@ -0,0 +1,80 @@
+import os
+import json
+import struct
+import numpy as np
+
+from logging import getLogger
+logger = getLogger('ChangeFinder')
+
+# file layout:
+#   MAGIC (8 bytes) | VERSION (uint32) | header size (uint32) | header (JSON, padded to 8 bytes) | states (float64)
+MAGIC = b'CFCKPT\x00\x00'
+VERSION = 2
+
+PREFIX = struct.Struct('<8sII')
+
+
+def save(path, sections, models):
+    """Atomically write a checkpoint of detector models.
+
+    Args:
+        path (str): Destination of the checkpoint file.
+        sections (dict): JSON-serializable information of each section.
+        models (list): [((section name, scope), last-seen timestamp, state as a 1d numpy array), ...]
+
+    """
+    header = {'sections': sections, 'models': []}
+
+    offset = 0
+    for (section_name, scope), last_time, state in models:
+        header['models'].append({'section': section_name, 'scope': scope, 'last_time': last_time,
+                                 'offset': offset, 'size': state.size})
+        offset += state.size
+
+    h = json.dumps(header).encode('utf-8')
+    h += b' ' * (-(PREFIX.size + len(h)) % 8)  # align states to 8 bytes
+
+    # write to a temporary file in the same directory, then replace the old one
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, len(h)))
+        f.write(h)
+        for _, _, state in models:
+            f.write(np.asarray(state, dtype='<f8').tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+
+def load(path):
+    """Read a checkpoint written by `save`.
+
+    Args:
+        path (str): Checkpoint file.
+
+    Returns:
+        (dict, numpy array): Header, and all states as a memory-mapped 1d array.
+            State of a model is `states[offset:(offset + size)]` of its header entry.
+
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(PREFIX.size)
+        if len(prefix) < PREFIX.size:
+            raise ValueError('Checkpoint is broken: %s' % path)
+
+        magic, version, header_size = PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ValueError('Not a checkpoint file: %s' % path)
+        if version != VERSION:
+            raise ValueError('Unsupported checkpoint version %d (expected %d): %s' % (version, VERSION, path))
+
+        header = json.loads(f.read(header_size).decode('utf-8'))
+
+    offset = PREFIX.size + header_size
+    n = sum(m['size'] for m in header['models'])
+
+    if n == 0:
+        return header, np.zeros(0)
+
+    return header, np.memmap(path, dtype='<f8', mode='r', offset=offset, shape=(n,))
@@ -1,14 +1,62 @@
-import re
-from datadog import initialize, api
+import os
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict
+
+from .series import Series
 
 from logging import getLogger
 logger = getLogger('ChangeFinder')
 
+# errors which may be resolved by retrying the same request
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class QueryError(RuntimeError):
+
+    """Error of a request itself (e.g. an invalid query), which fails again however many times it is sent."""
+
 
 class DatadogClient:
 
-    def __init__(self, app_key, api_key):
-        initialize(app_key=app_key, api_key=api_key)
+    def __init__(self, app_key, api_key, api_host=None, pool_size=16, timeout=30.0,
+                 max_retries=3, backoff=1.0, max_backoff=60.0):
+        """Client of Datadog API over a pooled keep-alive session.
+
+        Args:
+            app_key (str): Application key.
+            api_key (str): API key.
+            api_host (str): Base URL of the API (default: `DATADOG_HOST` environment variable or api.datadoghq.com).
+            pool_size (int): Max number of kept-alive connections (i.e. concurrent calls without a new handshake).
+            timeout (float): Seconds to wait for connecting to and reading from the API.
+            max_retries (int): Max number of retries of a call which failed by a transient error
+                (connection error, timeout, rate limit or 5xx).
+            backoff (float): Base seconds of the exponential backoff; i-th retry waits for
+                a random time up to `backoff * 2^i` seconds (with full jitter).
+            max_backoff (float): Max seconds of the backoff.
+
+        """
+        self.api_host = (api_host or os.environ.get('DATADOG_HOST') or 'https://api.datadoghq.com').rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        self.session.headers.update({'DD-API-KEY': api_key, 'DD-APPLICATION-KEY': app_key})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # time until which the rate limit of the API has been used up (by `X-RateLimit-*` headers)
+        self.rate_limit_reset = 0.0
+
+        # key: endpoint, value: { calls, retries, failures, latency (total sec.), max_latency }
+        self.stats = {}
+        self.lock = threading.Lock()
 
     def get_series(self, start, end, query):
         """Get time series points.
@@ -18,31 +66,70 @@ class DatadogClient:
             end (int): Unix timestamp.
             query (string): Datadog query.
 
+        Returns:
+            Series: Columnar points of each scope; `Series.to_dicts` gives a list of points.
+
         """
-        j = api.Metric.query(start=start, end=end, query=query)
+        j = self.__query(start, end, query)
+        return Series.from_dd(j['series'])
 
-        if 'errors' in j:
-            msg = 'Datadog: %s' % j['errors']
-            raise RuntimeError(msg)
-        if 'status' in j and j['status'] != 'ok':
-            msg = 'Datadog: API status was NOT ok: %s' % j['status']
-            raise RuntimeError(msg)
+    def get_series_many(self, start, end, queries):
+        """Get time series points of several queries by a single API call.
 
-        series = []
+        Args:
+            start (int): Unix timestamp.
+            end (int): Unix timestamp.
+            queries (list of string): Datadog queries which do not contain top-level commas
+                (i.e. each of them is a single query; see `coalesce`).
+
+        Returns:
+            list: `Series` of each query.
+
+        """
+        if len(queries) == 1:
+            return [self.get_series(start, end, queries[0])]
+
+        j = self.__query(start, end, ','.join(queries))
 
+        grouped = [[] for _ in queries]
         for d in j['series']:
-            sre = re.search(',?host:([^,\}]+)', d['scope'])
-            host = '*' if sre is None else sre.group(1)
+            if 'query_index' not in d:
+                raise QueryError('Datadog: series of coalesced queries cannot be split')
+            grouped[d['query_index']].append(d)
+
+        return [Series.from_dd(g) for g in grouped]
+
+    @staticmethod
+    def coalesce(queries, size):
+        """Pack queries into groups, each of which is fetched by a single API call.
+        Duplicated queries are fetched only once, and a query which already consists of
+        several comma-separated queries is never packed with others.
+
+        Args:
+            queries (list of string): Datadog queries.
+            size (int): Max number of queries in a group.
+
+        Returns:
+            list: Groups of unique queries.
 
-            # p = [ timestamp, value ]
-            series += [{'src_metric': d['metric'],
-                        'scope': d['scope'],
-                        'host': host,
-                        'time': int(p[0]),
-                        'raw_value': p[1]
-                        } for p in d['pointlist']]
+        """
+        groups = []
+        group = []
+
+        for query in OrderedDict.fromkeys(queries):
+            if is_multi_query(query):
+                groups.append([query])
+                continue
+
+            group.append(query)
+            if len(group) >= size:
+                groups.append(group)
+                group = []
 
-        return sorted(series, key=lambda d: d['time'])
+        if len(group) > 0:
+            groups.append(group)
+
+        return groups
 
     def post_metric(self, metric, points, host):
         """Post the given points to a specified metric with host information.
@@ -56,7 +143,133 @@ class DatadogClient:
             host: Metric source.
 
         """
-        api.Metric.send(metric=metric, points=points, host=host)
+        if not isinstance(points, (list, tuple)):
+            points = [(time.time(), points)]
+        elif len(points) > 0 and not isinstance(points[0], (list, tuple)):
+            points = [points]
+
+        self.__request('POST', '/api/v1/series',
+                       json={'series': [{'metric': metric, 'host': host,
+                                         'points': [[float(t), float(v)] for t, v in points]}]})
+
+    def pop_stats(self):
+        """Return statistics of calls for each endpoint since the last call of this method.
+
+        Returns:
+            dict: { endpoint: { calls, retries, failures, latency (mean sec.), max_latency (sec.) } }
+
+        """
+        with self.lock:
+            stats, self.stats = self.stats, {}
+
+        for s in stats.values():
+            s['latency'] = s['latency'] / s['calls'] if s['calls'] > 0 else 0.0
+
+        return stats
+
+    def __query(self, start, end, query):
+        j = self.__request('GET', '/api/v1/query', params={'from': start, 'to': end, 'query': query})
+
+        if 'errors' in j:
+            msg = 'Datadog: %s' % j['errors']
+            raise QueryError(msg)
+        if 'status' in j and j['status'] != 'ok':
+            msg = 'Datadog: API status was NOT ok: %s' % j['status']
+            raise RuntimeError(msg)
+
+        return j
+
+    def __request(self, method, path, **kwargs):
+        """Call an API with retries.
+
+        Returns:
+            dict: Decoded JSON response.
+
+        """
+        start = time.perf_counter()
+        retries = 0
+
+        while True:
+            # wait until the used-up rate limit is reset
+            wait = self.rate_limit_reset - time.time()
+            if wait > 0:
+                logger.warning('Datadog: rate limit is reached; wait for %.1f sec.' % wait)
+                time.sleep(wait)
+
+            try:
+                res = self.session.request(method, self.api_host + path, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                res, error = None, err
+            else:
+                self.__update_rate_limit(res)
+                error = None if res.status_code < 400 else 'HTTP %d: %s' % (res.status_code, res.text[:200])
+
+            if error is None:
+                self.__record(path, start, retries, False)
+                return res.json() if len(res.content) > 0 else {}
+
+            if (res is not None and res.status_code not in RETRY_STATUSES) or retries >= self.max_retries:
+                self.__record(path, start, retries, True)
+                errors = self.__errors(res)
+                msg = 'Datadog: %s' % (errors if errors is not None else error)
+
+                # 4xx except rate limit: the request is invalid
+                if res is not None and 400 <= res.status_code < 500 and res.status_code not in RETRY_STATUSES:
+                    raise QueryError(msg)
+                raise RuntimeError(msg)
+
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retries))
+            if res is not None:
+                delay = max(delay, self.__retry_after(res))
+
+            retries += 1
+            logger.warning('Datadog: %s; retry %d/%d after %.1f sec.' % (error, retries, self.max_retries, delay))
+            time.sleep(delay)
+
+    def __update_rate_limit(self, res):
+        remaining = res.headers.get('X-RateLimit-Remaining')
+        reset = res.headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+
+        try:
+            if int(remaining) <= 0:
+                self.rate_limit_reset = max(self.rate_limit_reset, time.time() + float(reset))
+        except ValueError:
+            pass
+
+    def __retry_after(self, res):
+        """Return seconds to wait before retrying a request which has been refused (e.g. by a rate limit).
+
+        """
+        for header in ('Retry-After', 'X-RateLimit-Reset'):
+            try:
+                return min(self.max_backoff, float(res.headers[header]))
+            except (KeyError, ValueError):
+                pass
+        return 0.0
+
+    def __errors(self, res):
+        if res is None:
+            return None
+        try:
+            return res.json().get('errors')
+        except ValueError:
+            return None
+
+    def __record(self, path, start, retries, is_failed):
+        latency = time.perf_counter() - start
+
+        with self.lock:
+            s = self.stats.setdefault(path, {'calls': 0, 'retries': 0, 'failures': 0,
+                                             'latency': 0.0, 'max_latency': 0.0})
+            s['calls'] += 1
+            s['retries'] += retries
+            s['failures'] += int(is_failed)
+            s['latency'] += latency
+            s['max_latency'] = max(s['max_latency'], latency)
+
+        logger.debug('Datadog: %s took %.3f sec. (%d retries)' % (path, latency, retries))
 
     def __get_snapshot(self, start, end, query):
         """Get a snapshot for the given query in the period.
@@ -67,5 +280,43 @@ class DatadogClient:
             query (string): Datadog query.
 
         """
-        j = api.Graph.create(metric_query=query, start=start, end=end)
+        j = self.__request('GET', '/api/v1/graph/snapshot', params={'metric_query': query, 'start': start, 'end': end})
         return j['snapshot_url']
+
+
+def split_queries(query):
+    """Split a query at top-level commas (i.e. into single queries).
+    Commas in brackets, e.g. `{host:a,env:b}` and `.rollup(avg, 60)`, are not counted.
+
+    Args:
+        query (string): Datadog query.
+
+    Returns:
+        list: Single queries.
+
+    """
+    queries = []
+
+    depth = 0
+    start = 0
+    for i, c in enumerate(query):
+        if c in '({[':
+            depth += 1
+        elif c in ')}]':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            queries.append(query[start:i])
+            start = i + 1
+    queries.append(query[start:])
+
+    return queries
+
+
+def is_multi_query(query):
+    """Check if a query has top-level commas (i.e. consists of several queries).
+
+    Args:
+        query (string): Datadog query.
+
+    """
+    return len(split_queries(query)) > 1
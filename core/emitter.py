@@ -0,0 +1,357 @@
+import os
+import time
+import queue
+import struct
+import msgpack
+import threading
+
+from logging import getLogger
+logger = getLogger('ChangeFinder')
+
+# spill file layout: a sequence of entries of
+#   size (uint32) | msgpack of [label, timestamp, records]
+ENTRY_HEADER = struct.Struct('<I')
+
+
+class Emitter:
+
+    def __init__(self, sender, queue_size=100, spill_path=None, retry_interval=5.0):
+        """Background emission of records, so that scoring never waits for fluentd.
+        Batches are sent in order by a worker thread. When the bounded queue is full (e.g. fluentd is slow
+        or down), batches are appended to a local spill file instead, and replayed in order once the queue
+        has been drained. Records are delivered at least once.
+
+        Args:
+            sender (ForwardSender): Sender of batches.
+            queue_size (int): Max number of batches in memory.
+            spill_path (str): Append-only file of batches overflowing the queue; it survives restarts
+                and is replayed first (None: overflowing batches are dropped).
+            retry_interval (float): Seconds between attempts to send a batch while fluentd is unavailable.
+
+        """
+        assert queue_size > 0, 'queue_size must be 1 or more.'
+
+        self.sender = sender
+        self.queue = queue.Queue(queue_size)
+        self.spill_path = spill_path
+        self.retry_interval = retry_interval
+
+        # guards the spill file, its read offset, and batches taken by the worker
+        self.lock = threading.Lock()
+
+        # batches spilled but not replayed yet; new batches go to the spill file to keep the order
+        self.spill_offset = self.__read_offset()
+        self.is_spilling = self.__spill_size() > self.spill_offset
+
+        # batch of the queue which the worker is sending
+        self.current = None
+
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.pid = None
+
+        # incremented by `close`; a worker of an older generation (e.g. still blocked in a send) takes no more batches
+        self.generation = 0
+
+        # incremented whenever the spill file is rewritten; offsets read before that are no longer valid
+        self.spill_version = 0
+
+        self.__reset_stats()
+
+        if self.is_spilling:
+            logger.info('%d bytes of spilled records are replayed' % (self.__spill_size() - self.spill_offset))
+
+    def put(self, label, records, timestamp=None):
+        """Enqueue a batch without blocking.
+
+        Args:
+            label (str): Tag is `<tag prefix>.<label>`.
+            records (list): Records (dicts).
+            timestamp (int): Event time of the records (default: current unix time).
+
+        Returns:
+            bool: False if the batch has been dropped (i.e. both the queue and the spill file are unavailable).
+
+        """
+        self.__start()
+
+        item = (label, int(time.time()) if timestamp is None else timestamp, records)
+
+        with self.lock:
+            if not self.is_spilling:
+                try:
+                    self.queue.put_nowait(item)
+                except queue.Full:
+                    pass
+                else:
+                    self.stats['max_queued'] = max(self.stats['max_queued'], self.queue.qsize())
+                    return True
+
+            return self.__spill([item])
+
+    def flush(self, timeout=None):
+        """Wait until all batches (including spilled ones) have been sent.
+
+        Returns:
+            bool: True if everything has been sent within the timeout.
+
+        """
+        self.__start()
+
+        deadline = None if timeout is None else time.time() + timeout
+        while self.queue.unfinished_tasks > 0 or self.is_spilling:
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.01)
+
+        return True
+
+    def close(self, timeout=30.0):
+        """Flush batches for at most `timeout` seconds, stop the worker, and spill batches which are still
+        in memory (they are replayed on the next start).
+
+        """
+        if self.thread is None or self.pid != os.getpid():
+            return
+
+        start = time.time()
+        self.flush(timeout)
+
+        self.stop_event.set()
+        self.thread.join(max(0.0, timeout - (time.time() - start)))
+
+        with self.lock:
+            # the worker may still be blocked in a send; from now on it neither takes batches nor commits
+            # them, so the batch being sent is spilled (or kept in the spill file) and sent again later
+            self.generation += 1
+
+            items = [] if self.current is None else [self.current]
+            self.current = None
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if len(items) > 0:
+                n = sum(len(records) for _, _, records in items)
+                if self.__spill(items, front=True):
+                    logger.warning('Spilled %d records which were not sent before shutdown' % n)
+
+        self.thread = None
+        self.pid = None
+
+    def pop_stats(self):
+        """Return backpressure statistics since the last call of this method.
+
+        Returns:
+            dict: { queued (batches in memory), queue_size, max_queued, spill_bytes (to be replayed),
+                sent, spilled, replayed, dropped (records), failures (failed attempts to send) }
+
+        """
+        with self.lock:
+            stats = self.stats
+            self.__reset_stats()
+
+            stats['queued'] = self.queue.qsize()
+            stats['queue_size'] = self.queue.maxsize
+            stats['spill_bytes'] = self.__spill_size() - self.spill_offset
+
+        return stats
+
+    def __reset_stats(self):
+        self.stats = {'max_queued': 0, 'sent': 0, 'spilled': 0, 'replayed': 0, 'dropped': 0, 'failures': 0}
+
+    def __start(self):
+        # the worker is (re)started in the process which actually emits, e.g. after daemonizing
+        if self.pid == os.getpid():
+            return
+
+        self.pid = os.getpid()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.__run, args=(self.generation,), name='emitter', daemon=True)
+        self.thread.start()
+
+    def __run(self, generation):
+        while not self.stop_event.is_set():
+            # batches are taken and committed under the lock, so that `close` knows exactly which one is in flight
+            with self.lock:
+                if self.generation != generation:
+                    return
+
+                try:
+                    self.current = self.queue.get_nowait()
+                except queue.Empty:
+                    self.current = None
+                item = self.current
+
+            if item is not None:
+                if not self.__send(item):
+                    return
+
+                with self.lock:
+                    if self.generation != generation:
+                        return
+                    self.current = None
+                    self.queue.task_done()
+                continue
+
+            # the queue has been drained; replay spilled batches
+            with self.lock:
+                if self.generation != generation:
+                    return
+                entry = self.__read_spill()
+                version = self.spill_version
+
+            if entry is None:
+                self.stop_event.wait(0.01)
+                continue
+
+            item, offset = entry
+            if not self.__send(item):
+                return
+
+            with self.lock:
+                # if `close` has rewritten the spill file in the meantime, the batch is still in it
+                # and is sent again on the next start
+                if self.spill_version == version:
+                    self.stats['replayed'] += len(item[2])
+                    self.__commit_offset(offset)
+
+    def __send(self, item):
+        """Send a batch, retrying until it is sent or the worker is stopped.
+
+        """
+        label, timestamp, records = item
+
+        n_failures = 0
+        while not self.sender.emit_many(label, records, timestamp):
+            if n_failures == 0:
+                logger.warning('fluent-logger failed to emit %d records, and retries every %.1f sec. (%s)' %
+                               (len(records), self.retry_interval, self.sender.last_error))
+            self.sender.clear_last_error()
+
+            n_failures += 1
+            with self.lock:
+                self.stats['failures'] += 1
+
+            if self.stop_event.wait(self.retry_interval):
+                return False
+
+        with self.lock:
+            self.stats['sent'] += len(records)
+
+        return True
+
+    def __spill(self, items, front=False):
+        """Append batches to the spill file (or insert them before the batches not replayed yet).
+
+        Returns:
+            bool: False if the batches have been dropped.
+
+        """
+        n = sum(len(records) for _, _, records in items)
+
+        if self.spill_path is None:
+            self.stats['dropped'] += n
+            return False
+
+        data = b''.join(ENTRY_HEADER.pack(len(b)) + b for b in (msgpack.packb(list(item)) for item in items))
+
+        try:
+            if front:
+                with open(self.spill_path, 'ab+') as f:
+                    f.seek(self.spill_offset)
+                    data += f.read()
+
+                tmp_path = '%s.%d.tmp' % (self.spill_path, os.getpid())
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.spill_path)
+
+                self.spill_version += 1
+                self.__commit_offset(0)
+            else:
+                with open(self.spill_path, 'ab') as f:
+                    f.write(data)
+        except OSError as err:
+            logger.error('Dropped %d records since they cannot be spilled to %s (%s)' % (n, self.spill_path, err))
+            self.stats['dropped'] += n
+            return False
+
+        self.is_spilling = True
+        self.stats['spilled'] += n
+
+        return True
+
+    def __read_spill(self):
+        """Read the next spilled batch.
+
+        Returns:
+            (tuple, int): Batch, and the offset after it (None if there is no spilled batch).
+
+        """
+        if not self.is_spilling:
+            return None
+
+        try:
+            with open(self.spill_path, 'rb') as f:
+                f.seek(self.spill_offset)
+                header = f.read(ENTRY_HEADER.size)
+                if len(header) == ENTRY_HEADER.size:
+                    size, = ENTRY_HEADER.unpack(header)
+                    data = f.read(size)
+                    if len(data) == size:
+                        label, timestamp, records = msgpack.unpackb(data, raw=False)
+                        return (label, timestamp, records), self.spill_offset + ENTRY_HEADER.size + size
+        except (OSError, ValueError) as err:
+            logger.error('Discarded a broken spill file %s (%s)' % (self.spill_path, err))
+        else:
+            if len(header) > 0:
+                # e.g. a partial write at a crash
+                logger.error('Discarded a broken tail of a spill file %s' % self.spill_path)
+
+        # everything has been replayed
+        self.__commit_offset(self.__spill_size())
+        return None
+
+    def __commit_offset(self, offset):
+        """Record the read offset of the spill file, and truncate it once everything has been replayed.
+
+        """
+        if offset >= self.__spill_size():
+            if self.spill_path is not None and os.path.exists(self.spill_path):
+                open(self.spill_path, 'wb').close()
+            offset = 0
+            self.is_spilling = False
+
+        self.spill_offset = offset
+
+        if self.spill_path is not None:
+            tmp_path = '%s.offset.%d.tmp' % (self.spill_path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                f.write(str(offset))
+            os.replace(tmp_path, self.spill_path + '.offset')
+
+    def __read_offset(self):
+        if self.spill_path is None:
+            return 0
+
+        try:
+            with open(self.spill_path + '.offset') as f:
+                offset = int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+        return offset if offset <= self.__spill_size() else 0
+
+    def __spill_size(self):
+        if self.spill_path is None:
+            return 0
+
+        try:
+            return os.path.getsize(self.spill_path)
+        except OSError:
+            return 0
@@ -0,0 +1,121 @@
+from abc import ABCMeta, abstractmethod
+
+import types
+
+import numpy as np
+
+from .changefinder.changefinder_1d import ChangeFinder
+from .sst.sst import SingularSpectrumTransformation
+
+
+class Engine:
+
+    """Interface of a detector model which `Detector` keeps for each (section, scope).
+    `ChangeFinder` implements the same methods, and is used as an engine as it is.
+
+    """
+
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def update(self, x):
+        """Update the model by a point, and return (outlier score, change point score)."""
+        pass
+
+    @abstractmethod
+    def update_many(self, xs):
+        """Update the model by points in order, and return (outlier scores, change point scores)."""
+        pass
+
+    @abstractmethod
+    def get_state(self):
+        """Return the state of the model as a 1d numpy array."""
+        pass
+
+    @abstractmethod
+    def set_state(self, state):
+        """Restore the state returned by `get_state` of a model with the same parameters."""
+        pass
+
+
+class SSTEngine(Engine):
+
+    def __init__(self, w=30, r=3, is_lanczos=True):
+        """Streaming change point detection based on `SingularSpectrumTransformation`.
+
+        SST has no outlier score, so it is always 0. A change point score of a point becomes available
+        after `w - 1` succeeding points are seen, and it is reported with the latest point (0 until then).
+
+        Args:
+            w (int): Window size.
+            r (int): Number of singular vectors spanning past/current subspaces.
+            is_lanczos (bool): Compute scores by the Lanczos method, or by SVD.
+
+        """
+        self.sst = SingularSpectrumTransformation(w, r)
+        self.is_lanczos = is_lanczos
+
+    def update(self, x):
+        change = self.sst.update(x, self.is_lanczos)
+        return 0.0, (0.0 if np.isnan(change) else change)
+
+    def update_many(self, xs):
+        changes = np.array([self.update(x)[1] for x in xs], dtype=np.float64)
+        return np.zeros(changes.size), changes
+
+    def get_state(self):
+        return np.concatenate(([self.sst.n_seen], self.sst.q, self.sst.xs.view()))
+
+    def set_state(self, state):
+        m = self.sst.m
+        assert state.size == 1 + m + self.sst.span, 'size of the state does not match the parameters.'
+
+        self.sst.n_seen = int(state[0])
+        self.sst.q = np.array(state[1:(1 + m)], dtype=np.float64)
+        self.sst.xs.extend(state[(1 + m):])
+
+
+# key: `engine` of a config section
+ENGINES = {'changefinder': ChangeFinder, 'sst': SSTEngine}
+
+
+def create_engine(name, params):
+    """Create a model of an engine.
+
+    Args:
+        name (str): Engine name; one of `ENGINES`.
+        params (dict): Keyword arguments of the engine.
+
+    """
+    return ENGINES[name](**params)
+
+
+def nbytes(model, seen=None):
+    """Return the memory size of numpy arrays which a model (and objects in it) owns.
+
+    Args:
+        model (object): Engine model.
+        seen (set): IDs of already counted objects.
+
+    Returns:
+        int: Size in bytes; views and shared objects are counted only once.
+
+    """
+    seen = set() if seen is None else seen
+    if id(model) in seen:
+        return 0
+    seen.add(id(model))
+
+    # kernels (e.g. JIT-compiled functions of a backend) and modules are shared by all models
+    if callable(model) or isinstance(model, types.ModuleType):
+        return 0
+
+    if isinstance(model, np.ndarray):
+        return model.nbytes if model.base is None else 0
+    if isinstance(model, (list, tuple)):
+        return sum(nbytes(v, seen) for v in model)
+    if isinstance(model, dict):
+        return sum(nbytes(v, seen) for v in model.values())
+    if isinstance(getattr(model, '__dict__', None), dict):
+        return sum(nbytes(v, seen) for v in model.__dict__.values())
+    return 0
@@ -0,0 +1,52 @@
+import time
+import socket
+import msgpack
+
+from fluent import sender
+
+
+class ForwardSender(sender.FluentSender):
+
+    def emit_many(self, label, records, timestamp=None):
+        """Send records of the same tag as a single message in PackedForward mode of the forward protocol,
+        i.e. one msgpack frame and one socket write for all of them.
+
+        Unlike `emit`, records are not buffered on failure; they are either sent or returned as failed
+        as a whole, so that the caller knows exactly which records have not been sent.
+
+        Args:
+            label (str): Tag is `<tag prefix>.<label>`.
+            records (list): Records (dicts).
+            timestamp (int): Event time of the records (default: current unix time).
+
+        Returns:
+            bool: True if the records have been sent.
+
+        """
+        if len(records) == 0:
+            return True
+
+        tag = '.'.join((self.tag, label)) if label else self.tag
+        timestamp = int(time.time()) if timestamp is None else timestamp
+
+        packer = msgpack.Packer()
+        entries = b''.join(packer.pack((timestamp, record)) for record in records)
+
+        bytes_ = packer.pack((tag, entries, {'size': len(records)}))
+
+        # internals of fluent-logger (`lock`, `pendings`, `_send_data`, `_close` and `last_error`);
+        # pinned by `test_fluent_logger_internals`
+        with self.lock:
+            try:
+                # records buffered by previous `emit` calls go first
+                if self.pendings:
+                    self._send_data(self.pendings)
+                    self.pendings = None
+
+                self._send_data(bytes_)
+            except socket.error as e:
+                self.last_error = e
+                self._close()
+                return False
+
+        return True
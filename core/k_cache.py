@@ -0,0 +1,119 @@
+import os
+import json
+import time
+
+from logging import getLogger
+logger = getLogger('ChangeFinder')
+
+VERSION = 1
+
+
+class KCache:
+
+    def __init__(self, path=None, ttl=60 * 60 * 24 * 7, drift_ratio=4.0, min_age=60 * 60):
+        """Cache of automatically selected `k` keyed by (section name, query).
+        Each entry keeps the AIC curve and the variance of prediction errors (`sigma`) at the selection time;
+        both are computed on each scope of the query (see `ModelSelection.estimate_many`).
+
+        Args:
+            path (str): JSON file shared among processes (e.g. daemon and `cli/model_selection.py`).
+                If None, entries are only kept in memory.
+            ttl (int): Seconds until an entry expires.
+            drift_ratio (float): An entry is considered drifted if the live `sigma` is
+                `drift_ratio` times larger (or smaller) than the recorded one.
+            min_age (int): Entries younger than this are never considered drifted;
+                i.e. re-selection is triggered by drift at most once in `min_age` seconds.
+
+        """
+        assert drift_ratio > 1, 'drift_ratio must be larger than 1.'
+
+        self.path = path
+        self.ttl = ttl
+        self.drift_ratio = drift_ratio
+        self.min_age = min_age
+
+        # key: section name, value: { query: entry }
+        self.entries = self.__read()
+
+    def get(self, section_name, query):
+        """Return an entry for the section and query.
+
+        Args:
+            section_name (str): Config's section name.
+            query (str): Datadog query.
+
+        Returns:
+            dict: { k, aic (list), sigma, time } (possibly expired), or None if not found.
+
+        """
+        return self.entries.get(section_name, {}).get(query)
+
+    def put(self, section_name, query, k, aic, sigma):
+        """Record a selected `k`, and write all entries to the file.
+
+        Args:
+            section_name (str): Config's section name.
+            query (str): Datadog query.
+            k (int): Selected order of the AR model.
+            aic (numpy array): AIC for k = 1, 2, ...
+            sigma (float): Variance of prediction errors of the selected AR(k) model (mean over scopes).
+
+        """
+        # merge entries written by other processes since the last read
+        self.entries = self.__read()
+
+        entry = {'k': int(k), 'aic': [float(v) for v in aic], 'sigma': float(sigma), 'time': time.time()}
+        self.entries.setdefault(section_name, {})[query] = entry
+
+        self.__write()
+
+        return entry
+
+    def is_expired(self, entry):
+        return time.time() - entry['time'] > self.ttl
+
+    def is_drifted(self, entry, sigma):
+        """Check if the live variance of prediction errors is far from the recorded one.
+
+        Args:
+            entry (dict): Cache entry.
+            sigma (float): Live variance of prediction errors (mean over scopes).
+
+        """
+        if time.time() - entry['time'] < self.min_age:
+            return False
+
+        # a zero variance (e.g. of a constant series) gives no scale to compare with; it is left to `ttl`
+        if entry['sigma'] <= 0 or sigma <= 0:
+            return False
+
+        ratio = sigma / entry['sigma']
+        return ratio > self.drift_ratio or ratio < 1 / self.drift_ratio
+
+    def __read(self):
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+
+        try:
+            with open(self.path) as f:
+                j = json.load(f)
+        except (OSError, ValueError) as err:
+            logger.warning('Ignored a k cache: %s' % err)
+            return {}
+
+        if j.get('version') != VERSION:
+            logger.warning('Ignored a k cache of unsupported version: %s' % self.path)
+            return {}
+
+        return j['entries']
+
+    def __write(self):
+        if self.path is None:
+            return
+
+        # write to a temporary file in the same directory, then replace the old one
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': VERSION, 'entries': self.entries}, f)
+
+        os.replace(tmp_path, self.path)
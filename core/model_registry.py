@@ -0,0 +1,82 @@
+from collections import OrderedDict
+
+from logging import getLogger
+logger = getLogger('ChangeFinder')
+
+
+class ModelRegistry:
+
+    def __init__(self, max_models=10000):
+        """Bounded registry of detector models keyed by (section name, scope).
+        When the number of models exceeds `max_models`, the least recently used one is evicted
+        (e.g. a model for a host which has disappeared from the series of a `by{host}` query).
+
+        Args:
+            max_models (int): Maximum number of live models.
+
+        """
+        assert max_models > 0, 'max_models must be 1 or more.'
+
+        self.max_models = max_models
+        self.models = OrderedDict()
+        self.n_evicted = 0
+
+        # last-seen timestamp of the points each model has handled
+        self.last_times = {}
+
+    def get(self, key, create):
+        """Return a model for the key, and mark it as the most recently used one.
+
+        Args:
+            key ((str, str)): (section name, scope).
+            create (function): Called without arguments to create a new model if the key is unknown.
+
+        Returns:
+            A model for the key.
+
+        """
+        if key in self.models:
+            self.models.move_to_end(key)
+            return self.models[key]
+
+        model = self.models[key] = create()
+        self.evict()
+
+        return model
+
+    def evict(self):
+        """Evict least recently used models until the number of models fits `max_models`.
+
+        """
+        while len(self.models) > self.max_models:
+            key, _ = self.models.popitem(last=False)
+            self.last_times.pop(key, None)
+            self.n_evicted += 1
+            logger.debug('Evicted a model for [%s] %s' % key)
+
+    def drop(self, section_name):
+        """Delete all models of a section (e.g. the section has been deleted from the config).
+
+        Args:
+            section_name (str): Config's section name.
+
+        """
+        for key in [key for key in self.models.keys() if key[0] == section_name]:
+            del self.models[key]
+            self.last_times.pop(key, None)
+
+    def items(self):
+        """Return (key, model) pairs from the least recently used one.
+
+        """
+        return list(self.models.items())
+
+    @property
+    def n_live(self):
+        return len(self.models)
+
+    def __len__(self):
+        return len(self.models)
+
+    def __contains__(self, key):
+        return key in self.models
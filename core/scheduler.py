@@ -0,0 +1,181 @@
+import zlib
+
+from logging import getLogger
+logger = getLogger('ChangeFinder')
+
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity, now):
+        """Budget of API calls which is refilled at a constant rate.
+
+        Args:
+            rate (float): Tokens (i.e. calls) refilled per second.
+            capacity (float): Max number of tokens.
+            now (float): Current unix time; the bucket is initially full.
+
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.time = now
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.time) * self.rate)
+        self.time = now
+
+    def consume(self, n):
+        """Spend tokens; the balance can be negative (i.e. debt) if more calls than planned have been made.
+
+        """
+        self.tokens -= n
+
+
+class Scheduler:
+
+    def __init__(self, tick, limit, now, max_range=60 * 60):
+        """Scheduler of section queries on absolute tick boundaries (multiples of `tick` in unix time).
+        Each section is due every its own `interval` with a phase derived from its name, so that sections
+        of a long interval are spread over ticks. DD API calls are paid from a token bucket of `limit` calls
+        per hour; if the budget of a tick is not enough, sections of lower priority are deferred to the next ticks.
+
+        Args:
+            tick (int): Base interval (in sec.); every section interval is rounded up to a multiple of it.
+            limit (int): DD API calls per hour.
+            now (float): Current unix time.
+            max_range (int): Max time range (in sec.) of a query; older points of a deferred or failed
+                section are skipped.
+
+        """
+        assert tick > 0, 'tick must be 1 or more.'
+
+        self.tick = tick
+        self.max_range = max_range
+
+        # at most two ticks of calls can be made at once
+        rate = limit / 3600
+        self.bucket = TokenBucket(rate, max(1.0, 2 * rate * tick), now)
+
+        # key: section name, value: { interval, priority, phase, start (of the next query range), failures }
+        self.sections = {}
+
+        # planned and actual DD API calls since the last `report`
+        self.n_planned = 0
+        self.n_used = 0
+        self.n_deferred = 0
+
+    def next_tick(self, now):
+        """Return the first tick boundary after `now`.
+
+        """
+        return (int(now) // self.tick + 1) * self.tick
+
+    def update_sections(self, sections, start):
+        """Add new sections and delete removed ones.
+
+        Args:
+            sections (dict): { section name: { interval (sec.), priority } }.
+            start (int): Start of the first query range of new sections.
+
+        """
+        for section_name in set(self.sections.keys()) - set(sections.keys()):
+            del self.sections[section_name]
+
+        for section_name, section in sections.items():
+            interval = max(1, -(-int(section.get('interval') or self.tick) // self.tick)) * self.tick
+            state = self.sections.setdefault(section_name, {'start': start, 'failures': 0})
+
+            state['interval'] = interval
+            state['priority'] = int(section.get('priority') or 0)
+
+            # spread sections of the same interval over ticks
+            state['phase'] = (zlib.crc32(section_name.encode('utf-8')) % (interval // self.tick)) * self.tick
+
+    def is_due(self, section_name, t):
+        state = self.sections[section_name]
+        return (t - state['phase']) % state['interval'] == 0 or \
+            t - state['start'] >= state['interval']  # deferred or failed
+
+    def plan(self, t, cost):
+        """Choose sections to be queried at a tick within the budget.
+
+        Args:
+            t (int): Tick boundary (i.e. end of query ranges).
+            cost (function): Number of API calls to query a list of sections in the same range.
+
+        Returns:
+            list: [(start, end, [section names]), ...] for each query range.
+
+        """
+        self.bucket.refill(t)
+
+        due = [section_name for section_name in self.sections.keys() if self.is_due(section_name, t)]
+
+        # higher priority first, and the longest waiting first (but sections which keep failing last)
+        due = sorted(due, key=lambda section_name: (-self.sections[section_name]['priority'],
+                                                    self.sections[section_name]['failures'],
+                                                    self.sections[section_name]['start'], section_name))
+
+        batches = {}
+        n_calls = 0
+        deferred = []
+
+        for section_name in due:
+            start = max(self.sections[section_name]['start'], t - self.max_range + 1)
+
+            batch = batches.get(start, [])
+            n = n_calls - (cost(batch) if len(batch) > 0 else 0) + cost(batch + [section_name])
+
+            if n > self.bucket.tokens:
+                deferred.append(section_name)
+                continue
+
+            batches[start] = batch + [section_name]
+            n_calls = n
+
+        if len(deferred) > 0:
+            logger.warning('Deferred %d of %d due sections due to API rate limit (%.1f calls left)' %
+                           (len(deferred), len(due), self.bucket.tokens))
+
+        self.n_planned += n_calls
+        self.n_deferred += len(deferred)
+
+        return [(start, t, section_names) for start, section_names in sorted(batches.items())]
+
+    def done(self, section_names, end, failed):
+        """Advance query ranges of sections which have been handled.
+
+        Args:
+            section_names (list): Queried sections.
+            end (int): End of the query range.
+            failed (list): Failed sections; they are queried from the same start again.
+
+        """
+        for section_name in section_names:
+            if section_name not in self.sections:
+                continue
+
+            state = self.sections[section_name]
+            if section_name in failed:
+                state['failures'] += 1
+            else:
+                state['start'] = end + 1
+                state['failures'] = 0
+
+    def spend(self, n):
+        """Record API calls actually made.
+
+        """
+        self.bucket.consume(n)
+        self.n_used += n
+
+    def report(self):
+        """Log planned versus actual API usage since the last report, and reset them.
+
+        """
+        logger.info('API usage: %d calls planned, %d calls made, %d sections deferred (%.1f calls left)' %
+                    (self.n_planned, self.n_used, self.n_deferred, self.bucket.tokens))
+
+        self.n_planned = 0
+        self.n_used = 0
+        self.n_deferred = 0
@@ -0,0 +1,194 @@
+import re
+import heapq
+import numpy as np
+from collections import OrderedDict
+from itertools import chain, repeat
+
+# host of a scope, e.g. `host:foo` and `env:prod,host:foo`
+HOST_PATTERN = re.compile(r',?host:([^,\}]+)')
+
+
+class ScopeSeries:
+
+    def __init__(self, metric, scope, times, values):
+        """Points of a single series (i.e. a metric for a scope) in chronological order.
+
+        Args:
+            metric (str): Source metric name.
+            scope (str): Scope of the series, e.g. `host:foo`.
+            times (numpy array): Timestamps in milliseconds (int64).
+            values (numpy array): Values (float64); NaN for missing (null) values.
+
+        """
+        self.metric = metric
+        self.scope = scope
+        self.times = times
+        self.values = values
+
+        sre = HOST_PATTERN.search(scope)
+        self.host = '*' if sre is None else sre.group(1)
+
+    @classmethod
+    def from_dd(cls, d):
+        """Create a series from an element of `series` of a Datadog query response.
+
+        Args:
+            d (dict): { metric, scope, pointlist: [[time, value], ...], ... }.
+
+        """
+        # p = [ timestamp, value ]; null values become NaN
+        pointlist = d['pointlist']
+        try:
+            points = np.fromiter(chain.from_iterable(pointlist), np.float64, 2 * len(pointlist)).reshape(-1, 2)
+        except TypeError:
+            points = np.array(pointlist, dtype=np.float64).reshape(-1, 2)
+        times = points[:, 0].astype(np.int64)
+        values = points[:, 1].copy()
+
+        # pointlists are usually sorted, but keep the same order as a stable sort otherwise
+        if np.any(times[1:] < times[:-1]):
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+
+        return cls(d['metric'], d['scope'], times, values)
+
+    def after(self, t):
+        """Return points whose timestamps are larger than `t` (as views of this series).
+
+        Args:
+            t (int): Timestamp in milliseconds.
+
+        """
+        i = np.searchsorted(self.times, t, side='right')
+        return ScopeSeries(self.metric, self.scope, self.times[i:], self.values[i:])
+
+    def between(self, start, end):
+        """Return points whose timestamps are in [start, end] (as views of this series).
+
+        Args:
+            start (int): Timestamp in milliseconds.
+            end (int): Timestamp in milliseconds.
+
+        """
+        i = np.searchsorted(self.times, start, side='left')
+        j = np.searchsorted(self.times, end, side='right')
+        return ScopeSeries(self.metric, self.scope, self.times[i:j], self.values[i:j])
+
+    def filled_values(self):
+        """Return values where missing ones are replaced by 0.0.
+
+        """
+        return np.where(np.isnan(self.values), 0.0, self.values)
+
+    def __len__(self):
+        return self.times.size
+
+
+class Series:
+
+    def __init__(self, scopes=None):
+        """Columnar result of a Datadog query; a list of `ScopeSeries`.
+
+        Args:
+            scopes (list): `ScopeSeries` in order of the query response.
+
+        """
+        self.scopes = [] if scopes is None else scopes
+
+    @classmethod
+    def from_dd(cls, series_list):
+        return cls([ScopeSeries.from_dd(d) for d in series_list])
+
+    @classmethod
+    def concat(cls, series_list):
+        """Concatenate series of consecutive time ranges; points of the same (metric, scope) are joined.
+
+        Args:
+            series_list (list): `Series` in chronological order.
+
+        """
+        parts = OrderedDict()
+        for series in series_list:
+            for s in series:
+                parts.setdefault((s.metric, s.scope), []).append(s)
+
+        return cls([ScopeSeries(metric, scope,
+                                np.concatenate([s.times for s in ss]),
+                                np.concatenate([s.values for s in ss]))
+                    for (metric, scope), ss in parts.items()])
+
+    def between(self, start, end):
+        """Return points whose timestamps are in [start, end] (as views of this series).
+
+        Args:
+            start (int): Timestamp in milliseconds.
+            end (int): Timestamp in milliseconds.
+
+        """
+        return Series([s.between(start, end) for s in self.scopes])
+
+    def merge(self):
+        """Iterate over all points in chronological order.
+
+        Returns:
+            generator: (time, index of a scope, index of a point in the scope).
+
+        """
+        return merge([s.times for s in self.scopes])
+
+    def values(self):
+        """Return values of all points in chronological order; missing values are replaced by 0.0.
+
+        """
+        values = [s.filled_values() for s in self.scopes]
+        return np.array([values[i][j] for _, i, j in self.merge()], dtype=np.float64)
+
+    def scope_values(self):
+        """Return values of each scope (e.g. host of a `by{host}` query) as a model of the scope is fed.
+
+        Returns:
+            OrderedDict: { scope: values of all series of the scope in chronological order }.
+
+        """
+        indices = OrderedDict()
+        for i, s in enumerate(self.scopes):
+            indices.setdefault(s.scope, []).append(i)
+
+        return OrderedDict((scope, Series([self.scopes[i] for i in idx]).values()) for scope, idx in indices.items())
+
+    def to_dicts(self):
+        """Convert into the list of points (dicts) in chronological order.
+
+        Returns:
+            list: [{ src_metric, scope, host, time, raw_value (None if missing) }, ...]
+
+        """
+        values = [[None if np.isnan(v) else v for v in s.values.tolist()] for s in self.scopes]
+
+        return [{'src_metric': self.scopes[i].metric,
+                 'scope': self.scopes[i].scope,
+                 'host': self.scopes[i].host,
+                 'time': t,
+                 'raw_value': values[i][j]
+                 } for t, i, j in self.merge()]
+
+    def __len__(self):
+        return sum(len(s) for s in self.scopes)
+
+    def __iter__(self):
+        return iter(self.scopes)
+
+
+def merge(times_list):
+    """Merge sorted timestamps of series by a streaming k-way merge.
+    Points of the same timestamp are ordered by the index of their series, i.e. same as a stable sort
+    of the concatenated points.
+
+    Args:
+        times_list (list of numpy array): Sorted timestamps of each series.
+
+    Returns:
+        generator: (time, index of a series, index of a point in the series).
+
+    """
+    return heapq.merge(*[zip(times.tolist(), repeat(i), range(times.size)) for i, times in enumerate(times_list)])
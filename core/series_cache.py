@@ -0,0 +1,364 @@
+import os
+import re
+import json
+import time
+import struct
+import hashlib
+import threading
+import numpy as np
+
+from .series import Series, ScopeSeries
+
+from logging import getLogger
+logger = getLogger('ChangeFinder')
+
+# segment file layout:
+#   MAGIC (8 bytes) | VERSION (uint32) | header size (uint32) | header (JSON, padded to 8 bytes) |
+#   times of all scopes (int64) | values of all scopes (float64)
+MAGIC = b'CFSEG\x00\x00\x00'
+VERSION = 2
+
+PREFIX = struct.Struct('<8sII')
+
+INDEX_FILE = 'index.json'
+
+# rollup intervals (in sec.) which Datadog chooses to return ~300 points for a range, e.g. 20 sec. for an hour
+ROLLUP_INTERVALS = [20, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400, 28800, 86400]
+
+# single metric query optionally followed by functions, e.g. avg:system.load.1{env:prod}by{host}.rollup(max)
+SIMPLE_QUERY_PATTERN = re.compile(r'^\s*(?:\w+:)?[\w.]+\{[^}]*\}(?:\s*by\s*\{[^}]*\})?(?:\.\w+\([^()]*\))*\s*$')
+ROLLUP_PATTERN = re.compile(r'\.rollup\(\s*(\w+)\s*(?:,\s*(\d+)\s*)?\)')
+
+
+class SeriesCache:
+
+    def __init__(self, path, max_bytes=1 << 30, settle=300):
+        """On-disk cache of Datadog series keyed by (query, rollup interval, time range).
+        Each fetched range of a query is stored as a columnar segment file, and the index keeps
+        the time ranges of segments for each query. A request is served from the segments
+        overlapping its range, and only the gaps between them are fetched from the API.
+
+        Since Datadog rolls up points depending on the length of a requested range, a query is
+        pinned to the interval for the whole requested range by `.rollup()` (see `pin_rollup`),
+        so that gaps have the same resolution as cached segments; segments of different
+        intervals are kept separately. Queries which cannot be pinned are never cached.
+
+        Args:
+            path (str): Directory of segment files and the index (shared among processes).
+            max_bytes (int): Max total size of segment files; least recently used segments are evicted.
+            settle (int): Seconds until points become immutable on Datadog;
+                more recent points are fetched but never cached.
+
+        """
+        assert max_bytes > 0, 'max_bytes must be 1 or more.'
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.settle = settle
+
+        self.hits = 0
+        self.misses = 0
+        self.n_evicted = 0
+
+        os.makedirs(path, exist_ok=True)
+
+        # segment files and the index are shared among threads (and processes)
+        self.lock = threading.Lock()
+
+        # key: query, value: [{ start, end, file, nbytes, last_used }, ...] sorted by `start`
+        self.index = self.__read_index()
+
+        self.__remove_orphans()
+
+    def get_series(self, dd, start, end, query):
+        """Get time series points in [start, end] from cached segments and the API.
+
+        Args:
+            dd (DatadogClient): Client to fetch gaps which are not cached.
+            start (int): Unix timestamp.
+            end (int): Unix timestamp.
+            query (string): Datadog query.
+
+        Returns:
+            Series: Columnar points in the range.
+
+        """
+        pinned = pin_rollup(query, rollup_interval(end - start))
+        if pinned is None:
+            with self.lock:
+                self.misses += 1
+            return dd.get_series(start, end, query)
+        query = pinned
+
+        with self.lock:
+            self.index = self.__read_index()
+            segments = [seg for seg in self.index.get(query, []) if seg['start'] <= end and seg['end'] >= start]
+
+        parts = []
+        used = []
+
+        t = start
+        for seg in segments:
+            if seg['start'] > t:
+                parts.append(self.__fetch(dd, t, seg['start'] - 1, query))
+
+            try:
+                series = load_segment(os.path.join(self.path, seg['file']))
+            except (OSError, ValueError) as err:
+                # e.g. evicted by another process in the meantime
+                logger.warning('Ignored a cached segment of [%s]: %s' % (query, err))
+                parts.append(self.__fetch(dd, max(t, seg['start']), min(end, seg['end']), query))
+            else:
+                parts.append(series.between(max(t, seg['start']) * 1000, min(end, seg['end']) * 1000))
+                used.append(seg['file'])
+
+            t = seg['end'] + 1
+
+        if t <= end:
+            parts.append(self.__fetch(dd, t, end, query))
+
+        if len(used) > 0:
+            with self.lock:
+                self.hits += len(used)
+                self.index = self.__read_index()
+                now = time.time()
+                for seg in self.index.get(query, []):
+                    if seg['file'] in used:
+                        seg['last_used'] = now
+                self.__write_index()
+
+        return Series.concat(parts)
+
+    @property
+    def nbytes(self):
+        return sum(seg['nbytes'] for segments in self.index.values() for seg in segments)
+
+    @property
+    def stats(self):
+        """Return hit/miss statistics: { hits (served segments), misses (fetched gaps), hit_ratio, evicted, nbytes }.
+
+        """
+        n = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': self.hits / n if n > 0 else 0.0,
+                'evicted': self.n_evicted, 'nbytes': self.nbytes}
+
+    def __fetch(self, dd, start, end, query):
+        """Fetch a gap [start, end] from the API, and cache its settled part.
+
+        """
+        with self.lock:
+            self.misses += 1
+
+        series = dd.get_series(start, end, query).between(start * 1000, end * 1000)
+
+        # recent points may still change (e.g. delayed metrics)
+        settled_end = min(end, int(time.time()) - self.settle)
+        if settled_end < start:
+            return series
+
+        filename = '%s-%d-%d.seg' % (hashlib.sha1(query.encode('utf-8')).hexdigest()[:16], start, settled_end)
+        nbytes = save_segment(os.path.join(self.path, filename), series.between(start * 1000, settled_end * 1000))
+
+        with self.lock:
+            self.index = self.__read_index()
+
+            segments = self.index.setdefault(query, [])
+            overlaps = [seg for seg in segments if seg['start'] <= settled_end and seg['end'] >= start]
+            if len(overlaps) == 0:
+                segments.append({'start': start, 'end': settled_end, 'file': filename,
+                                 'nbytes': nbytes, 'last_used': time.time()})
+                segments.sort(key=lambda seg: seg['start'])
+            elif all(seg['file'] != filename for seg in overlaps):
+                # the range has been cached by another thread (or process) in the meantime
+                os.remove(os.path.join(self.path, filename))
+
+            self.__evict()
+            self.__write_index()
+
+        return series
+
+    def __evict(self):
+        """Delete least recently used segments until the total size fits `max_bytes`.
+
+        """
+        segments = sorted(((seg['last_used'], query, seg) for query, segments in self.index.items()
+                           for seg in segments), key=lambda s: s[0])
+
+        total = self.nbytes
+        for _, query, seg in segments:
+            if total <= self.max_bytes:
+                break
+
+            self.index[query].remove(seg)
+            if len(self.index[query]) == 0:
+                del self.index[query]
+
+            try:
+                os.remove(os.path.join(self.path, seg['file']))
+            except OSError:
+                pass
+
+            total -= seg['nbytes']
+            self.n_evicted += 1
+            logger.debug('Evicted a cached segment [%d, %d] of [%s]' % (seg['start'], seg['end'], query))
+
+    def __remove_orphans(self, min_age=60 * 60):
+        """Delete old segment files which are not in the index (e.g. lost by concurrent writes of the index).
+
+        """
+        files = set(seg['file'] for segments in self.index.values() for seg in segments)
+
+        for filename in os.listdir(self.path):
+            path = os.path.join(self.path, filename)
+            if not filename.endswith(('.seg', '.tmp')) or filename in files:
+                continue
+
+            try:
+                if time.time() - os.path.getmtime(path) > min_age:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def __read_index(self):
+        path = os.path.join(self.path, INDEX_FILE)
+        if not os.path.exists(path):
+            return {}
+
+        try:
+            with open(path) as f:
+                j = json.load(f)
+        except (OSError, ValueError) as err:
+            logger.warning('Ignored a series cache index: %s' % err)
+            return {}
+
+        if j.get('version') != VERSION:
+            logger.warning('Ignored a series cache index of unsupported version: %s' % path)
+            return {}
+
+        return j['queries']
+
+    def __write_index(self):
+        # write to a temporary file in the same directory, then replace the old one
+        path = os.path.join(self.path, INDEX_FILE)
+        tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': VERSION, 'queries': self.index}, f)
+
+        os.replace(tmp_path, path)
+
+
+def rollup_interval(seconds):
+    """Return the rollup interval which Datadog chooses for a range.
+
+    Args:
+        seconds (int): Length of the range.
+
+    Returns:
+        int: Seconds between points.
+
+    """
+    for interval in ROLLUP_INTERVALS:
+        if seconds <= interval * 300:
+            return interval
+    return ROLLUP_INTERVALS[-1]
+
+
+def pin_rollup(query, interval):
+    """Give an explicit rollup interval to a query, so that the resolution does not depend on the length of ranges.
+
+    Args:
+        query (string): Datadog query.
+        interval (int): Seconds between points, unless the query has its own interval.
+
+    Returns:
+        string: Query with `.rollup(<method>, <interval>)` (None if it cannot be pinned, e.g. an arithmetic of queries).
+
+    """
+    if SIMPLE_QUERY_PATTERN.match(query) is None:
+        return None
+
+    query = query.strip()
+
+    m = ROLLUP_PATTERN.search(query)
+    if m is None:
+        # counts are summed up as Datadog does by default
+        method = 'sum' if '.as_count()' in query else 'avg'
+        return '%s.rollup(%s, %d)' % (query, method, interval)
+
+    if m.group(2) is not None:
+        return query
+
+    return '%s.rollup(%s, %d)%s' % (query[:m.start()], m.group(1), interval, query[m.end():])
+
+
+def save_segment(path, series):
+    """Atomically write a series to a segment file.
+
+    Args:
+        path (str): Destination of the segment file.
+        series (Series): Columnar points.
+
+    Returns:
+        int: Size of the file in bytes.
+
+    """
+    header = {'scopes': []}
+
+    offset = 0
+    for s in series:
+        header['scopes'].append({'metric': s.metric, 'scope': s.scope, 'offset': offset, 'size': len(s)})
+        offset += len(s)
+
+    h = json.dumps(header).encode('utf-8')
+    h += b' ' * (-(PREFIX.size + len(h)) % 8)  # align arrays to 8 bytes
+
+    tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+    with open(tmp_path, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, len(h)))
+        f.write(h)
+        for s in series:
+            f.write(np.asarray(s.times, dtype='<i8').tobytes())
+        for s in series:
+            f.write(np.asarray(s.values, dtype='<f8').tobytes())
+
+    os.replace(tmp_path, path)
+
+    return PREFIX.size + len(h) + offset * 16
+
+
+def load_segment(path):
+    """Read a segment file written by `save_segment`.
+
+    Args:
+        path (str): Segment file.
+
+    Returns:
+        Series: Columnar points whose arrays are memory-mapped.
+
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(PREFIX.size)
+        if len(prefix) < PREFIX.size:
+            raise ValueError('Segment is broken: %s' % path)
+
+        magic, version, header_size = PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ValueError('Not a segment file: %s' % path)
+        if version != VERSION:
+            raise ValueError('Unsupported segment version %d (expected %d): %s' % (version, VERSION, path))
+
+        header = json.loads(f.read(header_size).decode('utf-8'))
+
+    offset = PREFIX.size + header_size
+    n = sum(s['size'] for s in header['scopes'])
+
+    if n == 0:
+        times, values = np.zeros(0, dtype=np.int64), np.zeros(0)
+    else:
+        times = np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(n,))
+        values = np.memmap(path, dtype='<f8', mode='r', offset=offset + n * 8, shape=(n,))
+
+    return Series([ScopeSeries(s['metric'], s['scope'],
+                               times[s['offset']:(s['offset'] + s['size'])],
+                               values[s['offset']:(s['offset'] + s['size'])])
+                   for s in header['scopes']])
@@ -1,7 +1,8 @@
 import numpy as np
 import numpy.linalg as ln
 
-from .utils import power1, lanczos, tridiag_eig
+from .utils import power1, lanczos_tridiag, tridiag_eigh, trajectory_matrices
+from ..changefinder.window import Window, strided_windows
 
 
 class SingularSpectrumTransformation:
@@ -31,6 +32,13 @@ class SingularSpectrumTransformation:
         q = np.random.normal(size=self.m)
         self.q = q / ln.norm(q)
 
+        # points needed to score a point t: t-(n+w)-1, ..., t+g+m+w-1
+        self.span = self.n_past + self.g + self.n_current + 1
+
+        # latest points for `update`
+        self.xs = Window(self.span)
+        self.n_seen = 0
+
     def score(self, xs_past, xs_current, is_lanczos=True):
         """Compute a change-point score for given past/current patterns.
 
@@ -46,11 +54,13 @@ class SingularSpectrumTransformation:
             [Sample code snippet]
             | sst = SingularSpectrumTransformation(30, 2)
             |
-            | for t in range(sst.n_past + 1, xs.size - sst.g - sst.n_current):
+            | for t in range(sst.n_past + 1, xs.size - sst.g - sst.n_current + 1):
             |     xs_past = xs[(t - sst.n_past - 1):(t - 1)]
             |     xs_current = xs[(t + sst.g):(t + sst.g + sst.n_current)]
             |     yield sst.score(xs_past, xs_current)
 
+            which is equivalent to `sst.score_series(xs)`.
+
         Returns:
             float: Change-point score based on SST.
 
@@ -58,16 +68,101 @@ class SingularSpectrumTransformation:
         assert xs_past.size == self.n_past, 'lack of past samples'
         assert xs_current.size == self.n_current, 'lack of current samples'
 
-        # Create past trajectory matrix and find its left singular vectors
-        H = np.zeros((self.w, self.n))
-        for i in range(self.n):
-            H[:, i] = xs_past[i:(i + self.w)]
+        # past/current trajectory matrices as views (i-th column is `xs[i:(i + w)]`)
+        H = strided_windows(xs_past, self.w)[:self.n].T
+        G = strided_windows(xs_current, self.w)[:self.m].T
+
+        return self.__compute(H, G, is_lanczos)
+
+    def score_series(self, xs, is_lanczos=True):
+        """Compute change-point scores for all points of a series in one pass.
+        Trajectory matrices of every t are views of the series (no copy).
+
+        Args:
+            xs (numpy array): Series of points.
+            is_lanczos (boolean): Choose whether a socore has to be computed efficiently by using the Lanczos method.
+
+        Returns:
+            numpy array: Change-point score for each point; NaN if past/current windows do not fit in the series.
+
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        scores = np.full(xs.size, np.nan)
+
+        if xs.size < self.span:
+            return scores
+
+        # j-th row is `xs[j:(j + w)]`, i.e. a column of trajectory matrices
+        windows = strided_windows(xs, self.w)
+
+        for t in range(self.n_past + 1, xs.size - self.g - self.n_current + 1):
+            H = windows[(t - self.n_past - 1):(t - self.n_past - 1 + self.n)].T
+            G = windows[(t + self.g):(t + self.g + self.m)].T
+            scores[t] = self.__compute(H, G, is_lanczos)
+
+        return scores
+
+    def score_batch(self, X, chunk_size=1024):
+        """Compute change-point scores of one or many series by SVD, a batched SVD per chunk of windows.
+        Scores are identical to `score_series(x, is_lanczos=False)` for each series.
+
+        Args:
+            X (numpy array): Series of points, or 2d array whose rows are series of the same length.
+            chunk_size (int): Number of (series, t) pairs stacked into one batch; bounds the memory usage
+                to about `chunk_size * 3 * w * w` floats.
+
+        Returns:
+            numpy array: Change-point scores in the same shape as X; NaN if past/current windows do not fit.
+
+        """
+        X = np.asarray(X, dtype=np.float64)
+        scores = np.full(X.shape, np.nan)
+
+        X2d, scores2d = np.atleast_2d(X), np.atleast_2d(scores)
+
+        ts = np.arange(self.n_past + 1, X2d.shape[1] - self.g - self.n_current + 1)
+        if ts.size == 0:
+            return scores
+
+        # [series, i] is a trajectory matrix whose first column starts from i
+        past = trajectory_matrices(X2d, self.w, self.n)
+        current = trajectory_matrices(X2d, self.w, self.m)
+
+        # all (series, t) pairs
+        series_idx = np.repeat(np.arange(X2d.shape[0]), ts.size)
+        t_idx = np.tile(ts, X2d.shape[0])
+
+        for i in range(0, t_idx.size, chunk_size):
+            s, t = series_idx[i:(i + chunk_size)], t_idx[i:(i + chunk_size)]
+            scores2d[s, t] = self.__compute_svd(past[s, t - self.n_past - 1], current[s, t + self.g])
+
+        return scores
+
+    def update(self, x, is_lanczos=True):
+        """Append a point, and score the latest point whose current windows are filled.
+        Scores are the same as `score_series` for the series of all appended points.
+
+        Args:
+            x (float): New point.
+            is_lanczos (boolean): Choose whether a socore has to be computed efficiently by using the Lanczos method.
+
+        Returns:
+            float: Change-point score of the point `g + n_current - 1` (i.e. w - 1) steps before x;
+                NaN until `span` points are appended.
+
+        """
+        self.xs.append(x)
+        self.n_seen += 1
+
+        if self.n_seen < self.span:
+            return np.nan
+
+        xs = self.xs.view()
+        offset = self.n_past + 1 + self.g
 
-        # Create current trajectory matrix and find its left singular vectors
-        G = np.zeros((self.w, self.m))
-        for i in range(self.m):
-            G[:, i] = xs_current[i:(i + self.w)]
+        return self.score(xs[:self.n_past], xs[offset:(offset + self.n_current)], is_lanczos)
 
+    def __compute(self, H, G, is_lanczos):
         if is_lanczos:
             return self.__compute_lanczos(H, G)
         else:
@@ -75,16 +170,18 @@ class SingularSpectrumTransformation:
 
     def __compute_svd(self, H, G):
         """Compute change-point score using SVD.
+        H and G can be stacked matrices (..., w, n); a batch is decomposed by a single call,
+        and each score is identical to the one computed separately.
 
         """
         U, _, _ = ln.svd(H, full_matrices=False)
         Q, _, _ = ln.svd(G, full_matrices=False)
 
         # find the largest singular value for `r` principal component
-        s = ln.svd(np.dot(U[:, :self.r].T, Q[:, :self.r]),
+        s = ln.svd(np.matmul(np.swapaxes(U[..., :self.r], -1, -2), Q[..., :self.r]),
                    full_matrices=False, compute_uv=False)
 
-        return 1 - s[0]
+        return 1 - s[..., 0]
 
     def __compute_lanczos(self, H, G):
         """Compute change-point score using the Lanczos method.
@@ -94,12 +191,12 @@ class SingularSpectrumTransformation:
         self.q, _, _ = power1(G, self.q, n_iter=1)
 
         k = 2 * self.r if self.r % 2 == 0 else 2 * self.r - 1
-        T = lanczos(np.dot(H, H.T), self.q, k)
+        # apply H H^T as H (H^T x); O(w^2) instead of O(w^3) for forming it
+        alpha, beta = lanczos_tridiag(lambda x: np.dot(H, np.dot(H.T, x)), self.q, k)
 
-        # find eigenvectors and eigenvalues of T
-        # eigvals, eigvecs = ln.eig(T)
-        eigvals, eigvecs = tridiag_eig(T, n_iter=1)
+        # find eigenvalues and the first components of eigenvectors of T
+        eigvals, eigvecs_first = tridiag_eigh(alpha, beta)
 
-        # `eig()` returns unordered eigenvalues,
+        # eigenvalues are unordered,
         # so the top-r eigenvectors should be picked carefully
-        return 1 - np.sqrt(np.sum(eigvecs[0, np.argsort(eigvals)[::-1][:self.r]] ** 2))
+        return 1 - np.sqrt(np.sum(np.square(eigvecs_first[np.argsort(eigvals)[::-1][:self.r]])))
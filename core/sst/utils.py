@@ -1,12 +1,37 @@
+import math
 import numpy as np
 import numpy.linalg as ln
+from functools import partial
+from numpy.lib.stride_tricks import as_strided
+
+from logging import getLogger
+logger = getLogger('ChangeFinder')
+
+
+def trajectory_matrices(X, w, n):
+    """Return the trajectory (Hankel) matrices of all windows as a view (no copy).
+
+    Args:
+        X (numpy array): 1d series, or 2d array whose rows are series.
+        w (int): Number of rows of a trajectory matrix (i.e. window size).
+        n (int): Number of columns of a trajectory matrix.
+
+    Returns:
+        numpy array: (..., t - w - n + 2, w, n) view; [..., i, :, j] is `X[..., (i + j):(i + j + w)]`.
+
+    """
+    X = np.ascontiguousarray(X)
+    s = X.strides[-1]
+    return as_strided(X, shape=X.shape[:-1] + (X.shape[-1] - w - n + 2, w, n),
+                      strides=X.strides[:-1] + (s, s, s), writeable=False)
 
 
 def lanczos(C, a, s):
     """Lanczos method: tridiagonalize a symmetric matrix C to s * s matrix T.
 
     Args:
-        C (numpy array): Target matrix applied tridiagonalization.
+        C (numpy array or function): Target matrix applied tridiagonalization,
+            or a function which returns `C x` for a vector x (i.e. C is never formed).
         a (numpy array): Initial vector (r).
         s (int): Size of the returned tridiagonal matrix T.
 
@@ -14,30 +39,133 @@ def lanczos(C, a, s):
         (numpy array): s * s tridiagonal matrix.
 
     """
+    alpha, beta = lanczos_tridiag(C, a, s)
+    return np.diag(alpha) + np.diag(beta, 1) + np.diag(beta, -1)
+
+
+def lanczos_tridiag(C, a, s):
+    """Lanczos method which returns the s * s tridiagonal matrix T as its diagonal and off-diagonal.
+
+    Args:
+        C (numpy array or function): Target matrix applied tridiagonalization,
+            or a function which returns `C x` for a vector x (i.e. C is never formed).
+        a (numpy array): Initial vector (r).
+        s (int): Size of the tridiagonal matrix T.
+
+    Returns:
+        (numpy array, numpy array): s diagonal elements, and s - 1 off-diagonal elements of T.
+
+    """
+    matvec = C if callable(C) else partial(np.dot, C)
+
     a0 = np.zeros_like(a)
     beta0 = 1
     r = np.empty_like(a)
     r[:] = a
 
-    T = np.zeros((s, s))
+    alpha = np.zeros(s)
+    beta = np.zeros(s)
 
     for j in range(s):
         a1 = r / beta0
-        Ca1 = np.dot(C, a1)
+        Ca1 = matvec(a1)
         alpha1 = np.dot(a1, Ca1)
         r = Ca1 - alpha1 * a1 - beta0 * a0
         beta1 = ln.norm(r)
 
-        T[j, j] = alpha1
-        if j - 1 >= 0:
-            T[j, j - 1] = beta0
-        if j + 1 < s:
-            T[j, j + 1] = beta1
+        alpha[j] = alpha1
+        beta[j] = beta1
 
         a0[:] = a1
         beta0 = beta1
 
-    return T
+    return alpha, beta[:-1]
+
+
+def tridiag_eigh(alpha, beta, tol=np.finfo(np.float64).eps, max_iter=30):
+    """Find eigenvalues of a symmetric tridiagonal matrix T, and the first components of its eigenvectors,
+    by the QL algorithm with implicit shifts (cf. `tqli` of Numerical Recipes).
+    Only the diagonal, off-diagonal and a row of eigenvectors are kept, i.e. O(s) memory.
+
+    Args:
+        alpha (numpy array): s diagonal elements of T.
+        beta (numpy array): s - 1 off-diagonal elements of T.
+        tol (float): Off-diagonal element `e[m]` is considered zero
+            if |e[m]| <= tol * (|d[m]| + |d[m + 1]|).
+        max_iter (int): Max number of QL iterations for each eigenvalue.
+            If an eigenvalue has not converged, the dense T is solved by `numpy.linalg.eigh` instead.
+
+    Returns:
+        (numpy array) Eigenvalues of T (unordered).
+        (numpy array) First components of the corresponding unit eigenvectors of T.
+
+    """
+    s = len(alpha)
+
+    # the recursion is scalar; plain floats are much faster than numpy scalars here
+    d = [float(v) for v in alpha]
+    e = [float(v) for v in beta] + [0.0]
+
+    # first row of the eigenvector matrix; rotated as the matrix is
+    z = [1.0] + [0.0] * (s - 1)
+
+    for l in range(s):
+        for _ in range(max_iter):
+            # find a small off-diagonal element to split the matrix
+            m = l
+            while m < s - 1 and abs(e[m]) > tol * (abs(d[m]) + abs(d[m + 1])):
+                m += 1
+
+            if m == l:
+                break
+
+            # implicit shift
+            g = (d[l + 1] - d[l]) / (2 * e[l])
+            r = math.hypot(g, 1.0)
+            g = d[m] - d[l] + e[l] / (g + math.copysign(r, g))
+
+            sin = cos = 1.0
+            p = 0.0
+
+            # plane rotations which restore the tridiagonal form
+            i = m - 1
+            while i >= l:
+                f = sin * e[i]
+                b = cos * e[i]
+                r = math.hypot(f, g)
+                e[i + 1] = r
+
+                # underflow; restart from the next iteration
+                if r == 0:
+                    d[i + 1] -= p
+                    e[m] = 0.0
+                    break
+
+                sin = f / r
+                cos = g / r
+                g = d[i + 1] - p
+                r = (d[i] - g) * sin + 2 * cos * b
+                p = sin * r
+                d[i + 1] = g + p
+                g = cos * r - b
+
+                z[i], z[i + 1] = cos * z[i] - sin * z[i + 1], sin * z[i] + cos * z[i + 1]
+
+                i -= 1
+
+            if i >= l:
+                continue
+
+            d[l] -= p
+            e[l] = g
+            e[m] = 0.0
+        else:
+            logger.warning('QL iterations did not converge in %d iterations; fall back to numpy.linalg.eigh.' % max_iter)
+
+            eigvals, eigvecs = ln.eigh(np.diag(alpha) + np.diag(beta, 1) + np.diag(beta, -1))
+            return eigvals, eigvecs[0]
+
+    return np.array(d), np.array(z)
 
 
 def is_diag(A, tol):
@@ -51,7 +179,7 @@ def is_diag(A, tol):
         boolean
 
     """
-    return np.all((A - np.diag(np.diag(A)) < tol))
+    return np.all(np.abs(A - np.diag(np.diag(A))) < tol)
 
 
 def tridiag_eig(T, n_iter=1, tol=1e-3):
@@ -106,7 +234,8 @@ def tridiag_qr(T):
     Qt = np.eye(T.shape[0])
 
     for i in range(T.shape[0] - 1):
-        u = householder(T[i:i + 2, i])
+        # reflect the current (partially reduced) column; `householder` overwrites its input
+        u = householder(R[i:i + 2, i].copy())
 
         R[i:i + 2, :] = R[i:i + 2, :] - 2 * np.outer(u, np.dot(u, R[i:i + 2, :]))
         Qt[i:i + 2, :] = Qt[i:i + 2, :] - 2 * np.outer(u, np.dot(u, Qt[i:i + 2, :]))
@@ -132,10 +261,9 @@ def power1(A, x0, n_iter=1):
         (numpy array): 1st right singular vector of A.
 
     """
-    AtA = np.dot(A.T, A)
-
+    # apply A and A^T in turn instead of forming A^T A
     for i in range(n_iter):
-        x0 = np.dot(AtA, x0)
+        x0 = np.dot(A.T, np.dot(A, x0))
 
     v = x0 / ln.norm(x0)
     Av = np.dot(A, v)
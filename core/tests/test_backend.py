@@ -0,0 +1,73 @@
+from unittest import TestCase, skipIf
+
+import os
+import sys
+
+import numpy as np
+from numpy.testing import assert_array_equal, assert_almost_equal
+
+try:
+    from core.changefinder import backend
+except ImportError:
+    sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir), os.pardir))
+    from core.changefinder import backend
+
+from core.changefinder.changefinder_1d import ChangeFinder
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'data')
+
+
+class BackendTestCase(TestCase):
+
+    def test_resolve(self):
+        self.assertEqual(backend.resolve('numpy'), 'numpy')
+        self.assertIn(backend.resolve('auto'), backend.BACKENDS)
+
+        with self.assertRaises(ValueError):
+            backend.resolve('xxx')
+
+    def test_numpy_backend(self):
+        self.assertEqual(backend.get_backend('numpy').name, 'numpy')
+
+
+@skipIf(backend.numba is None, 'numba is not installed')
+class BackendEquivalenceTestCase(TestCase):
+
+    def setUp(self):
+        self.x = np.loadtxt(os.path.join(DATA_DIR, 'cf_test.tsv'))[:500]
+        self.numpy = backend.get_backend('numpy')
+        self.numba = backend.get_backend('numba')
+
+    def test_autocovariance(self):
+        for k in [1, 5, 20]:
+            mu1, c1 = self.numpy.autocovariance(self.x, k)
+            mu2, c2 = self.numba.autocovariance(self.x, k)
+            assert_almost_equal(mu1, mu2)
+            assert_almost_equal(c1, c2)
+
+    def test_aryule_levinson(self):
+        for c in [np.array([1., 2., 3.]), np.zeros(3), np.random.normal(size=10)]:
+            k = c.size - 1
+            assert_almost_equal(self.numpy.aryule_levinson(c, k), self.numba.aryule_levinson(c, k))
+
+    def test_aryule_levinson_batch(self):
+        C = np.random.normal(size=(50, 7))
+        C[:5] = 0.
+        assert_almost_equal(self.numpy.aryule_levinson_batch(C, 6), self.numba.aryule_levinson_batch(C, 6))
+
+    def test_arburg(self):
+        for k in [1, 2, 5]:
+            assert_almost_equal(self.numpy.arburg(self.x[:50], k), self.numba.arburg(self.x[:50], k))
+
+    def test_changefinder(self):
+        for is_yule in [True, False]:
+            x = self.x if is_yule else self.x[:100]
+            cf1 = ChangeFinder(r=0.02, k=6, T1=10, T2=5, is_yule=is_yule, backend='numpy')
+            cf2 = ChangeFinder(r=0.02, k=6, T1=10, T2=5, is_yule=is_yule, backend='numba')
+
+            scores1 = np.array([cf1.update(xi) for xi in x])
+            scores2 = np.array([cf2.update(xi) for xi in x])
+            assert_almost_equal(scores1, scores2)
+
+            assert_array_equal(np.column_stack(cf1.update_many(x)), np.column_stack(cf2.update_many(x)))
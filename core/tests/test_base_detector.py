@@ -3,13 +3,25 @@ from unittest import TestCase
 import os
 import sys
 import time
+import shutil
+import tempfile
+from unittest import mock
 
 try:
     from core.base_detector import Detector
+    from core.scheduler import Scheduler
 except ImportError:
     sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
                                  os.pardir), os.pardir))
     from core.base_detector import Detector
+    from core.scheduler import Scheduler
+
+# local stand-ins of Datadog API and fluentd
+try:
+    from fake_datadog import FakeDatadogServer, FluentSink
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'cli'))
+    from fake_datadog import FakeDatadogServer, FluentSink
 
 
 class TestDetector(Detector):
@@ -35,4 +47,171 @@ class BaseDetectorTestCase(TestCase):
 
     def test_query(self):
         now = int(time.time())
-        self.detector.query(now - 60, now)
+        self.assertListEqual(self.detector.query(now - 60, now), [])
+
+
+class LocalDetectorTestCase(TestCase):
+
+    def setUp(self):
+        self.server = FakeDatadogServer(hosts=3, resolution=60).start()
+        self.sink = FluentSink().start()
+        self.dir = tempfile.mkdtemp()
+
+        # the fake API does not check keys
+        self.env = mock.patch.dict(os.environ, {'DD_API_KEY': 'fake', 'DD_APP_KEY': 'fake'})
+        self.env.start()
+
+        self.detector = None
+
+    def tearDown(self):
+        if self.detector is not None:
+            self.detector.close(1)
+        self.server.stop()
+        self.sink.stop()
+        shutil.rmtree(self.dir)
+        self.env.stop()
+
+    def create_detector(self, sections, general='', k=4):
+        """Create a detector of the local stand-ins.
+
+        Args:
+            sections (dict): { section name: query }.
+            general (str): Additional options of the general section.
+            k (int): Order of the AR models (None: automatically selected).
+
+        """
+        path = os.path.join(self.dir, 'test.ini')
+        with open(path, 'w') as f:
+            f.write('[general]\ndd_api_host: %s\ndd_max_retries: 0\nfluent_host: 127.0.0.1\nfluent_port: %d\n%s\n' %
+                    (self.server.url, self.sink.port, general))
+            for section_name, query in sections.items():
+                f.write('[%s]\nquery: %s\n' % (section_name, query))
+                if k is not None:
+                    f.write('k: %d\n' % k)
+
+        self.detector = Detector('test', path)
+        return self.detector
+
+    def test_query_failure(self):
+        detector = self.create_detector({'datadog.a': 'avg:fake.a{*}by{host}',
+                                         'datadog.b': 'invalid query',
+                                         'datadog.c': 'avg:fake.c{*}'},
+                                        'engine_metrics: false')
+
+        # one failed section does not abort the others
+        self.assertListEqual(detector.query(0, 3599), ['datadog.b'])
+
+        detector.close(5)
+        for _ in range(100):
+            if self.sink.n_records == 4 * 60:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(sorted(set(tag for tag, _ in self.sink.records)), ['test.a', 'test.c'])
+        self.assertEqual(self.sink.n_records, 4 * 60)
+
+    def test_query_failure_coalesced(self):
+        sections = {'datadog.a': 'avg:fake.a{*}by{host}',
+                    'datadog.b': 'invalid query',
+                    'datadog.c': 'avg:fake.c{*}'}
+        detector = self.create_detector(sections, 'engine_metrics: false\nqueries_per_call: 3')
+
+        # an invalid query fails the coalesced call, and the queries are fetched one by one
+        self.assertListEqual(detector.query(0, 3599), ['datadog.b'])
+        self.assertEqual(self.server.calls['/api/v1/query'], 1 + 3)
+        self.assertEqual(detector.n_api_used, 1 + 3)
+
+        # an outage fails all of them without extra calls
+        self.server.status = 503
+        self.assertListEqual(detector.query(3600, 7199), sorted(sections.keys()))
+        self.assertEqual(self.server.calls['/api/v1/query'], 1 + 3 + 1)
+        self.assertEqual(detector.n_api_used, 1)
+
+    def test_api_budget(self):
+        detector = self.create_detector({'datadog.a': 'avg:fake.a{*}by{host}',
+                                         'datadog.c': 'avg:fake.c{*}'},
+                                        'engine_metrics: true')
+
+        # cycles of the daemon; posted engine metrics are not charged to the budget of queries
+        scheduler = Scheduler(60, 3600, 0)
+        scheduler.update_sections({'datadog.a': {}, 'datadog.c': {}}, 1)
+        for t in range(60, 5 * 60 + 1, 60):
+            for range_start, range_end, section_names in scheduler.plan(t, detector.n_api_calls):
+                failed = detector.query(range_start, range_end, section_names=section_names)
+                scheduler.done(section_names, range_end, failed)
+                scheduler.spend(detector.n_api_used)
+
+        self.assertEqual(scheduler.n_planned, 5 * 2)
+        self.assertEqual(scheduler.n_used, scheduler.n_planned)
+        self.assertEqual(scheduler.n_deferred, 0)
+        self.assertEqual(self.server.calls['/api/v1/query'], 5 * 2)
+        self.assertGreater(self.server.calls['/api/v1/series'], 0)
+
+    def test_k_not_drifted(self):
+        # stationary series of hosts at different levels, which are dominated by white noise
+        self.server.hosts = 10
+        self.server.noise = 20.0
+
+        detector = self.create_detector({'datadog.a': 'avg:fake.a{*}by{host}'}, 'engine_metrics: false', k=None)
+        self.assertEqual(detector.wait_k(30), 0)
+
+        # live variances of each host are compared with the ones at the selection
+        detector.k_cache.min_age = 0
+        n_calls = self.server.calls['/api/v1/query']
+
+        end = int(time.time())
+        self.assertListEqual(detector.query(end - 6 * 3600, end), [])
+
+        # stationary series do not trigger re-selection
+        self.assertEqual(len(detector.pending_k), 0)
+        self.assertEqual(self.server.calls['/api/v1/query'], n_calls + 1)
+
+    def test_emit_failure(self):
+        detector = self.create_detector({'datadog.a': 'avg:fake.a{*}by{host}'},
+                                        'engine_metrics: false\nfluent_batch_size: 30\nfluent_queue_size: 1\n'
+                                        'fluent_retry_interval: 0.5\nfluent_spill_path: %s' %
+                                        os.path.join(self.dir, 'spill'))
+
+        # the first emission fails, and the others are sent as usual
+        emit_many = detector.fluent_logger.emit_many
+        calls = []
+
+        def emit_many_or_fail(label, records, timestamp=None):
+            calls.append(len(records))
+            if len(calls) == 1:
+                return False
+            return emit_many(label, records, timestamp)
+
+        detector.fluent_logger.emit_many = emit_many_or_fail
+
+        # statistics are also popped by `query`
+        pop_stats = detector.emitter.pop_stats
+        stats = []
+
+        def keep_stats():
+            stats.append(pop_stats())
+            return stats[-1]
+
+        detector.emitter.pop_stats = keep_stats
+
+        # batches are spilled while the failed one waits for the retry, and nothing is dropped
+        self.assertListEqual(detector.query(0, 3599), [])
+        self.assertTrue(detector.emitter.flush(10))
+        keep_stats()
+
+        total = {key: sum(s[key] for s in stats) for key in ('failures', 'sent', 'spilled', 'replayed', 'dropped')}
+        self.assertEqual(total['failures'], 1)
+        self.assertGreater(total['spilled'], 0)
+        self.assertEqual(total['replayed'], total['spilled'])
+        self.assertEqual(total['dropped'], 0)
+        self.assertEqual(total['sent'], 3 * 60)
+        self.assertEqual(detector.n_emit_failed, 0)
+
+        # the failed batch has been sent again
+        self.assertEqual(len(calls), 3 * 60 // 30 + 1)
+        for _ in range(100):
+            if self.sink.n_records == 3 * 60:
+                break
+            time.sleep(0.05)
+        self.assertEqual(self.sink.n_records, 3 * 60)
+
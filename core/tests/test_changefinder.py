@@ -4,14 +4,24 @@ import os
 import sys
 
 import numpy as np
-from numpy.testing import assert_almost_equal
+from numpy.testing import assert_almost_equal, assert_array_equal
 
 try:
-    from core.changefinder.utils import aryule, aryule_levinson, arburg
+    from core.changefinder.utils import aryule, aryule_levinson, aryule_levinson_batch, arburg, arburg_batch, \
+        autocovariance, autocovariances
 except ImportError:
     sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
                                  os.pardir), os.pardir))
-    from core.changefinder.utils import aryule, aryule_levinson, arburg
+    from core.changefinder.utils import aryule, aryule_levinson, aryule_levinson_batch, arburg, arburg_batch, \
+        autocovariance, autocovariances
+
+from core.changefinder.ar_1d import AR_1D, ModelSelection
+from core.changefinder.window import Window
+from core.changefinder.levinson import LevinsonSolver
+from core.changefinder.changefinder_1d import ChangeFinder
+from core.changefinder.changefinder_bank import ChangeFinderBank
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'data')
 
 
 class ChangeFInderYuleWalkerTest(TestCase):
@@ -39,6 +49,52 @@ class ChangeFInderYuleWalkerTest(TestCase):
         assert_almost_equal(self.a2, aryule_levinson(self.c2, 9))
         assert_almost_equal(self.a3, aryule_levinson(self.c3, 2))
 
+    def test_aryule_levinson_batch(self):
+        C = np.vstack((self.c2[:3], self.c1, self.c3))
+        a = np.vstack((aryule_levinson(self.c2[:3], 2), aryule_levinson(self.c1, 2), self.a3))
+        assert_array_equal(a, aryule_levinson_batch(C, 2))
+
+        C = np.random.normal(size=(100, 10))
+        a = np.array([aryule_levinson(c, 9) for c in C])
+        assert_array_equal(a, aryule_levinson_batch(C, 9))
+
+
+class ChangeFinderLevinsonSolverTest(TestCase):
+
+    def setUp(self):
+        # slowly varying coefficients of an AR(2) process
+        x = np.zeros(300)
+        e = np.random.normal(size=x.size)
+        for t in range(2, x.size):
+            x[t] = 0.6 * x[t - 1] - 0.3 * x[t - 2] + e[t]
+
+        self.C = np.array([[np.dot(x[200 + i:], x[(200 + i - j):(x.size - j)]) for j in range(6)]
+                           for i in range(50)])
+
+    def test_solve(self):
+        solver = LevinsonSolver(2)
+        assert_array_equal(aryule_levinson(np.array([1., 2., 3.]), 2), solver.solve(np.array([1., 2., 3.])))
+        assert_array_equal(np.zeros(2), solver.solve(np.zeros(3)))
+
+        solver = LevinsonSolver(5)
+        for c in self.C:
+            assert_array_equal(aryule_levinson(c, 5), solver.solve(c))
+
+    def test_warm_start(self):
+        solver = LevinsonSolver(5, warm_start=True)
+        for c in self.C:
+            assert_almost_equal(aryule_levinson(c, 5), solver.solve(c), decimal=4)
+
+        self.assertEqual(solver.n_exact + solver.n_refined, self.C.shape[0])
+        self.assertGreater(solver.n_refined, 0)
+
+        # degenerate equations are always solved exactly
+        assert_array_equal(np.zeros(5), solver.solve(np.zeros(6)))
+        self.assertFalse(solver.is_warm)
+
+        c = np.array([1., 1., 1., 1., 1., 1.])
+        assert_array_equal(aryule_levinson(c, 5), solver.solve(c))
+
 
 class ChangeFinderBurgTest(TestCase):
 
@@ -58,3 +114,217 @@ class ChangeFinderBurgTest(TestCase):
         assert_almost_equal(self.a1, arburg(self.x1, 2), decimal=5)
         assert_almost_equal(self.a2, arburg(self.x2, 5), decimal=5)
         assert_almost_equal(self.a3, arburg(self.x3, 2))
+
+    def test_arburg_batch(self):
+        X = np.vstack((self.x1, self.x2[:5], self.x3))
+        a = np.vstack((arburg(self.x1, 2), arburg(self.x2[:5], 2), arburg(self.x3, 2)))
+        assert_array_equal(a, arburg_batch(X, 2))
+
+        X = np.random.normal(size=(100, 7))
+        a = np.array([arburg(x, 6) for x in X])
+        assert_array_equal(a, arburg_batch(X, 6))
+
+        # long windows (i.e. unrolled dot products)
+        X = np.random.normal(size=(20, 257))
+        a = np.array([arburg(x, 12) for x in X])
+        assert_array_equal(a, arburg_batch(X, 12))
+
+
+class ChangeFinderModelSelectionTest(TestCase):
+
+    def setUp(self):
+        self.x1 = np.loadtxt(os.path.join(DATA_DIR, 'cf_test.tsv'))
+        self.x2 = np.loadtxt(os.path.join(DATA_DIR, 'raw_data.csv'), delimiter=',', skiprows=1, usecols=2)
+
+    def select(self, x, max_k):
+        """Select k by estimating the AR(k) models one by one."""
+        selected_k = 1
+        min_aic = np.inf
+
+        for k in range(1, min(x.size, max_k + 1)):
+            ar = AR_1D(k)
+            ar.estimate(x)
+
+            aic = x.size * (np.log(max(2 * np.pi * ar.sigma, 1e-100)) + 1) + 2 * (k + 1)
+            if aic < min_aic:
+                selected_k = k
+                min_aic = aic
+
+        return selected_k, min_aic
+
+    def test_autocovariances(self):
+        mu, C = autocovariances(self.x1, 10)
+
+        for k in range(1, 11):
+            expected_mu, expected_c = autocovariance(self.x1, k)
+            assert_almost_equal(expected_mu, mu[k - 1])
+            assert_almost_equal(expected_c, C[k - 1, :(k + 1)])
+            assert_array_equal(C[k - 1, (k + 1):], 0.0)
+
+    def test_select(self):
+        for x, max_k in [(self.x1, 20), (self.x2, 10), (self.x1[:5], 10)]:
+            expected_k, expected_aic = self.select(x, max_k)
+            k, aic = ModelSelection(max_k).select(x)
+
+            self.assertEqual(expected_k, k)
+            self.assertAlmostEqual(expected_aic, aic, places=6)
+
+    def test_estimate(self):
+        aic, sigma = ModelSelection(10).estimate(self.x1)
+
+        for k in range(1, 11):
+            ar = AR_1D(k)
+            ar.estimate(self.x1)
+            self.assertAlmostEqual(ar.sigma, sigma[k - 1])
+
+        self.assertEqual(ModelSelection.argmin(aic), ModelSelection(10).select(self.x1))
+
+    def test_estimate_many(self):
+        aic1, sigma1 = ModelSelection(10).estimate(self.x1)
+        aic2, sigma2 = ModelSelection(10).estimate(self.x2)
+
+        # each series is modeled independently; a too short series is ignored
+        aic, sigma = ModelSelection(10).estimate_many([self.x1, self.x2, self.x1[:5]])
+        assert_almost_equal(aic, aic1 + aic2)
+        assert_almost_equal(sigma, (sigma1 + sigma2) / 2)
+
+        aic, sigma = ModelSelection(10).estimate_many([self.x1])
+        assert_array_equal(aic, aic1)
+        assert_array_equal(sigma, sigma1)
+
+        self.assertEqual(ModelSelection(10).estimate_many([])[0].size, 0)
+
+    def test_aic(self):
+        aic = ModelSelection(20).aic(self.x1)
+        self.assertEqual(aic.size, 20)
+        self.assertEqual(np.argmin(aic) + 1, ModelSelection(20).select(self.x1)[0])
+
+        self.assertEqual(ModelSelection(20).aic(self.x1[:1]).size, 0)
+        self.assertEqual(ModelSelection(20).select(self.x1[:1]), (1, np.inf))
+        self.assertEqual(ModelSelection(20).select(np.zeros(30))[0], 1)
+
+
+class ChangeFinderWindowTest(TestCase):
+
+    def test_append(self):
+        w = Window(3)
+        assert_array_equal(np.zeros(3), w.view())
+
+        for x in [1., 2., 3., 4.]:
+            w.append(x)
+
+        assert_array_equal(np.array([2., 3., 4.]), w.view())
+        assert_array_equal(np.array([4., 3., 2.]), w.reversed_view())
+        self.assertEqual(3., w.mean())
+
+    def test_equivalent_to_append_delete(self):
+        x = np.random.normal(size=100)
+        w = Window(7)
+        window = np.zeros(7)
+
+        for xi in x:
+            w.append(xi)
+            window = np.delete(np.append(window, xi), 0)
+
+            assert_array_equal(window, w.view())
+            self.assertEqual(np.mean(window), w.mean())
+
+    def test_rows(self):
+        w = Window(3, 2)
+
+        for x in [1., 2., 3., 4.]:
+            w.append(np.array([x, -x]))
+
+        assert_array_equal(np.array([[2., 3., 4.], [-2., -3., -4.]]), w.view())
+        assert_array_equal(np.array([[4., 3., 2.], [-4., -3., -2.]]), w.reversed_view())
+        assert_array_equal(np.array([3., -3.]), w.mean())
+
+
+class ChangeFinderScoreTest(TestCase):
+
+    def setUp(self):
+        self.x = np.loadtxt(os.path.join(DATA_DIR, 'cf_test.tsv'))
+        self.scores = np.loadtxt(os.path.join(DATA_DIR, 'cf_test_scores.tsv'))
+
+    def test_update(self):
+        cf = ChangeFinder(r=0.02, k=6, T1=10, T2=5)
+        scores = np.array([cf.update(x) for x in self.x])
+        assert_array_equal(self.scores, scores)
+
+    def test_residual_variance(self):
+        cf = ChangeFinder(r=0.02, k=6, T1=10, T2=5)
+        self.assertEqual(cf.residual_variance(), 0.0)
+
+        # AR(1) process with unit noise
+        x = np.zeros(3000)
+        e = np.random.RandomState(0).normal(size=x.size)
+        for t in range(1, x.size):
+            x[t] = 0.5 * x[t - 1] + e[t]
+
+        cf.update_many(x[:2000])
+        for v in x[2000:]:
+            cf.update(v)
+
+        self.assertEqual(cf.n, 3000)
+        self.assertTrue(0.5 < cf.residual_variance() < 2.0)
+
+    def test_update_many(self):
+        for is_yule, is_logloss in [(True, True), (True, False), (False, True), (False, False)]:
+            cf1 = ChangeFinder(r=0.02, k=6, T1=10, T2=5, is_yule=is_yule, is_logloss=is_logloss)
+            cf2 = ChangeFinder(r=0.02, k=6, T1=10, T2=5, is_yule=is_yule, is_logloss=is_logloss)
+
+            x = self.x[:300]
+            scores = np.array([cf1.update(xi) for xi in x])
+
+            # split into two batches to check the state is carried over
+            outliers1, changes1 = cf2.update_many(x[:100])
+            outliers2, changes2 = cf2.update_many(x[100:])
+
+            assert_array_equal(scores[:, 0], np.append(outliers1, outliers2))
+            assert_array_equal(scores[:, 1], np.append(changes1, changes2))
+
+            for sdar1, sdar2 in [(cf1.sdar_outlier, cf2.sdar_outlier), (cf1.sdar_change, cf2.sdar_change)]:
+                self.assertEqual(sdar1.mu, sdar2.mu)
+                self.assertEqual(sdar1.sigma, sdar2.sigma)
+                assert_array_equal(sdar1.c, sdar2.c)
+
+            assert_array_equal(cf1.ys.view(), cf2.ys.view())
+            assert_array_equal(cf1.changes.view(), cf2.changes.view())
+
+
+class ChangeFinderBankTest(TestCase):
+
+    def setUp(self):
+        x = np.loadtxt(os.path.join(DATA_DIR, 'cf_test.tsv'))[:200]
+
+        # columns: independent series including a constant one
+        self.X = np.column_stack((x, x[::-1], np.zeros(x.size), np.cumsum(x)))
+
+    def test_residual_variance(self):
+        bank = ChangeFinderBank(self.X.shape[1], r=0.02, k=3, T1=10, T2=5)
+        assert_array_equal(bank.residual_variance(), 0.0)
+
+        bank.update_many(self.X[:100])
+        bank.update(self.X[100])
+        bank.update_many(self.X[101:])
+
+        # variance of prediction errors of each model is the same as an independent ChangeFinder
+        variances = bank.residual_variance()
+        for i in range(self.X.shape[1]):
+            cf = ChangeFinder(r=0.02, k=3, T1=10, T2=5)
+            cf.update_many(self.X[:, i])
+
+            self.assertAlmostEqual(variances[i], cf.residual_variance())
+
+    def test_update_many(self):
+        for is_yule, is_logloss in [(True, True), (True, False), (False, True), (False, False)]:
+            bank = ChangeFinderBank(self.X.shape[1], r=0.02, k=3, T1=10, T2=5,
+                                    is_yule=is_yule, is_logloss=is_logloss)
+            outliers, changes = bank.update_many(self.X)
+
+            for i in range(self.X.shape[1]):
+                cf = ChangeFinder(r=0.02, k=3, T1=10, T2=5, is_yule=is_yule, is_logloss=is_logloss)
+                scores = np.array([cf.update(x) for x in self.X[:, i]])
+
+                assert_array_equal(scores[:, 0], outliers[:, i])
+                assert_array_equal(scores[:, 1], changes[:, i])
@@ -0,0 +1,91 @@
+from unittest import TestCase
+
+import os
+import sys
+import struct
+import tempfile
+import numpy as np
+
+try:
+    from core import checkpoint
+    from core.changefinder.changefinder_1d import ChangeFinder
+except ImportError:
+    sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir), os.pardir))
+    from core import checkpoint
+    from core.changefinder.changefinder_1d import ChangeFinder
+
+
+class CheckpointTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'changefinder.ckpt')
+
+        self.sections = {'datadog.cpu': {'config': {'query': 'system.cpu.idle{*}by{host}'},
+                                         'params': {'r': 0.02, 'k': 3, 'T1': 10, 'T2': 5, 'is_yule': True}}}
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        models = [(('datadog.cpu', 'host:a'), 1500000000000, np.arange(5, dtype=np.float64)),
+                  (('datadog.cpu', 'host:b'), None, np.random.normal(size=3))]
+        checkpoint.save(self.path, self.sections, models)
+
+        header, states = checkpoint.load(self.path)
+        self.assertEqual(header['sections'], self.sections)
+        self.assertEqual(len(header['models']), 2)
+
+        for m, (key, last_time, state) in zip(header['models'], models):
+            self.assertEqual((m['section'], m['scope']), key)
+            self.assertEqual(m['last_time'], last_time)
+            np.testing.assert_array_equal(states[m['offset']:(m['offset'] + m['size'])], state)
+
+        # temporary file has been replaced
+        self.assertEqual(os.listdir(self.dir.name), ['changefinder.ckpt'])
+
+    def test_empty(self):
+        checkpoint.save(self.path, {}, [])
+
+        header, states = checkpoint.load(self.path)
+        self.assertEqual(header['models'], [])
+        self.assertEqual(states.size, 0)
+
+    def test_model_state(self):
+        x = np.cumsum(np.random.normal(size=200))
+
+        cf = ChangeFinder(r=0.02, k=3, T1=10, T2=5)
+        cf.update_many(x[:100])
+        checkpoint.save(self.path, self.sections, [(('datadog.cpu', 'host:a'), None, cf.get_state())])
+
+        header, states = checkpoint.load(self.path)
+        m = header['models'][0]
+
+        restored = ChangeFinder(r=0.02, k=3, T1=10, T2=5)
+        restored.set_state(states[m['offset']:(m['offset'] + m['size'])])
+
+        # bias correction of the variance depends on the number of seen inputs
+        self.assertEqual(restored.n, cf.n)
+        self.assertEqual(restored.residual_variance(), cf.residual_variance())
+
+        # restored model continues exactly as the original one
+        for expected, actual in zip(cf.update_many(x[100:]), restored.update_many(x[100:])):
+            np.testing.assert_array_equal(expected, actual)
+
+    def test_unsupported_version(self):
+        checkpoint.save(self.path, self.sections, [])
+
+        with open(self.path, 'r+b') as f:
+            f.seek(len(checkpoint.MAGIC))
+            f.write(struct.pack('<I', checkpoint.VERSION + 1))
+
+        with self.assertRaises(ValueError):
+            checkpoint.load(self.path)
+
+    def test_not_checkpoint(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'query: system.cpu.idle{*}by{host}\n')
+
+        with self.assertRaises(ValueError):
+            checkpoint.load(self.path)
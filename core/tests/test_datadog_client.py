@@ -2,14 +2,25 @@ from unittest import TestCase
 
 import os
 import sys
+import json
 import time
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
 
 try:
-    from core.datadog_client import DatadogClient
+    from core.datadog_client import DatadogClient, is_multi_query
 except ImportError:
     sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
                                  os.pardir), os.pardir))
-    from core.datadog_client import DatadogClient
+    from core.datadog_client import DatadogClient, is_multi_query
+
+# local stand-in of Datadog API
+try:
+    from fake_datadog import FakeDatadogServer
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'cli'))
+    from fake_datadog import FakeDatadogServer
 
 
 class DatadogClientTest(TestCase):
@@ -21,10 +32,173 @@ class DatadogClientTest(TestCase):
         self.query = 'system.cpu.idle{*}by{host}'
 
     def test_get_series(self):
-        series = self.dd.get_series(self.start, self.end, self.query)
+        series = self.dd.get_series(self.start, self.end, self.query).to_dicts()
         self.assertTrue((series[0]['time'] / 1000 >= self.start) and
                         (series[-1]['time'] / 1000 <= self.end))
 
     def test_get_series_invalid_parameters(self):
         with self.assertRaises(RuntimeError):
             self.dd.get_series(self.start, self.end, 'xxx')
+
+
+class DatadogClientFakeServerTest(TestCase):
+
+    def setUp(self):
+        self.server = FakeDatadogServer(hosts=3, resolution=60).start()
+        self.dd = DatadogClient('fake', 'fake', api_host=self.server.url, max_retries=0)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_get_series_many(self):
+        queries = ['system.cpu.idle{*}by{host}', 'avg:system.load.1{*}']
+        series_many = self.dd.get_series_many(0, 599, queries)
+
+        # a single call is split by `query_index`
+        self.assertEqual(self.server.calls, {'/api/v1/query': 1})
+        self.assertEqual(len(series_many), 2)
+
+        self.assertEqual([s.scope for s in series_many[0]], ['host:h0', 'host:h1', 'host:h2'])
+        self.assertTrue(all(s.metric == 'system.cpu.idle' for s in series_many[0]))
+        self.assertEqual(len(series_many[0]), 3 * 10)
+
+        self.assertEqual([s.scope for s in series_many[1]], ['*'])
+        self.assertTrue(all(s.metric == 'system.load.1' for s in series_many[1]))
+        self.assertEqual(len(series_many[1]), 10)
+
+
+class DatadogClientCoalesceTest(TestCase):
+
+    def test_is_multi_query(self):
+        self.assertFalse(is_multi_query('system.cpu.idle{*}by{host}'))
+        self.assertFalse(is_multi_query('avg:system.disk.free{host:a,env:b}.rollup(avg, 60)'))
+        self.assertTrue(is_multi_query('system.cpu.idle{*},system.load.1{*}'))
+
+    def test_coalesce(self):
+        queries = ['a{*}', 'b{*}', 'a{*}', 'c{*},d{*}', 'e{*}', 'f{*}.rollup(avg, 60)']
+        self.assertListEqual(DatadogClient.coalesce(queries, 2),
+                             [['a{*}', 'b{*}'], ['c{*},d{*}'], ['e{*}', 'f{*}.rollup(avg, 60)']])
+        self.assertListEqual(DatadogClient.coalesce(queries, 1),
+                             [['a{*}'], ['b{*}'], ['c{*},d{*}'], ['e{*}'], ['f{*}.rollup(avg, 60)']])
+
+
+class LocalDatadogHandler(BaseHTTPRequestHandler):
+
+    """Stand-in of Datadog API which replies scripted responses in order."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        self.server.ports.add(self.client_address[1])
+
+        status, headers, body = self.server.responses.pop(0) if len(self.server.responses) > 0 else \
+            (200, {}, {'status': 'ok', 'series': []})
+
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalDatadogServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), LocalDatadogHandler)
+        self.responses = []
+        self.requests = []
+        self.ports = set()
+
+
+class DatadogClientTransportTest(TestCase):
+
+    def setUp(self):
+        self.server = LocalDatadogServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.dd = DatadogClient('app', 'api', api_host='http://127.0.0.1:%d' % self.server.server_address[1],
+                                timeout=5, max_retries=2, backoff=0.01)
+
+        self.series = {'status': 'ok',
+                       'series': [{'metric': 'system.cpu.idle', 'scope': 'host:a',
+                                   'pointlist': [[1000.0, 1.0], [2000.0, 2.0]]}]}
+
+    def tearDown(self):
+        self.dd.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        for _ in range(5):
+            self.dd.get_series(0, 10, 'system.cpu.idle{*}')
+
+        # all calls share a connection
+        self.assertEqual(len(self.server.ports), 1)
+
+        method, path, headers = self.server.requests[0]
+        self.assertTrue(path.startswith('/api/v1/query?'))
+        self.assertEqual(headers['DD-API-KEY'], 'api')
+        self.assertEqual(headers['DD-APPLICATION-KEY'], 'app')
+
+    def test_retry(self):
+        self.server.responses = [(503, {}, {'errors': ['unavailable']}),
+                                 (429, {'X-RateLimit-Reset': '0'}, {'errors': ['rate limited']}),
+                                 (200, {}, self.series)]
+
+        series = self.dd.get_series(0, 10, 'system.cpu.idle{*}')
+        self.assertEqual(len(series), 2)
+
+        stats = self.dd.pop_stats()['/api/v1/query']
+        self.assertEqual(stats['calls'], 1)
+        self.assertEqual(stats['retries'], 2)
+        self.assertEqual(stats['failures'], 0)
+        self.assertGreater(stats['latency'], 0.0)
+
+        # statistics are reset
+        self.assertDictEqual(self.dd.pop_stats(), {})
+
+    def test_retry_exhausted(self):
+        self.server.responses = [(500, {}, {'errors': ['internal']})] * 3
+
+        with self.assertRaises(RuntimeError):
+            self.dd.get_series(0, 10, 'system.cpu.idle{*}')
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.dd.pop_stats()['/api/v1/query']['failures'], 1)
+
+    def test_no_retry(self):
+        self.server.responses = [(400, {}, {'errors': ['Error parsing query']})]
+
+        with self.assertRaisesRegex(RuntimeError, 'Error parsing query'):
+            self.dd.get_series(0, 10, 'xxx')
+
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_rate_limit(self):
+        self.server.responses = [(200, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '0.5'}, self.series)]
+
+        self.dd.get_series(0, 10, 'system.cpu.idle{*}')
+
+        # next call waits until the rate limit is reset
+        start = time.time()
+        self.dd.get_series(0, 10, 'system.cpu.idle{*}')
+        self.assertGreaterEqual(time.time() - start, 0.4)
+
+    def test_post_metric(self):
+        self.dd.post_metric('changefinder.test', 1.0, 'localhost')
+
+        method, path, _ = self.server.requests[0]
+        self.assertEqual((method, path), ('POST', '/api/v1/series'))
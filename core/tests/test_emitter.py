@@ -0,0 +1,229 @@
+from unittest import TestCase
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+
+try:
+    from core.emitter import Emitter
+except ImportError:
+    sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir), os.pardir))
+    from core.emitter import Emitter
+
+
+class LocalSender:
+
+    def __init__(self):
+        """Stand-in of ForwardSender which keeps sent records, and fails while `is_down`.
+
+        """
+        self.records = []
+        self.is_down = False
+        self.last_error = None
+
+        # blocks sending while cleared
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def emit_many(self, label, records, timestamp=None):
+        self.gate.wait()
+        if self.is_down:
+            self.last_error = ConnectionRefusedError('down')
+            return False
+        self.records += [(label, timestamp, r) for r in records]
+        return True
+
+    def clear_last_error(self):
+        self.last_error = None
+
+
+class EmitterTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.spill_path = os.path.join(self.dir, 'spill')
+        self.sender = LocalSender()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def batches(self, n, size=3):
+        return [[{'i': i * size + j} for j in range(size)] for i in range(n)]
+
+    def values(self):
+        return [r['i'] for _, _, r in self.sender.records]
+
+    def test_put(self):
+        emitter = Emitter(self.sender, queue_size=10)
+        for batch in self.batches(5):
+            self.assertTrue(emitter.put('metric', batch, timestamp=100))
+
+        self.assertTrue(emitter.flush(5))
+        self.assertEqual(self.values(), list(range(15)))
+        self.assertEqual(self.sender.records[0], ('metric', 100, {'i': 0}))
+
+        stats = emitter.pop_stats()
+        self.assertEqual(stats['sent'], 15)
+        self.assertEqual(stats['spilled'], 0)
+        self.assertEqual(stats['queued'], 0)
+
+        emitter.close(1)
+
+    def test_spill(self):
+        emitter = Emitter(self.sender, queue_size=2, spill_path=self.spill_path, retry_interval=0.01)
+
+        # fluentd is down; batches overflowing the queue are spilled without blocking
+        self.sender.is_down = True
+        start = time.time()
+        for batch in self.batches(10):
+            self.assertTrue(emitter.put('metric', batch))
+        self.assertLess(time.time() - start, 1.0)
+
+        stats = emitter.pop_stats()
+        n_spilled = stats['spilled']
+        self.assertGreaterEqual(n_spilled, 7 * 3)
+        self.assertGreater(stats['spill_bytes'], 0)
+
+        # replayed in order once fluentd recovers
+        self.sender.is_down = False
+        self.assertTrue(emitter.flush(5))
+        self.assertEqual(self.values(), list(range(30)))
+        self.assertEqual(os.path.getsize(self.spill_path), 0)
+
+        stats = emitter.pop_stats()
+        self.assertEqual(stats['replayed'], n_spilled)
+        self.assertEqual(stats['sent'], 30)
+        self.assertEqual(stats['spill_bytes'], 0)
+
+        emitter.close(1)
+
+    def test_drop(self):
+        emitter = Emitter(self.sender, queue_size=1)
+
+        # the worker holds the first batch, and the queue keeps the second one
+        self.sender.gate.clear()
+        results = [emitter.put('metric', batch) for batch in self.batches(4)]
+        while emitter.queue.qsize() < 1 or emitter.current is None:
+            results.append(emitter.put('metric', []))
+            time.sleep(0.01)
+        self.assertFalse(emitter.put('metric', [{'i': -1}]))
+
+        self.assertEqual(emitter.pop_stats()['dropped'], sum(3 for r in results[:4] if not r) + 1)
+
+        self.sender.gate.set()
+        emitter.close(1)
+
+    def test_close(self):
+        emitter = Emitter(self.sender, queue_size=100, spill_path=self.spill_path, retry_interval=0.01)
+
+        self.sender.is_down = True
+        for batch in self.batches(5):
+            emitter.put('metric', batch)
+
+        # batches in memory are spilled on shutdown, and replayed first by the next emitter
+        emitter.close(0.1)
+        self.assertGreater(os.path.getsize(self.spill_path), 0)
+
+        self.sender.is_down = False
+        emitter = Emitter(self.sender, queue_size=100, spill_path=self.spill_path)
+        emitter.put('metric', [{'i': 15}])
+
+        self.assertTrue(emitter.flush(5))
+        self.assertEqual(self.values(), list(range(16)))
+
+        emitter.close(1)
+
+    def test_resume_replay(self):
+        emitter = Emitter(self.sender, queue_size=1, spill_path=self.spill_path)
+
+        # spill while the worker is blocked
+        self.sender.gate.clear()
+        for batch in self.batches(5):
+            emitter.put('metric', batch)
+        self.sender.gate.set()
+        self.assertTrue(emitter.flush(5))
+        emitter.close(1)
+
+        # nothing is replayed twice
+        emitter = Emitter(self.sender, queue_size=1, spill_path=self.spill_path)
+        self.assertTrue(emitter.flush(5))
+        self.assertEqual(self.values(), list(range(15)))
+        emitter.close(1)
+
+    def test_close_while_sending(self):
+        emitter = Emitter(self.sender, queue_size=1, spill_path=self.spill_path)
+
+        # the worker is blocked in sending the first batch; the second one is queued, and the others are spilled
+        self.sender.gate.clear()
+        for batch in self.batches(5):
+            emitter.put('metric', batch)
+        thread = emitter.thread
+
+        emitter.close(0.1)
+        self.assertTrue(thread.is_alive())
+
+        # the blocked send completes after shutdown, but the worker takes no more batches
+        self.sender.gate.set()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.values(), [0, 1, 2])
+
+        # batches in flight are sent again (at least once), and nothing is lost
+        emitter = Emitter(self.sender, queue_size=1, spill_path=self.spill_path)
+        self.assertTrue(emitter.flush(5))
+        self.assertEqual(self.values(), [0, 1, 2] + list(range(15)))
+        emitter.close(1)
+
+    def test_close_while_replaying(self):
+        emitter = Emitter(self.sender, queue_size=1, spill_path=self.spill_path, retry_interval=0.01)
+        self.sender.is_down = True
+        for batch in self.batches(5):
+            emitter.put('metric', batch)
+        emitter.close(0.1)
+        self.sender.is_down = False
+
+        # the worker is blocked in replaying the first spilled batch
+        emitter = Emitter(self.sender, queue_size=1, spill_path=self.spill_path)
+        self.sender.gate.clear()
+        self.assertFalse(emitter.flush(0.1))
+        thread = emitter.thread
+
+        emitter.close(0.1)
+        self.sender.gate.set()
+        thread.join(1)
+
+        # the replayed batch is committed, since the spill file has not been rewritten
+        emitter = Emitter(self.sender, queue_size=1, spill_path=self.spill_path)
+        self.assertTrue(emitter.flush(5))
+        self.assertEqual(self.values(), list(range(15)))
+        emitter.close(1)
+
+
+    def test_close_rewrites_while_replaying(self):
+        emitter = Emitter(self.sender, queue_size=1, spill_path=self.spill_path, retry_interval=0.01)
+        self.sender.is_down = True
+        for batch in self.batches(5):
+            emitter.put('metric', batch)
+        emitter.close(0.1)
+        self.sender.is_down = False
+
+        emitter = Emitter(self.sender, queue_size=1, spill_path=self.spill_path)
+        self.sender.gate.clear()
+        self.assertFalse(emitter.flush(0.1))
+        thread = emitter.thread
+
+        # a queued batch makes `close` rewrite the spill file while the first spilled batch is being replayed
+        emitter.queue.put_nowait(('metric', 0, [{'i': 15}]))
+        emitter.close(0.1)
+        self.sender.gate.set()
+        thread.join(1)
+
+        # the offset of the replayed batch is not committed into the rewritten file
+        emitter = Emitter(self.sender, queue_size=1, spill_path=self.spill_path)
+        self.assertTrue(emitter.flush(5))
+        self.assertEqual(self.values(), [0, 1, 2, 15] + list(range(15)))
+        emitter.close(1)
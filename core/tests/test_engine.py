@@ -0,0 +1,72 @@
+from unittest import TestCase
+
+import os
+import sys
+import numpy as np
+from numpy.testing import assert_array_equal
+
+try:
+    from core.engine import SSTEngine, create_engine, nbytes
+    from core.changefinder.changefinder_1d import ChangeFinder
+except ImportError:
+    sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir), os.pardir))
+    from core.engine import SSTEngine, create_engine, nbytes
+    from core.changefinder.changefinder_1d import ChangeFinder
+
+
+class EngineTestCase(TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        self.xs = np.concatenate((rs.normal(0., 1., 150), rs.normal(5., 1., 150)))
+
+    def test_create_engine(self):
+        self.assertIsInstance(create_engine('changefinder', {'r': 0.02, 'k': 3, 'T1': 5, 'T2': 5}), ChangeFinder)
+        self.assertIsInstance(create_engine('sst', {'w': 10, 'r': 2}), SSTEngine)
+
+        with self.assertRaises(KeyError):
+            create_engine('unknown', {})
+
+    def test_sst_update_many(self):
+        # same initial vector of the Lanczos method
+        np.random.seed(0)
+        a = SSTEngine(w=10, r=2)
+        np.random.seed(0)
+        b = SSTEngine(w=10, r=2)
+
+        outliers, changes = a.update_many(self.xs)
+        expected = np.array([b.update(x)[1] for x in self.xs])
+
+        assert_array_equal(outliers, np.zeros(self.xs.size))
+        assert_array_equal(changes, expected)
+
+        # no score until enough points are seen
+        self.assertTrue(np.all(changes[:(a.sst.span - 1)] == 0.))
+        self.assertTrue(np.all(np.isfinite(changes)))
+
+    def test_sst_state(self):
+        a = SSTEngine(w=10, r=2)
+        a.update_many(self.xs[:100])
+
+        b = SSTEngine(w=10, r=2)
+        b.set_state(a.get_state())
+
+        assert_array_equal(a.update_many(self.xs[100:])[1], b.update_many(self.xs[100:])[1])
+
+        with self.assertRaises(AssertionError):
+            SSTEngine(w=20, r=2).set_state(a.get_state())
+
+    def test_nbytes(self):
+        cf = ChangeFinder(r=0.02, k=3, T1=5, T2=5)
+        self.assertGreater(nbytes(cf), 0)
+
+        sst = SSTEngine(w=10, r=2)
+        self.assertGreaterEqual(nbytes(sst), sst.sst.span * 8)
+
+        # views and shared arrays are counted only once
+        x = np.zeros(100)
+        self.assertEqual(nbytes([x, x, x[10:]]), x.nbytes)
+
+        # kernels and modules are shared by all models
+        self.assertEqual(nbytes({'kernel': np.sum, 'module': np}), 0)
@@ -0,0 +1,114 @@
+from unittest import TestCase
+
+import os
+import sys
+import time
+import socket
+import msgpack
+import threading
+
+try:
+    from core.fluent_forward import ForwardSender
+except ImportError:
+    sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir), os.pardir))
+    from core.fluent_forward import ForwardSender
+
+try:
+    from fake_datadog import FluentSink
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'cli'))
+    from fake_datadog import FluentSink
+
+
+class ForwardSenderTestCase(TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+
+        self.received = []
+        self.thread = threading.Thread(target=self.receive)
+
+    def tearDown(self):
+        self.server.close()
+
+    def receive(self):
+        conn, _ = self.server.accept()
+        unpacker = msgpack.Unpacker(raw=False)
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                break
+            unpacker.feed(data)
+            self.received += list(unpacker)
+        conn.close()
+
+    def test_emit_many(self):
+        self.thread.start()
+        sender = ForwardSender('test', host='127.0.0.1', port=self.server.getsockname()[1])
+
+        records = [{'value': i} for i in range(5)]
+        self.assertTrue(sender.emit_many('metric', records, timestamp=100))
+        self.assertTrue(sender.emit_many('metric', []))
+
+        sender.close()
+        self.thread.join(5)
+
+        # a single message in PackedForward mode
+        self.assertEqual(len(self.received), 1)
+
+        tag, entries, option = self.received[0]
+        self.assertEqual(tag, 'test.metric')
+        self.assertEqual(option, {'size': 5})
+
+        unpacker = msgpack.Unpacker(raw=False)
+        unpacker.feed(entries)
+        self.assertEqual(list(unpacker), [[100, r] for r in records])
+
+    def test_emit_many_failure(self):
+        # nobody listens to the port
+        port = self.server.getsockname()[1]
+        self.server.close()
+
+        sender = ForwardSender('test', host='127.0.0.1', port=port)
+        self.assertFalse(sender.emit_many('metric', [{'value': 1}]))
+        self.assertIsNotNone(sender.last_error)
+
+        # failed records are not buffered
+        self.assertFalse(sender.pendings)
+        sender.close()
+
+    def test_fluent_logger_internals(self):
+        # `emit_many` relies on these internals of fluent-logger
+        port = self.server.getsockname()[1]
+        self.server.close()
+
+        sender = ForwardSender('test', host='127.0.0.1', port=port)
+        for name in ('lock', 'pendings', 'last_error', '_send_data', '_close'):
+            self.assertTrue(hasattr(sender, name), name)
+
+        # a record of `emit` is buffered while fluentd is down, and records of `emit_many` fail as a whole
+        self.assertFalse(sender.emit('metric', {'value': 0}))
+        self.assertTrue(sender.pendings)
+        self.assertFalse(sender.emit_many('metric', [{'value': 1}]))
+        self.assertIsNotNone(sender.last_error)
+
+        # once fluentd is up, the buffered record goes first, and the socket is reconnected
+        sink = FluentSink(port).start()
+        try:
+            self.assertTrue(sender.emit_many('metric', [{'value': i} for i in range(1, 4)]))
+            self.assertFalse(sender.pendings)
+            sender.close()
+
+            for _ in range(100):
+                if sink.n_records == 4:
+                    break
+                time.sleep(0.05)
+        finally:
+            sink.stop()
+
+        self.assertEqual(sink.n_messages, 2)
+        self.assertEqual(sink.records, [('test.metric', {'value': i}) for i in range(4)])
+
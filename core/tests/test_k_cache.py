@@ -0,0 +1,89 @@
+from unittest import TestCase
+
+import os
+import sys
+import json
+import tempfile
+
+try:
+    from core.k_cache import KCache
+except ImportError:
+    sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir), os.pardir))
+    from core.k_cache import KCache
+
+
+class KCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'k.json')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_put(self):
+        cache = KCache(self.path)
+        cache.put('datadog.cpu', 'system.cpu.idle{*}', 2, [10.0, 5.0, 7.0], 0.5)
+
+        # shared with another process
+        entry = KCache(self.path).get('datadog.cpu', 'system.cpu.idle{*}')
+        self.assertEqual(entry['k'], 2)
+        self.assertEqual(entry['aic'], [10.0, 5.0, 7.0])
+        self.assertEqual(entry['sigma'], 0.5)
+
+        self.assertIsNone(cache.get('datadog.cpu', 'system.cpu.user{*}'))
+        self.assertEqual(os.listdir(self.dir.name), ['k.json'])
+
+    def test_merge(self):
+        cache1 = KCache(self.path)
+        cache2 = KCache(self.path)
+
+        cache1.put('datadog.cpu', 'system.cpu.idle{*}', 2, [], 0.5)
+        cache2.put('datadog.disk', 'system.disk.free{*}', 3, [], 0.5)
+
+        self.assertIsNotNone(KCache(self.path).get('datadog.cpu', 'system.cpu.idle{*}'))
+        self.assertIsNotNone(KCache(self.path).get('datadog.disk', 'system.disk.free{*}'))
+
+    def test_in_memory(self):
+        cache = KCache()
+        cache.put('datadog.cpu', 'system.cpu.idle{*}', 2, [], 0.5)
+        self.assertEqual(cache.get('datadog.cpu', 'system.cpu.idle{*}')['k'], 2)
+
+    def test_expired(self):
+        cache = KCache(ttl=60)
+        entry = cache.put('datadog.cpu', 'system.cpu.idle{*}', 2, [], 0.5)
+        self.assertFalse(cache.is_expired(entry))
+
+        entry['time'] -= 120
+        self.assertTrue(cache.is_expired(entry))
+
+    def test_drifted(self):
+        cache = KCache(drift_ratio=4.0, min_age=60)
+        entry = cache.put('datadog.cpu', 'system.cpu.idle{*}', 2, [], 0.5)
+
+        # too young to be re-selected
+        self.assertFalse(cache.is_drifted(entry, 100.0))
+
+        entry['time'] -= 120
+        self.assertFalse(cache.is_drifted(entry, 1.0))
+        self.assertFalse(cache.is_drifted(entry, 0.2))
+        self.assertTrue(cache.is_drifted(entry, 2.5))
+        self.assertTrue(cache.is_drifted(entry, 0.1))
+
+    def test_drifted_zero(self):
+        cache = KCache(drift_ratio=4.0, min_age=0)
+
+        # variance of a constant series is not compared by the ratio
+        entry = cache.put('datadog.cpu', 'system.cpu.idle{*}', 2, [], 0.0)
+        self.assertFalse(cache.is_drifted(entry, 1e-3))
+        self.assertFalse(cache.is_drifted(entry, 0.0))
+
+        entry = cache.put('datadog.cpu', 'system.cpu.idle{*}', 2, [], 0.5)
+        self.assertFalse(cache.is_drifted(entry, 0.0))
+
+    def test_unsupported_version(self):
+        with open(self.path, 'w') as f:
+            json.dump({'version': 0, 'entries': {'datadog.cpu': {'system.cpu.idle{*}': {}}}}, f)
+
+        self.assertIsNone(KCache(self.path).get('datadog.cpu', 'system.cpu.idle{*}'))
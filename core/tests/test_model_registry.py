@@ -0,0 +1,65 @@
+from unittest import TestCase
+
+import os
+import sys
+
+try:
+    from core.model_registry import ModelRegistry
+except ImportError:
+    sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir), os.pardir))
+    from core.model_registry import ModelRegistry
+
+
+class ModelRegistryTestCase(TestCase):
+
+    def setUp(self):
+        self.registry = ModelRegistry(max_models=2)
+
+    def test_get(self):
+        model = self.registry.get(('datadog.cpu', 'host:a'), object)
+        self.assertIs(model, self.registry.get(('datadog.cpu', 'host:a'), object))
+        self.assertEqual(self.registry.n_live, 1)
+
+    def test_lru_eviction(self):
+        self.registry.get(('datadog.cpu', 'host:a'), object)
+        self.registry.get(('datadog.cpu', 'host:b'), object)
+
+        # `host:a` becomes the most recently used one
+        self.registry.get(('datadog.cpu', 'host:a'), object)
+        self.registry.get(('datadog.cpu', 'host:c'), object)
+
+        self.assertIn(('datadog.cpu', 'host:a'), self.registry)
+        self.assertNotIn(('datadog.cpu', 'host:b'), self.registry)
+        self.assertEqual(self.registry.n_live, 2)
+        self.assertEqual(self.registry.n_evicted, 1)
+
+    def test_shrink(self):
+        self.registry.get(('datadog.cpu', 'host:a'), object)
+        self.registry.get(('datadog.cpu', 'host:b'), object)
+
+        self.registry.max_models = 1
+        self.registry.evict()
+
+        self.assertIn(('datadog.cpu', 'host:b'), self.registry)
+        self.assertEqual(self.registry.n_evicted, 1)
+
+    def test_drop(self):
+        self.registry.get(('datadog.cpu', 'host:a'), object)
+        self.registry.get(('datadog.disk', '*'), object)
+
+        self.registry.drop('datadog.cpu')
+
+        self.assertNotIn(('datadog.cpu', 'host:a'), self.registry)
+        self.assertIn(('datadog.disk', '*'), self.registry)
+        self.assertEqual(self.registry.n_evicted, 0)
+
+    def test_last_times(self):
+        self.registry.get(('datadog.cpu', 'host:a'), object)
+        self.registry.last_times[('datadog.cpu', 'host:a')] = 1500000000000
+
+        self.registry.get(('datadog.cpu', 'host:b'), object)
+        self.registry.get(('datadog.cpu', 'host:c'), object)
+
+        # last-seen timestamp of an evicted model is forgotten
+        self.assertNotIn(('datadog.cpu', 'host:a'), self.registry.last_times)
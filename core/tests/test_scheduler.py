@@ -0,0 +1,110 @@
+from unittest import TestCase
+
+import os
+import sys
+
+try:
+    from core.scheduler import Scheduler, TokenBucket
+except ImportError:
+    sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir), os.pardir))
+    from core.scheduler import Scheduler, TokenBucket
+
+
+class SchedulerTestCase(TestCase):
+
+    def setUp(self):
+        self.tick = 600
+        self.t0 = 1000 * self.tick
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(1.0, 10.0, 0)
+        bucket.consume(15)
+        self.assertEqual(bucket.tokens, -5)
+
+        bucket.refill(10)
+        self.assertEqual(bucket.tokens, 5)
+
+        bucket.refill(100)
+        self.assertEqual(bucket.tokens, 10)
+
+    def test_next_tick(self):
+        scheduler = Scheduler(self.tick, 300, self.t0)
+        self.assertEqual(scheduler.next_tick(self.t0), self.t0 + self.tick)
+        self.assertEqual(scheduler.next_tick(self.t0 + 0.5), self.t0 + self.tick)
+        self.assertEqual(scheduler.next_tick(self.t0 + self.tick - 1), self.t0 + self.tick)
+
+    def test_intervals(self):
+        scheduler = Scheduler(self.tick, 300, self.t0)
+        scheduler.update_sections({'datadog.a': {}, 'datadog.b': {'interval': 1800}, 'datadog.c': {'interval': 1000}},
+                                  self.t0 - self.tick + 1)
+
+        # rounded up to a multiple of the tick
+        self.assertEqual(scheduler.sections['datadog.c']['interval'], 1200)
+
+        counts = {'datadog.a': 0, 'datadog.b': 0, 'datadog.c': 0}
+        covered = {'datadog.a': [], 'datadog.b': [], 'datadog.c': []}
+
+        for i in range(1, 19):
+            t = self.t0 + i * self.tick
+            for start, end, section_names in scheduler.plan(t, len):
+                for section_name in section_names:
+                    counts[section_name] += 1
+                    covered[section_name].append((start, end))
+                scheduler.done(section_names, end, [])
+
+        self.assertDictEqual(counts, {'datadog.a': 18, 'datadog.b': 6, 'datadog.c': 9})
+
+        # consecutive query ranges have no gaps
+        for ranges in covered.values():
+            for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]):
+                self.assertEqual(start, end + 1)
+
+    def test_budget(self):
+        # 60 calls per hour = 10 calls per tick
+        scheduler = Scheduler(self.tick, 60, self.t0)
+        scheduler.bucket.tokens = 0
+
+        sections = {'datadog.%02d' % i: {'priority': 1 if i < 5 else 0} for i in range(15)}
+        scheduler.update_sections(sections, self.t0 - self.tick + 1)
+
+        t = self.t0 + self.tick
+        planned = [section_name for _, _, section_names in scheduler.plan(t, len) for section_name in section_names]
+
+        # high-priority sections first
+        self.assertEqual(len(planned), 10)
+        self.assertTrue(all('datadog.%02d' % i in planned for i in range(5)))
+
+        scheduler.done(planned, t, [])
+        scheduler.spend(len(planned))
+
+        # deferred sections are queried at the next tick from where they stopped
+        t += self.tick
+        plan = scheduler.plan(t, len)
+        deferred = [section_name for start, _, section_names in plan if start == self.t0 - self.tick + 1
+                    for section_name in section_names]
+        self.assertEqual(len(deferred), 5)
+
+        # calls never exceed the limit in the long run
+        n_calls = 0
+        for i in range(36):
+            for start, end, section_names in plan:
+                scheduler.done(section_names, end, [])
+                scheduler.spend(len(section_names))
+                n_calls += len(section_names)
+            t += self.tick
+            plan = scheduler.plan(t, len)
+        self.assertLessEqual(n_calls, 60 * 6 + 10)
+
+    def test_failure(self):
+        scheduler = Scheduler(self.tick, 300, self.t0)
+        scheduler.update_sections({'datadog.a': {}, 'datadog.b': {}}, self.t0 - self.tick + 1)
+
+        t = self.t0 + self.tick
+        for start, end, section_names in scheduler.plan(t, len):
+            scheduler.done(section_names, end, ['datadog.a'])
+
+        # a failed section is queried again from the same start
+        plan = scheduler.plan(t + self.tick, len)
+        self.assertIn((self.t0 - self.tick + 1, t + self.tick, ['datadog.a']), plan)
+        self.assertIn((t + 1, t + self.tick, ['datadog.b']), plan)
@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+import os
+import sys
+import numpy as np
+from numpy.testing import assert_array_equal
+
+try:
+    from core.series import Series, ScopeSeries, merge
+except ImportError:
+    sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir), os.pardir))
+    from core.series import Series, ScopeSeries, merge
+
+
+class SeriesTestCase(TestCase):
+
+    def setUp(self):
+        self.series_list = [{'metric': 'system.cpu.idle', 'scope': 'env:prod,host:a',
+                             'pointlist': [[1000.0, 1.0], [3000.0, None], [5000.0, 5.0]]},
+                            {'metric': 'system.cpu.idle', 'scope': 'role:db',
+                             'pointlist': [[1000.0, 10.0], [2000.0, 20.0], [6000.0, 60.0]]}]
+
+    def test_from_dd(self):
+        series = Series.from_dd(self.series_list)
+        a, b = series.scopes
+
+        self.assertEqual(a.host, 'a')
+        self.assertEqual(b.host, '*')
+        self.assertEqual(len(series), 6)
+
+        assert_array_equal(a.times, [1000, 3000, 5000])
+        self.assertEqual(a.times.dtype, np.int64)
+        self.assertTrue(np.isnan(a.values[1]))
+        assert_array_equal(a.filled_values(), [1., 0., 5.])
+
+    def test_from_dd_unsorted(self):
+        s = ScopeSeries.from_dd({'metric': 'm', 'scope': 'host:a', 'pointlist': [[2000.0, 2.0], [1000.0, 1.0]]})
+        assert_array_equal(s.times, [1000, 2000])
+        assert_array_equal(s.values, [1., 2.])
+
+        s = ScopeSeries.from_dd({'metric': 'm', 'scope': 'host:a', 'pointlist': []})
+        self.assertEqual(len(s), 0)
+
+    def test_after(self):
+        s = Series.from_dd(self.series_list).scopes[0].after(3000)
+        assert_array_equal(s.times, [5000])
+        self.assertEqual(s.host, 'a')
+
+    def test_to_dicts(self):
+        # same as the points sorted by time
+        expected = []
+        for d in self.series_list:
+            expected += [{'src_metric': d['metric'], 'scope': d['scope'], 'host': 'a' if 'host' in d['scope'] else '*',
+                          'time': int(p[0]), 'raw_value': p[1]} for p in d['pointlist']]
+        expected = sorted(expected, key=lambda d: d['time'])
+
+        self.assertListEqual(Series.from_dd(self.series_list).to_dicts(), expected)
+
+    def test_values(self):
+        assert_array_equal(Series.from_dd(self.series_list).values(), [1., 10., 20., 0., 5., 60.])
+
+    def test_scope_values(self):
+        series = Series.from_dd(self.series_list + [{'metric': 'system.cpu.user', 'scope': 'role:db',
+                                                     'pointlist': [[3000.0, 30.0]]}])
+
+        # series of the same scope are merged in chronological order
+        values = series.scope_values()
+        self.assertListEqual(list(values.keys()), ['env:prod,host:a', 'role:db'])
+        assert_array_equal(values['env:prod,host:a'], [1., 0., 5.])
+        assert_array_equal(values['role:db'], [10., 20., 30., 60.])
+
+    def test_merge(self):
+        merged = list(merge([np.array([1, 3, 3]), np.array([], dtype=np.int64), np.array([0, 3])]))
+        self.assertListEqual(merged, [(0, 2, 0), (1, 0, 0), (3, 0, 1), (3, 0, 2), (3, 2, 1)])
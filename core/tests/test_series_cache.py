@@ -0,0 +1,149 @@
+from unittest import TestCase
+
+import os
+import re
+import sys
+import shutil
+import tempfile
+import numpy as np
+from numpy.testing import assert_array_equal
+
+try:
+    from core.series import Series
+    from core.series_cache import SeriesCache, save_segment, load_segment, rollup_interval, pin_rollup
+except ImportError:
+    sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir), os.pardir))
+    from core.series import Series
+    from core.series_cache import SeriesCache, save_segment, load_segment, rollup_interval, pin_rollup
+
+
+class LocalDatadogClient:
+
+    """Serve points for two hosts instead of Datadog, every 10 seconds or `.rollup()` interval of a query."""
+
+    def __init__(self):
+        self.calls = []
+        self.queries = []
+
+    def get_series(self, start, end, query):
+        self.calls.append((start, end))
+        self.queries.append(query)
+        m = re.search(r'\.rollup\(\w+, (\d+)\)', query)
+        step = int(m.group(1)) if m is not None else 10
+        t = np.arange(-(-start // step) * step, end + 1, step)
+        return Series.from_dd([{'metric': query, 'scope': 'host:%s' % h,
+                                'pointlist': [[float(ti * 1000), float(ti + i)] for ti in t]}
+                               for i, h in enumerate(['a', 'b'])])
+
+
+class SeriesCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.dd = LocalDatadogClient()
+        self.query = 'system.cpu.idle{*}by{host}'
+
+        # all ranges are old enough to be cached
+        self.cache = SeriesCache(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def assertSeriesEqual(self, a, b):
+        self.assertListEqual([(s.metric, s.scope) for s in a], [(s.metric, s.scope) for s in b])
+        for s, t in zip(a, b):
+            assert_array_equal(s.times, t.times)
+            assert_array_equal(s.values, t.values)
+
+    def test_segment(self):
+        series = self.dd.get_series(1000, 2000, self.query)
+        save_segment(os.path.join(self.path, 'x.seg'), series)
+        self.assertSeriesEqual(load_segment(os.path.join(self.path, 'x.seg')), series)
+
+    def test_gaps(self):
+        self.cache.get_series(self.dd, 1000, 2000, self.query)
+        self.cache.get_series(self.dd, 3000, 4000, self.query)
+        self.assertListEqual(self.dd.calls, [(1000, 2000), (3000, 4000)])
+
+        # only the gaps are fetched, and the result is the same as fetching all at once
+        series = self.cache.get_series(self.dd, 500, 5000, self.query)
+        self.assertListEqual(self.dd.calls[2:], [(500, 999), (2001, 2999), (4001, 5000)])
+        self.assertSeriesEqual(series, LocalDatadogClient().get_series(500, 5000, self.query + '.rollup(avg, 20)'))
+
+        # fully cached
+        series = self.cache.get_series(self.dd, 1500, 4500, self.query)
+        self.assertEqual(len(self.dd.calls), 5)
+        self.assertSeriesEqual(series, LocalDatadogClient().get_series(1500, 4500, self.query + '.rollup(avg, 20)'))
+
+        self.assertEqual(self.cache.stats['misses'], 5)
+        self.assertEqual(self.cache.stats['hits'], 2 + 4)
+
+    def test_shared(self):
+        self.cache.get_series(self.dd, 1000, 2000, self.query)
+
+        # another process reads the same directory
+        cache = SeriesCache(self.path)
+        cache.get_series(self.dd, 1000, 2000, self.query)
+        self.assertEqual(len(self.dd.calls), 1)
+        self.assertEqual(cache.stats['hits'], 1)
+
+    def test_recent(self):
+        import time
+        end = int(time.time())
+        self.cache.get_series(self.dd, end - 1000, end, self.query)
+        self.cache.get_series(self.dd, end - 1000, end, self.query)
+
+        # the latest points are fetched again
+        self.assertEqual(self.dd.calls[1][0], self.dd.calls[0][1] - self.cache.settle + 1)
+
+    def test_evict(self):
+        self.cache.get_series(self.dd, 1000, 2000, self.query)
+        self.cache.max_bytes = self.cache.nbytes
+
+        self.cache.get_series(self.dd, 3000, 4000, self.query)
+        self.assertEqual(self.cache.stats['evicted'], 1)
+        self.assertLessEqual(self.cache.nbytes, self.cache.max_bytes)
+        self.assertEqual(len([f for f in os.listdir(self.path) if f.endswith('.seg')]), 1)
+
+        # evicted range is fetched again
+        self.cache.get_series(self.dd, 1000, 2000, self.query)
+        self.assertEqual(self.dd.calls[-1], (1000, 2000))
+
+    def test_resolution(self):
+        self.cache.get_series(self.dd, 1000, 2000, self.query)
+        self.assertEqual(self.dd.queries[0], self.query + '.rollup(avg, 20)')
+
+        # a longer range has a coarser resolution, and cached segments of a finer one are not mixed
+        series = self.cache.get_series(self.dd, 0, 100000, self.query)
+        self.assertListEqual(self.dd.calls[1:], [(0, 100000)])
+        self.assertEqual(self.dd.queries[1], self.query + '.rollup(avg, 600)')
+        self.assertSeriesEqual(series, LocalDatadogClient().get_series(0, 100000, self.query + '.rollup(avg, 600)'))
+
+        # both of them are cached
+        self.cache.get_series(self.dd, 1000, 2000, self.query)
+        self.cache.get_series(self.dd, 0, 100000, self.query)
+        self.assertEqual(len(self.dd.calls), 2)
+
+    def test_not_pinned(self):
+        # an arithmetic of queries cannot be pinned to an interval
+        query = 'system.cpu.user{*} + system.cpu.system{*}'
+        self.cache.get_series(self.dd, 1000, 2000, query)
+        self.cache.get_series(self.dd, 1000, 2000, query)
+        self.assertListEqual(self.dd.queries, [query, query])
+        self.assertEqual(self.cache.nbytes, 0)
+
+    def test_pin_rollup(self):
+        self.assertEqual(rollup_interval(3600), 20)
+        self.assertEqual(rollup_interval(86400), 300)
+        self.assertEqual(rollup_interval(7 * 86400), 3600)
+
+        self.assertEqual(pin_rollup('avg:system.load.1{*}by{host}', 60), 'avg:system.load.1{*}by{host}.rollup(avg, 60)')
+        self.assertEqual(pin_rollup('sum:requests{*}.as_count()', 60), 'sum:requests{*}.as_count().rollup(sum, 60)')
+        self.assertEqual(pin_rollup('max:system.load.1{*}.rollup(max)', 60), 'max:system.load.1{*}.rollup(max, 60)')
+
+        # an explicit interval is kept
+        self.assertEqual(pin_rollup('system.load.1{*}.rollup(max, 30)', 60), 'system.load.1{*}.rollup(max, 30)')
+
+        self.assertIsNone(pin_rollup('system.load.1{*}, system.load.5{*}', 60))
+        self.assertIsNone(pin_rollup('top(avg:system.load.1{*}by{host}, 10, "mean", "desc")', 60))
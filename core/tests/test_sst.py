@@ -0,0 +1,144 @@
+from unittest import TestCase
+
+import os
+import sys
+
+import numpy as np
+from numpy.testing import assert_almost_equal, assert_array_equal
+
+try:
+    from core.sst.sst import SingularSpectrumTransformation
+except ImportError:
+    sys.path.append(os.path.join(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 os.pardir), os.pardir))
+    from core.sst.sst import SingularSpectrumTransformation
+
+from core.sst.utils import trajectory_matrices, lanczos, lanczos_tridiag, tridiag_eigh, tridiag_qr, is_diag
+
+
+class SingularSpectrumTransformationTest(TestCase):
+
+    def setUp(self):
+        # frequency of the sine wave changes at the middle
+        t = np.arange(200)
+        self.xs = np.concatenate((np.sin(t / 5), 2 * np.sin(t / 2))) + np.random.normal(scale=0.1, size=400)
+
+    def sst(self, w, q=None):
+        sst = SingularSpectrumTransformation(w, 3)
+        if q is not None:
+            sst.q = q.copy()
+        return sst
+
+    def score_all(self, sst, xs, is_lanczos):
+        """Slice windows by hand for each t, as the docstring of `score` does."""
+        scores = np.full(xs.size, np.nan)
+        for t in range(sst.n_past + 1, xs.size - sst.g - sst.n_current + 1):
+            xs_past = xs[(t - sst.n_past - 1):(t - 1)]
+            xs_current = xs[(t + sst.g):(t + sst.g + sst.n_current)]
+            scores[t] = sst.score(xs_past, xs_current, is_lanczos)
+        return scores
+
+    def test_score_series(self):
+        sst = self.sst(10)
+
+        expected = self.score_all(self.sst(10), self.xs, False)
+        assert_array_equal(expected, sst.score_series(self.xs, is_lanczos=False))
+
+        expected = self.score_all(self.sst(10, sst.q), self.xs, True)
+        assert_almost_equal(expected, sst.score_series(self.xs, is_lanczos=True))
+
+        # first scorable point, and the last one
+        scores = sst.score_series(self.xs)
+        self.assertTrue(np.all(np.isnan(scores[:(sst.n_past + 1)])))
+        self.assertFalse(np.isnan(scores[self.xs.size - sst.w]))
+        self.assertTrue(np.all(np.isnan(scores[(self.xs.size - sst.w + 1):])))
+
+    def test_short_series(self):
+        sst = self.sst(10)
+        self.assertTrue(np.all(np.isnan(sst.score_series(self.xs[:(sst.span - 1)]))))
+        self.assertEqual(np.sum(~np.isnan(sst.score_series(self.xs[:sst.span]))), 1)
+
+    def test_update(self):
+        for is_lanczos in [True, False]:
+            sst = self.sst(10)
+            expected = self.sst(10, sst.q).score_series(self.xs, is_lanczos)
+
+            scores = np.array([sst.update(x, is_lanczos) for x in self.xs])
+
+            # score of a point is available w - 1 steps later
+            assert_array_equal(expected[:(1 - sst.w)], scores[(sst.w - 1):])
+
+    def test_score_batch(self):
+        sst = self.sst(10)
+        X = np.vstack((self.xs, self.xs[::-1], np.cumsum(self.xs)))
+
+        expected = np.array([sst.score_series(x, is_lanczos=False) for x in X])
+
+        for chunk_size in [1, 7, 1024]:
+            assert_array_equal(expected, sst.score_batch(X, chunk_size))
+
+        assert_array_equal(expected[0], sst.score_batch(X[0], 100))
+        self.assertEqual(sst.score_batch(X[:, :5]).shape, (3, 5))
+
+    def test_trajectory_matrices(self):
+        x = np.arange(10.0)
+        H = trajectory_matrices(x, 3, 2)
+
+        self.assertEqual(H.shape, (7, 3, 2))
+        assert_array_equal(H[4], np.array([[4, 5], [5, 6], [6, 7]]))
+        assert_array_equal(trajectory_matrices(np.vstack((x, -x)), 3, 2)[1, 4], -H[4])
+
+
+class SingularSpectrumTransformationUtilsTest(TestCase):
+
+    def setUp(self):
+        self.alpha = np.random.normal(size=6)
+        self.beta = np.random.normal(size=5)
+        self.T = np.diag(self.alpha) + np.diag(self.beta, 1) + np.diag(self.beta, -1)
+
+    def test_lanczos_tridiag(self):
+        A = np.random.normal(size=(10, 10))
+        C = np.dot(A, A.T)
+        q = np.random.normal(size=10)
+        q /= np.linalg.norm(q)
+
+        alpha, beta = lanczos_tridiag(C, q, 4)
+        assert_array_equal(np.diag(alpha) + np.diag(beta, 1) + np.diag(beta, -1), lanczos(C, q, 4))
+
+        # matrix-free
+        assert_almost_equal(lanczos(C, q, 4), lanczos(lambda x: np.dot(A, np.dot(A.T, x)), q, 4))
+
+    def test_tridiag_eigh(self):
+        eigvals, eigvecs = np.linalg.eigh(self.T)
+
+        d, z = tridiag_eigh(self.alpha, self.beta)
+        order = np.argsort(d)
+
+        assert_almost_equal(eigvals, d[order])
+        assert_almost_equal(np.abs(eigvecs[0]), np.abs(z[order]))
+
+        # already diagonal
+        d, z = tridiag_eigh(np.array([3.0, 1.0, 2.0]), np.zeros(2))
+        assert_array_equal(d, [3.0, 1.0, 2.0])
+        assert_array_equal(z, [1.0, 0.0, 0.0])
+
+    def test_tridiag_eigh_not_converged(self):
+        eigvals, eigvecs = np.linalg.eigh(self.T)
+
+        with self.assertLogs('ChangeFinder', 'WARNING'):
+            d, z = tridiag_eigh(self.alpha, self.beta, max_iter=1)
+
+        assert_almost_equal(eigvals, d)
+        assert_almost_equal(np.abs(eigvecs[0]), np.abs(z))
+
+    def test_tridiag_qr(self):
+        T = self.T.copy()
+        Q, R = tridiag_qr(T)
+
+        assert_almost_equal(self.T, np.dot(Q, R))
+        assert_almost_equal(np.zeros((6, 6)), np.tril(R, -1))
+        assert_array_equal(self.T, T)
+
+    def test_is_diag(self):
+        self.assertTrue(is_diag(np.diag(self.alpha), 1e-3))
+        self.assertFalse(is_diag(np.array([[1.0, -1.0], [-1.0, 1.0]]), 1e-3))
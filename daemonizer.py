@@ -6,16 +6,22 @@ from daemon import runner
 from logging import getLogger, FileHandler, Formatter, INFO
 
 from core.base_detector import Detector
+from core.scheduler import Scheduler
 from core.slack_client import SlackClient
 
+logger = getLogger('ChangeFinder')
+
 
 class ChangeFinderDaemon(Detector):
 
     def __init__(self, inifile_path, pidfile_path):
-        super().__init__('changefinder', inifile_path)
-
         parser = configparser.ConfigParser()
-        parser.read(self.inifile_path)
+        parser.read(inifile_path)
+
+        # snapshot of models which are restored on restart
+        self.checkpoint_interval = int(parser['general'].get('checkpoint_interval', 3600))
+        super().__init__('changefinder', inifile_path, parser['general'].get('checkpoint_path'))
+
         self.stdin_path = '/dev/null'
         self.stdout_path = '/dev/null'
         self.stderr_path = '/dev/null'
@@ -33,12 +39,37 @@ class ChangeFinderDaemon(Detector):
             self.is_available_slack = False
 
     def run(self):
-        end = int(time.time())
-        start = end - self.dd_api_interval
-
-        n_api_per_hour = len(self.dd_sections) * (3600 / self.dd_api_interval)
+        # the daemon is stopped by SIGTERM (i.e. SystemExit); records waiting for emission are flushed or spilled
+        try:
+            self.__run()
+        finally:
+            logger.info('Flushing records waiting for emission')
+            self.close()
+
+    def __run(self):
+        now = time.time()
+        scheduler = Scheduler(self.dd_api_interval, self.dd_api_limit, now)
+
+        t = scheduler.next_tick(now)
+        start = t - self.dd_api_interval + 1
+
+        # resume from the oldest point handled before restart (at most 1 hour ago);
+        # already handled points of each scope are skipped
+        last_times = [lt for lt in self.models.last_times.values() if lt is not None]
+        if len(last_times) > 0:
+            start = max(int(min(last_times) / 1000) + 1, t - 3600 + 1)
+
+        last_checkpoint = time.time()
+
+        # queries of sections are coalesced into fewer API calls; sections exceeding the limit are deferred
+        intervals = {}
+        for section_name in self.dd_sections.keys():
+            intervals.setdefault(self.__section_interval(section_name), []).append(section_name)
+        n_api_per_hour = sum(self.n_api_calls(section_names) * 3600 / interval
+                             for interval, section_names in intervals.items())
         if n_api_per_hour > self.dd_api_limit:
-            msg = 'Current configuration exceeds API rate limit. Try to reduce the number of queries or use longer interval.'
+            msg = 'Current configuration exceeds API rate limit (%d calls per hour). Low-priority sections will be deferred. ' \
+                  'Try to reduce the number of queries or use longer interval.' % n_api_per_hour
 
             logger.warning(msg)
             if self.is_available_slack:
@@ -46,16 +77,23 @@ class ChangeFinderDaemon(Detector):
 
         while True:
             try:
-                # incorporate new queries which were inserted during the interval
-                self.load_dd_config()
-                logger.info('Monitoring %d metrics' % len(self.dd_sections))
-
-                self.query(start, end)
-
-                start = end + 1
-                end = int(time.time())
-
-                time.sleep(self.dd_api_interval)
+                # wait for the next tick boundary; ticks missed by a long cycle are skipped
+                now = time.time()
+                if t <= now - self.dd_api_interval:
+                    logger.warning('Skipped %d ticks since the previous cycle took too long' %
+                                   ((now - t) // self.dd_api_interval))
+                    t = scheduler.next_tick(now) - self.dd_api_interval
+                time.sleep(max(0, t - time.time()))
+
+                self.cycle(scheduler, t, start)
+
+                if self.checkpoint_path is not None and time.time() - last_checkpoint >= self.checkpoint_interval:
+                    self.save_checkpoint()
+                    last_checkpoint = time.time()
+
+                # new sections start from the current tick
+                start = t + 1
+                t += self.dd_api_interval
             except Exception as err:
                 logger.error(err)
 
@@ -67,8 +105,42 @@ class ChangeFinderDaemon(Detector):
                 # 1h idling
                 time.sleep(3600)
 
-                end = int(time.time())
-                start = end - self.dd_api_interval
+                t = scheduler.next_tick(time.time())
+                start = t - self.dd_api_interval + 1
+
+    def cycle(self, scheduler, t, start):
+        """Query sections which are due at a tick.
+
+        Args:
+            scheduler (Scheduler): Scheduler of the daemon.
+            t (int): Tick boundary (i.e. end of query ranges).
+            start (int): Start of the query range of new sections.
+
+        """
+        # incorporate new queries which were inserted during the interval
+        self.load_dd_config()
+        logger.info('Monitoring %d metrics' % len(self.dd_sections))
+
+        scheduler.update_sections({section_name: {'interval': self.__section_interval(section_name),
+                                                  'priority': section['config'].get('priority')}
+                                   for section_name, section in self.dd_sections.items()
+                                   if self.is_ready(section_name)}, start)
+
+        for range_start, range_end, section_names in scheduler.plan(t, self.n_api_calls):
+            failed = self.query(range_start, range_end, section_names=section_names)
+            scheduler.done(section_names, range_end, failed)
+            scheduler.spend(self.n_api_used)
+
+            if len(failed) > 0 and self.is_available_slack:
+                self.slack.send_warning('Failed to handle %d sections: %s' % (len(failed), ', '.join(failed)))
+
+        scheduler.report()
+
+    def __section_interval(self, section_name):
+        """Return the query interval of a section (default: `interval` of the general section).
+
+        """
+        return int(self.dd_sections[section_name]['config'].get('interval') or self.dd_api_interval)
 
 
 if __name__ == '__main__':